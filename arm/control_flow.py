@@ -31,13 +31,21 @@ from reil.utilities import *
 import reil.arm.operand as operand
 
 
+def branch_target(ctx, i):
+    if operand.is_immediate(ctx, i, 0):
+        # relative branch, capstone has already computed the target
+        return ctx.address_imm(i, i.operands[0].imm, ctx.word_size)
+
+    return operand.get(ctx, i, 0)
+
+
 def arm_b(ctx, i):
-    target = operand.get(ctx, i, 0)
+    target = branch_target(ctx, i)
     ctx.emit(  jcc_  (imm(1, 8), target))
 
 
 def arm_blx(ctx, i):
-    target = operand.get(ctx, i, 0)
+    target = branch_target(ctx, i)
 
     pc = operand.get_register(ctx, i, 'pc')
     if ctx.thumb:
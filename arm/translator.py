@@ -22,9 +22,12 @@ IL from ARMv7/Thumbv2 machine code.
 
 
 import capstone
+import functools
 
 import reil.native as native
+from reil.context import TranslationContext
 from reil.shorthand import *
+from reil.utilities import *
 
 import reil.arm.arithmetic as arithmetic
 import reil.arm.control_flow as control_flow
@@ -45,55 +48,6 @@ opcode_handlers = {
   capstone.arm.ARM_INS_SUB:  arithmetic.arm_sub,
 }
 
-def process_labels(ris):
-    labels = dict()
-    i = 0
-
-    # we are modifying ris, hence the nasty loop
-    while i < len(ris):
-        ri = ris[i]
-        if isinstance(ri, str):
-            # this is a label, remove
-            labels[ri] = i
-            ris = ris[:i] + ris[i+1:]
-        else:
-            i += 1
-
-    for ri in ris:
-        if isinstance(ri.output, str):
-            # this is a label, replace with offset
-            ri.output = off(labels[ri.output])
-
-    return ris
-
-
-class TranslationContext(object):
-
-    def __init__(self):
-        self.temporary_index = 0
-        self.reil_instructions = []
-
-
-    def tmp(self, size):
-        output = t(self.temporary_index, size)
-        self.temporary_index += 1
-        return output
-
-
-    def emit(self, instruction):
-        self.reil_instructions.append(instruction)
-
-
-    def finalise(self):
-        ris = self.reil_instructions
-
-        # reset the context ready for the next instruction
-        self.temporary_index = 0
-        self.reil_instructions = []
-
-        return process_labels(ris)
-
-
 def print_instruction(i):
     print('{:x}: {}  {}'.format(i.address, i.mnemonic, i.op_str))
 
@@ -107,11 +61,16 @@ def unknown_opcode(ctx, i):
 
 
 def _translate(ctx, i):
-    if i.id in opcode_handlers:
-        opcode_handlers[i.id](ctx, i)
-    else:
-        print_instruction(i)
-        unknown_opcode(ctx, i)
+    try:
+        if i.id in opcode_handlers:
+            opcode_handlers[i.id](ctx, i)
+        else:
+            print_instruction(i)
+            unknown_opcode(ctx, i)
+    except Exception:
+        # contexts are reused, so never leave a partial translation behind
+        ctx.reset()
+        raise
 
     return ctx.finalise()
 
@@ -128,6 +87,16 @@ def ends_basic_block(i):
     return False
 
 
+_block_ends = dict()
+
+
+def _branch_target(i):
+    if i.operands and i.operands[0].type == capstone.arm.ARM_OP_IMM:
+        return i.operands[0].imm
+
+    return None
+
+
 class ArmTranslationContext(TranslationContext):
 
     def __init__(self):
@@ -158,6 +127,7 @@ class ArmTranslationContext(TranslationContext):
         self.program_ctr = self.registers[capstone.arm.ARM_REG_R15]
         self.disassembler = capstone.Cs(capstone.CS_ARCH_ARM, capstone.CS_MODE_ARM)
         self.disassembler.detail = True
+        self.scanner = capstone.Cs(capstone.CS_ARCH_ARM, capstone.CS_MODE_ARM)
 
 
 class ThumbTranslationContext(TranslationContext):
@@ -190,25 +160,69 @@ class ThumbTranslationContext(TranslationContext):
         self.program_ctr = self.registers[capstone.arm.ARM_REG_R15]
         self.disassembler = capstone.Cs(capstone.CS_ARCH_ARM, capstone.CS_MODE_THUMB)
         self.disassembler.detail = True
+        self.scanner = capstone.Cs(capstone.CS_ARCH_ARM, capstone.CS_MODE_THUMB)
+
+
+def _new_context(thumb):
+    if thumb:
+        return ThumbTranslationContext()
+    else:
+        return ArmTranslationContext()
+
+
+_contexts = ContextPool(_new_context)
+
+
+def _context(thumb):
+    return _contexts.get(bool(thumb))
 
 
-def translate(code_bytes, base_address, thumb=False):
-    done = False
+def _mode_context(thumb, relocatable):
+    ctx = _context(thumb)
+    ctx.relocatable = relocatable
 
+    return ctx
+
+
+def translate(code_bytes, base_address, thumb=False, cache=None,
+              relocatable=False, lazy=False):
+    if cache is not None:
+        # the cache holds translated IL, so there is nothing to defer
+        if lazy:
+            raise ValueError('A cache can\'t be used with lazy=True')
+
+        return cache.translate(
+            'arm', thumb, code_bytes, base_address,
+            lambda relocatable: translate(
+                code_bytes, base_address, thumb, relocatable=relocatable))
+
+    context = functools.partial(_mode_context, thumb, relocatable)
+
+    if lazy:
+        return translate_block_lazy(
+            context, _translate, ends_basic_block, code_bytes, base_address)
+
+    return translate_block(
+        context, _translate, ends_basic_block, code_bytes, base_address)
+
+
+def translate_range(code_bytes, base_address, thumb=False, relocatable=False):
     if thumb:
-        ctx = ThumbTranslationContext()
+        skip = 2
     else:
-        ctx = ArmTranslationContext()
+        skip = 4
 
-    for i in ctx.disassembler.disasm(code_bytes, base_address):
+    return translate_blocks(
+        functools.partial(_mode_context, thumb, relocatable), _translate,
+        ends_basic_block, code_bytes, base_address, skip)
 
-        if done:
-            raise StopIteration()
 
-        mnemonic = '{} {}'.format(i.mnemonic, i.op_str)
-        yield native.Instruction(
-            i.address, mnemonic, _translate(ctx, i),
-            ends_basic_block(i), i.size)
+def scan(code_bytes, base_address, thumb=False):
+    if thumb:
+        skip = 2
+    else:
+        skip = 4
 
-        if ends_basic_block(i):
-            done = True
+    return scan_range(
+        _context(thumb), code_bytes, base_address, skip,
+        ends_basic_block, _branch_target, _block_ends)
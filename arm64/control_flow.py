@@ -23,6 +23,8 @@ This file is responsible for translation of basic control flow instructions
 such as b, bl.
 """
 
+import capstone
+
 import reil.error
 from reil import *
 from reil.shorthand import *
@@ -31,7 +33,15 @@ from reil.utilities import *
 import reil.arm64.conditional as conditional
 import reil.arm64.operand as operand
 
+def branch_target(ctx, i):
+    if i.operands[0].type == capstone.arm64.ARM64_OP_IMM:
+        # relative branch, capstone has already computed the target
+        return ctx.address_imm(i, i.operands[0].imm, ctx.word_size)
+
+    return operand.get(ctx, i, 0)
+
+
 def arm64_b(ctx, i):
-    a = operand.get(ctx, i, 0)
+    a = branch_target(ctx, i)
     cond = conditional.condition(ctx, i.cc)
     ctx.emit(  jcc_  (cond, a))
@@ -22,9 +22,12 @@ IL from ARMv8 machine code.
 
 
 import capstone
+import functools
 
 import reil.native as native
+from reil.context import TranslationContext
 from reil.shorthand import *
+from reil.utilities import *
 
 import reil.arm64.arithmetic as arithmetic
 import reil.arm64.control_flow as control_flow
@@ -41,55 +44,6 @@ opcode_handlers = {
   capstone.arm64.ARM64_INS_STR:  memory.arm64_mov,
 }
 
-def process_labels(ris):
-    labels = dict()
-    i = 0
-
-    # we are modifying ris, hence the nasty loop
-    while i < len(ris):
-        ri = ris[i]
-        if isinstance(ri, str):
-            # this is a label, remove
-            labels[ri] = i
-            ris = ris[:i] + ris[i+1:]
-        else:
-            i += 1
-
-    for ri in ris:
-        if isinstance(ri.output, str):
-            # this is a label, replace with offset
-            ri.output = off(labels[ri.output])
-
-    return ris
-
-
-class TranslationContext(object):
-
-    def __init__(self):
-        self.temporary_index = 0
-        self.reil_instructions = []
-
-
-    def tmp(self, size):
-        output = t(self.temporary_index, size)
-        self.temporary_index += 1
-        return output
-
-
-    def emit(self, instruction):
-        self.reil_instructions.append(instruction)
-
-
-    def finalise(self):
-        ris = self.reil_instructions
-
-        # reset the context ready for the next instruction
-        self.temporary_index = 0
-        self.reil_instructions = []
-
-        return process_labels(ris)
-
-
 def print_instruction(i):
     print('{:x}: {}  {}'.format(i.address, i.mnemonic, i.op_str))
 
@@ -103,11 +57,16 @@ def unknown_opcode(ctx, i):
 
 
 def _translate(ctx, i):
-    if i.id in opcode_handlers:
-        opcode_handlers[i.id](ctx, i)
-    else:
-        print_instruction(i)
-        unknown_opcode(ctx, i)
+    try:
+        if i.id in opcode_handlers:
+            opcode_handlers[i.id](ctx, i)
+        else:
+            print_instruction(i)
+            unknown_opcode(ctx, i)
+    except Exception:
+        # contexts are reused, so never leave a partial translation behind
+        ctx.reset()
+        raise
 
     return ctx.finalise()
 
@@ -124,6 +83,16 @@ def ends_basic_block(i):
     return False
 
 
+_block_ends = dict()
+
+
+def _branch_target(i):
+    if i.operands and i.operands[0].type == capstone.arm64.ARM64_OP_IMM:
+        return i.operands[0].imm
+
+    return None
+
+
 class Arm64TranslationContext(TranslationContext):
 
     def __init__(self):
@@ -171,21 +140,48 @@ class Arm64TranslationContext(TranslationContext):
         self.program_ctr = r('pc', 64)
         self.disassembler = capstone.Cs(capstone.CS_ARCH_ARM64, capstone.CS_MODE_ARM)
         self.disassembler.detail = True
+        self.scanner = capstone.Cs(capstone.CS_ARCH_ARM64, capstone.CS_MODE_ARM)
+
+
+_contexts = ContextPool(Arm64TranslationContext)
+
+
+def _mode_context(relocatable):
+    ctx = _contexts.get()
+    ctx.relocatable = relocatable
+
+    return ctx
+
+
+def translate(code_bytes, base_address, cache=None, relocatable=False,
+              lazy=False):
+    if cache is not None:
+        # the cache holds translated IL, so there is nothing to defer
+        if lazy:
+            raise ValueError('A cache can\'t be used with lazy=True')
+
+        return cache.translate(
+            'arm64', None, code_bytes, base_address,
+            lambda relocatable: translate(
+                code_bytes, base_address, relocatable=relocatable))
+
+    context = functools.partial(_mode_context, relocatable)
 
+    if lazy:
+        return translate_block_lazy(
+            context, _translate, ends_basic_block, code_bytes, base_address)
 
-def translate(code_bytes, base_address):
-    done = False
-    ctx = Arm64TranslationContext()
+    return translate_block(
+        context, _translate, ends_basic_block, code_bytes, base_address)
 
-    for i in ctx.disassembler.disasm(code_bytes, base_address):
 
-        if done:
-            raise StopIteration()
+def translate_range(code_bytes, base_address, relocatable=False):
+    return translate_blocks(
+        functools.partial(_mode_context, relocatable), _translate,
+        ends_basic_block, code_bytes, base_address, 4)
 
-        mnemonic = '{} {}'.format(i.mnemonic, i.op_str)
-        yield native.Instruction(
-            i.address, mnemonic, _translate(ctx, i),
-            ends_basic_block(i), i.size)
 
-        if ends_basic_block(i):
-            done = True
+def scan(code_bytes, base_address):
+    return scan_range(
+        _contexts.get(), code_bytes, base_address, 4,
+        ends_basic_block, _branch_target, _block_ends)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.cache
+
+This module contains an opt-in cache for the output of the translators,
+so that repeatedly translating the same code bytes only runs the opcode
+handlers once.
+
+The cache is passed to the translate function of a translator:
+
+    cache = reil.cache.TranslationCache(size=8192)
+    for ni in reil.x86.translator.translate(code, address, cache=cache):
+        ...
+
+The translators raise ValueError if a cache is passed with lazy=True,
+since a cached block has already been translated.
+
+Entries are looked up by address, or for a relocatable cache by the
+first few code bytes, and each entry keeps only the bytes that its block
+consumed, which are checked against the code bytes on every lookup. A
+relocatable cache is therefore independent of the address. Blocks are
+translated once in relocatable mode, which marks every immediate derived
+from the instruction address with a RelocationOperand, and those
+operands are patched for the address that is requested on each lookup.
+"""
+
+import collections
+
+import reil.definitions as definitions
+import reil.native as native
+from reil.shorthand import imm
+from reil.utilities import *
+
+
+# the longest instruction on any of the architectures, so that the first
+# instruction of a block is always part of the key.
+_key_length = 16
+
+
+def _copy_operand(operand, address):
+    # operands are immutable, so everything but a relocation can be shared
+    if isinstance(operand, definitions.RelocationOperand):
+        return imm((address + operand.delta) & mask(operand.size), operand.size)
+
+    return operand
+
+
+def _copy_il_instruction(ri, address):
+    return definitions.Instruction(
+        ri.opcode,
+        _copy_operand(ri.input0, address),
+        _copy_operand(ri.input1, address),
+        _copy_operand(ri.output, address))
+
+
+def _mnemonic_fixup(ni):
+    # the only address that is printed in the mnemonic is the target of a
+    # relative branch, so find that and split the mnemonic around it.
+    for ri in ni.il_instructions:
+        target = ri.output
+        if (ri.opcode != definitions.JCC or
+            not isinstance(target, definitions.RelocationOperand)):
+            continue
+
+        head, text, tail = ni.mnemonic.rpartition('0x{:x}'.format(target.value))
+        if text and not tail[:1].isalnum():
+            return (head, target.delta, target.size, tail)
+
+    return None
+
+
+class _Entry(object):
+
+    __slots__ = ['base_address', 'instructions', 'fixups', 'code', 'ended']
+
+    def __init__(self, base_address, instructions, code_bytes):
+        self.base_address = base_address
+        self.instructions = tuple(instructions)
+        self.fixups = tuple(_mnemonic_fixup(ni) for ni in self.instructions)
+
+        length = sum(ni.size for ni in self.instructions)
+        self.code = bytes(code_bytes[:length])
+
+        # a block that doesn't end with a branch stopped because the code
+        # bytes ran out or could not be decoded, so it depends on more than
+        # just the bytes that it consumed.
+        self.ended = (len(self.instructions) > 0 and
+                      self.instructions[-1].ends_basic_block)
+
+
+    def matches(self, code_bytes):
+        length = len(self.code)
+        if not self.ended and len(code_bytes) != length:
+            return False
+
+        return bytes(code_bytes[:length]) == self.code
+
+
+    def instantiate(self, base_address):
+        offset = base_address - self.base_address
+
+        output = []
+        for ni, fixup in zip(self.instructions, self.fixups):
+            address = ni.address + offset
+
+            mnemonic = ni.mnemonic
+            if offset != 0 and fixup is not None:
+                head, delta, size, tail = fixup
+                target = (address + delta) & mask(size)
+                mnemonic = '{}0x{:x}{}'.format(head, target, tail)
+
+            output.append(native.Instruction(
+                address,
+                mnemonic,
+                [_copy_il_instruction(ri, address) for ri in ni.il_instructions],
+                ni.ends_basic_block,
+                ni.size))
+
+        return output
+
+
+class TranslationCache(object):
+    """Least-recently-used cache of translated basic blocks.
+
+    Entries are keyed on the architecture, the translation mode and either
+    the base address of the translation or, if the cache is relocatable,
+    the first code bytes of the block. An entry is only used if the code
+    bytes start with the bytes that its block consumed; otherwise the
+    block is translated again and replaces the entry. The cached native
+    instructions are never handed out directly; every lookup returns a
+    fresh copy, so callers are free to modify the IL they receive.
+
+    Args:
+        size (int, optional): The maximum number of entries to keep. When
+    this is exceeded, the least recently used entry is evicted. If None,
+    the cache is unbounded.
+        relocatable (bool, optional): If True, the same code bytes at a
+    different address share a single entry.
+
+    Attributes:
+        size (int): The maximum number of entries to keep.
+        relocatable (bool): Whether entries are shared between addresses.
+        hits (int): The number of lookups that were found in the cache.
+        misses (int): The number of lookups that required translation.
+        evictions (int): The number of entries evicted to honour size.
+    """
+
+    def __init__(self, size=4096, relocatable=False):
+        self.size = size
+        self.relocatable = relocatable
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+        # the lengths of the code bytes in the keys of a relocatable
+        # cache, longest first; a block can be shorter than _key_length.
+        self._key_lengths = []
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def _evict(self):
+        if self.size is None:
+            return
+
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def resize(self, size):
+        """Change the maximum number of entries, evicting the least
+        recently used entries if the cache is now too large.
+        """
+
+        self.size = size
+        self._evict()
+
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+
+        self._entries.clear()
+        self._key_lengths = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def _key(self, architecture, mode, code, base_address):
+        if not self.relocatable:
+            return (architecture, mode, base_address)
+
+        code = code[:_key_length]
+        if len(code) not in self._key_lengths:
+            self._key_lengths.append(len(code))
+            self._key_lengths.sort(reverse=True)
+
+        return (architecture, mode, code)
+
+
+    def _lookup(self, architecture, mode, code_bytes, base_address):
+        if self.relocatable:
+            keys = [(architecture, mode, bytes(code_bytes[:length]))
+                    for length in self._key_lengths]
+        else:
+            keys = [(architecture, mode, base_address)]
+
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry.matches(code_bytes):
+                return key, entry
+
+        return None, None
+
+
+    def translate(self, architecture, mode, code_bytes, base_address,
+                  translate_fn):
+        """Look up a translation, translating and inserting it on a miss.
+
+        Args:
+            architecture (string): The name of the translator.
+            mode (hashable): Any translator options that affect the IL.
+            code_bytes (bytes): The code bytes to translate.
+            base_address (int): The address of the first code byte.
+            translate_fn (callable): Called on a miss with a flag that
+        selects relocatable mode, to produce the native instructions.
+
+        Returns:
+            A list of native instructions owned by the caller.
+        """
+
+        key, entry = self._lookup(architecture, mode, code_bytes, base_address)
+        if entry is None:
+            self.misses += 1
+            entry = _Entry(
+                base_address, translate_fn(self.relocatable), code_bytes)
+            key = self._key(architecture, mode, entry.code, base_address)
+        else:
+            self.hits += 1
+
+        # (re-)insert as the most recently used entry
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        self._evict()
+
+        return entry.instantiate(base_address)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.compact
+
+This module contains a compact container for translated code, which
+stores the native instructions and their IL in a handful of flat arrays
+rather than as a graph of Python objects.
+
+Each IL instruction has three operand slots (input0, input1, output), so
+the operand columns are three times the length of the opcode column, and
+the operands of IL instruction k are at indices 3k, 3k + 1 and 3k + 2.
+The meaning of an operand value depends on its kind:
+
+    NONE        unused slot, value is 0
+    IMMEDIATE   value is the immediate value
+    REGISTER    value is an index into the names table
+    TEMPORARY   value is the index of the temporary
+    OFFSET      value is the REIL offset
+    CONSTANT    value is an index into the constants table, which holds
+                immediates that don't fit in 64 bits and relocations
+
+If NumPy is available, numpy_columns returns the columns as NumPy arrays
+sharing memory with the container.
+"""
+
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import reil.definitions as definitions
+import reil.native as native
+from reil.shorthand import imm, off, r, t
+
+
+NONE        = 0
+IMMEDIATE   = 1
+REGISTER    = 2
+TEMPORARY   = 3
+OFFSET      = 4
+CONSTANT    = 5
+
+_min_value = -(1 << 63)
+_max_value = (1 << 63) - 1
+
+
+class CompactIL(object):
+    """Struct-of-arrays container for a sequence of native instructions
+    and their IL.
+
+    Attributes:
+        addresses (array): The address of each native instruction.
+        lengths (array): The size in bytes of each native instruction.
+        ends (array): 1 if the native instruction ends a basic block.
+        il_starts (array): The index of the first IL instruction for each
+    native instruction, followed by the total number of IL instructions.
+        mnemonics (list): The mnemonic of each native instruction.
+        opcodes (array): The opcode of each IL instruction.
+        operand_kinds (array): The kind of each operand.
+        operand_sizes (array): The size in bits of each operand.
+        operand_values (array): The value of each operand.
+        names (list): The register names referenced by operand_values.
+        constants (list): The operands referenced by operand_values.
+    """
+
+    __slots__ = ['addresses', 'lengths', 'ends', 'il_starts', 'mnemonics',
+                 'opcodes', 'operand_kinds', 'operand_sizes',
+                 'operand_values', 'names', 'constants', '_name_index',
+                 '_constant_index']
+
+
+    def __init__(self, instructions=None):
+        self.addresses = array.array('Q')
+        self.lengths = array.array('B')
+        self.ends = array.array('B')
+        self.il_starts = array.array('I', [0])
+        self.mnemonics = []
+
+        self.opcodes = array.array('B')
+        self.operand_kinds = array.array('B')
+        self.operand_sizes = array.array('H')
+        self.operand_values = array.array('q')
+
+        self.names = []
+        self.constants = []
+        self._name_index = dict()
+        self._constant_index = dict()
+
+        if instructions is not None:
+            self.extend(instructions)
+
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self.instruction(n)
+
+
+    def encode_operand(self, operand):
+        """Return the (kind, value, size) encoding of an operand, adding
+        to the names and constants tables as required.
+        """
+
+        kind = type(operand)
+
+        if operand is None:
+            return (NONE, 0, 0)
+
+        elif (kind is definitions.ImmediateOperand and
+              _min_value <= operand.value <= _max_value):
+            return (IMMEDIATE, operand.value, operand.size)
+
+        elif kind is definitions.TemporaryOperand:
+            return (TEMPORARY, operand.index, operand.size)
+
+        elif kind is definitions.RegisterOperand:
+            index = self._name_index.get(operand.name)
+            if index is None:
+                index = self._name_index[operand.name] = len(self.names)
+                self.names.append(operand.name)
+            return (REGISTER, index, operand.size)
+
+        elif kind is definitions.OffsetOperand:
+            return (OFFSET, operand.offset, operand.size)
+
+        index = self._constant_index.get(operand)
+        if index is None:
+            index = self._constant_index[operand] = len(self.constants)
+            self.constants.append(operand)
+        return (CONSTANT, index, operand.size)
+
+
+    def operand(self, index):
+        """Rebuild the operand at index in the operand columns."""
+
+        kind = self.operand_kinds[index]
+        value = self.operand_values[index]
+
+        if kind == NONE:
+            return None
+
+        elif kind == IMMEDIATE:
+            return imm(value, self.operand_sizes[index])
+
+        elif kind == REGISTER:
+            return r(self.names[value], self.operand_sizes[index])
+
+        elif kind == TEMPORARY:
+            return t(value, self.operand_sizes[index])
+
+        elif kind == OFFSET:
+            return off(value)
+
+        return self.constants[value]
+
+
+    def append(self, ni):
+        """Add a native instruction and its IL to the end of the container.
+
+        Args:
+            ni (reil.native.Instruction): The instruction to add.
+        """
+
+        self.addresses.append(ni.address)
+        self.lengths.append(ni.size)
+        self.ends.append(1 if ni.ends_basic_block else 0)
+        self.mnemonics.append(ni.mnemonic)
+
+        for ri in ni.il_instructions:
+            self.opcodes.append(ri.opcode)
+            for operand in (ri.input0, ri.input1, ri.output):
+                kind, value, size = self.encode_operand(operand)
+                self.operand_kinds.append(kind)
+                self.operand_values.append(value)
+                self.operand_sizes.append(size)
+
+        self.il_starts.append(len(self.opcodes))
+
+
+    def extend(self, instructions):
+        """Add a sequence of native instructions to the container."""
+
+        for ni in instructions:
+            self.append(ni)
+
+
+    def il_range(self, n):
+        """Return the indices (start, end) of the IL instructions for
+        native instruction n.
+        """
+
+        return (self.il_starts[n], self.il_starts[n + 1])
+
+
+    def il_instruction(self, k):
+        """Rebuild IL instruction k as a reil.definitions.Instruction."""
+
+        return definitions.Instruction(
+            self.opcodes[k],
+            self.operand(3 * k),
+            self.operand(3 * k + 1),
+            self.operand(3 * k + 2))
+
+
+    def instruction(self, n):
+        """Rebuild native instruction n as a reil.native.Instruction."""
+
+        start, end = self.il_range(n)
+
+        return native.Instruction(
+            self.addresses[n],
+            self.mnemonics[n],
+            [self.il_instruction(k) for k in range(start, end)],
+            bool(self.ends[n]),
+            self.lengths[n])
+
+
+    def to_instructions(self):
+        """Rebuild every native instruction in the container."""
+
+        return list(self)
+
+
+    def columns(self):
+        """Return memoryviews of the columns, keyed by name.
+        These share memory with the container, so they must not be held
+        across further appends.
+        """
+
+        return dict(
+            (name, memoryview(getattr(self, name)))
+            for name in ['addresses', 'lengths', 'ends', 'il_starts',
+                         'opcodes', 'operand_kinds', 'operand_sizes',
+                         'operand_values'])
+
+
+    def numpy_columns(self):
+        """Return the columns as NumPy arrays, keyed by name. These share
+        memory with the container, so they must not be held across
+        further appends.
+        """
+
+        if numpy is None:
+            raise ImportError('numpy is required for numpy_columns')
+
+        return dict(
+            (name, numpy.frombuffer(view, dtype=view.format))
+            for name, view in self.columns().items())
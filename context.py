@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.context
+
+This module contains the translation context that is shared by the
+translators for each architecture. The context hands out temporary
+registers and collects the IL emitted by the opcode handlers for one
+native instruction.
+
+Handlers can emit a string in place of an instruction to place a label,
+and use a string as the output operand of a jcc to jump to a label; the
+labels are resolved to REIL offsets when the translation is finalised.
+Each label can only be placed once in the IL for a native instruction.
+"""
+
+from reil.definitions import RelocationOperand
+from reil.error import TranslationError
+from reil.shorthand import *
+
+
+class TranslationContext(object):
+
+    def __init__(self):
+        self.temporary_index = 0
+        self.reil_instructions = []
+        self.labels = dict()
+        self.fixups = []
+        self.memory_addresses = dict()
+        self.relocatable = False
+
+
+    def tmp(self, size):
+        output = t(self.temporary_index, size)
+        self.temporary_index += 1
+        return output
+
+
+    def address_imm(self, i, address, size):
+        """Immediate operand for an address computed from the address of
+        the native instruction i. In relocatable mode this is marked so
+        that it can be patched if the IL is reused at another address.
+        """
+
+        if self.relocatable:
+            return RelocationOperand(address, size, address - i.address)
+
+        return imm(address, size)
+
+
+    def emit(self, instruction):
+        if isinstance(instruction, str):
+            # this is a label, and marks the next instruction
+            if instruction in self.labels:
+                raise TranslationError(
+                    'Duplicate label {}'.format(instruction))
+
+            self.labels[instruction] = len(self.reil_instructions)
+            return
+
+        if isinstance(instruction.output, str):
+            # this is a jump to a label, which may not be placed yet
+            self.fixups.append(instruction)
+
+        self.reil_instructions.append(instruction)
+
+
+    def reset(self):
+        self.temporary_index = 0
+        self.reil_instructions = []
+        self.labels = dict()
+        self.fixups = []
+        self.memory_addresses = dict()
+
+
+    def finalise(self):
+        ris = self.reil_instructions
+
+        for ri in self.fixups:
+            ri.output = off(self.labels[ri.output])
+
+        # reset the context ready for the next instruction
+        self.reset()
+
+        return ris
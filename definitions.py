@@ -202,6 +202,134 @@ example the x86 int instruction, this value will be passed as the
 first input operand.
 """
 
+MCPY  = 25
+"""Extended REIL opcode.
+
+Copies a block of memory. The first operand is the address of the
+source, and the third operand is the address of the destination. The
+second operand is the length of the block in bytes, interpreted as a
+signed value of its own size. If it is positive the bytes are copied
+one at a time from the lowest address upwards, and if it is negative
+the block is the same but the bytes are copied from the highest address
+downwards, so that overlapping copies behave exactly as a loop copying
+one byte at a time. Addresses wrap around at the size of the address
+operands. The third operand is not written.
+"""
+
+MSET  = 26
+"""Extended REIL opcode.
+
+Fills a block of memory. The first operand is the value to store, and
+its size is the size of each element of the block. The third operand is
+the address of the block. The second operand is the length of the block
+in bytes, interpreted as a signed value of its own size, and only its
+magnitude matters. The length must be a multiple of the size of the
+value. Addresses wrap around at the size of the third operand. The third
+operand is not written.
+"""
+
+MCMP  = 27
+"""Extended REIL opcode.
+
+Compares two blocks of memory. The first operand holds the addresses of
+both blocks, the first in its low half and the second in its high half.
+The second operand is the length of the blocks in bytes, interpreted as
+a signed value of its own size. If it is positive the bytes are
+compared from the lowest address upwards, and if it is negative from the
+highest address downwards. Addresses wrap around at half the size of
+the first operand. The output operand is set to the number of bytes
+compared before the first pair that differ, or to the length of the
+blocks if they are identical.
+"""
+
+CLZ   = 28
+"""Extended REIL opcode.
+
+Counts the leading zero bits of a value, that is the number of zero
+bits above the most significant set bit. The input operand can be a
+literal or a register value, and its size is the number of bits counted,
+so the result is the size of the input operand if it is zero. The output
+operand is a register.
+"""
+
+CTZ   = 29
+"""Extended REIL opcode.
+
+Counts the trailing zero bits of a value, that is the number of zero
+bits below the least significant set bit. The input operand can be a
+literal or a register value, and the result is the size of the input
+operand if it is zero. The output operand is a register.
+"""
+
+POPCNT = 30
+"""Extended REIL opcode.
+
+Counts the bits that are set in a value. The input operand can be a
+literal or a register value. The output operand is a register.
+"""
+
+VADD  = 31
+"""Extended REIL opcode.
+
+Adds two vectors lane by lane. The first operand holds both vectors,
+the first in its low half and the second in its high half. The second
+operand is a literal giving the width of each lane in bits, which must
+divide half the size of the first operand. Each lane of the result is
+the sum of the corresponding lanes, truncated to the lane width, so no
+carry passes from one lane to the next. The output operand is a
+register of half the size of the first operand.
+"""
+
+VSUB  = 32
+"""Extended REIL opcode.
+
+Subtracts the second vector from the first lane by lane. The operands
+are the same as for VADD, and each lane of the result is truncated to
+the lane width.
+"""
+
+VEQU  = 33
+"""Extended REIL opcode.
+
+Compares two vectors lane by lane. The operands are the same as for
+VADD, and each lane of the result has all of its bits set if the
+corresponding lanes are equal, or is zero if they are not.
+"""
+
+VSGT  = 34
+"""Extended REIL opcode.
+
+Compares two vectors lane by lane, treating each lane as a signed
+value. The operands are the same as for VADD, and each lane of the
+result has all of its bits set if the lane of the first vector is
+greater than the lane of the second, or is zero if it is not.
+"""
+
+VMAXU = 35
+"""Extended REIL opcode.
+
+Takes the larger of each pair of lanes of two vectors, treating each
+lane as an unsigned value. The operands are the same as for VADD.
+"""
+
+VMINU = 36
+"""Extended REIL opcode.
+
+Takes the smaller of each pair of lanes of two vectors, treating each
+lane as an unsigned value. The operands are the same as for VADD.
+"""
+
+VSHUF = 37
+"""Extended REIL opcode.
+
+Rearranges the lanes of a vector. The first operand holds the vector in
+its low half and a vector of lane indices in its high half, and the
+second operand is a literal giving the width of each lane in bits. Each
+lane of the result is the lane of the vector whose index is held in the
+corresponding lane of the indices, taken modulo the number of lanes.
+The output operand is a register of half the size of the first operand.
+"""
+
 _opcode_string_map = [
     'add',
     'and',
@@ -228,6 +356,19 @@ _opcode_string_map = [
     'sdiv',
     'sex',
     'sys',
+    'mcpy',
+    'mset',
+    'mcmp',
+    'clz',
+    'ctz',
+    'popcnt',
+    'vadd',
+    'vsub',
+    'vequ',
+    'vsgt',
+    'vmaxu',
+    'vminu',
+    'vshuf',
 ]
 
 
@@ -244,7 +385,51 @@ def _opcode_to_string(opcode):
     return _opcode_string_map[opcode]
 
 
-class ImmediateOperand(object):
+class _Operand(object):
+    """Base class for REIL operands.
+
+    Operands are immutable, and compare equal (and hash equally) when
+    they are of the same type and have the same attributes. This means
+    that a single operand object can safely be shared between any number
+    of instructions, which the shorthand functions take advantage of.
+    """
+
+    __slots__ = ()
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError('REIL operands are immutable')
+
+
+    def __delattr__(self, name):
+        raise AttributeError('REIL operands are immutable')
+
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._key() == other._key()
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __hash__(self):
+        return hash((type(self), self._key()))
+
+
+    def __copy__(self):
+        return self
+
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+    def __reduce__(self):
+        return (type(self), self._key())
+
+
+class ImmediateOperand(_Operand):
     """Class for REIL immediate operands.
 
     Args:
@@ -260,15 +445,51 @@ class ImmediateOperand(object):
 
 
     def __init__(self, value, size):
-        self.value = value
-        self.size = size
+        object.__setattr__(self, 'value', value)
+        object.__setattr__(self, 'size', size)
+
+
+    def _key(self):
+        return (self.value, self.size)
 
 
     def __str__(self):
         return '({}, {})'.format(self.value, self.size)
 
 
-class OffsetOperand(object):
+class RelocationOperand(ImmediateOperand):
+    """Class for REIL immediate operands whose value is derived from the
+    address of the native instruction, such as relative branch targets
+    and return addresses. These are only produced when translating in
+    relocatable mode, and mark the operands that need to be patched when
+    the IL is reused for the same code at a different address.
+
+    Args:
+        value (int): The value of the operand.
+        size (int): The size in bits of the operand.
+        delta (int): The value of the operand relative to the address
+    of the native instruction.
+
+    Attributes:
+        value (int): The value of the operand.
+        size (int): The size in bits of the operand.
+        delta (int): The value of the operand relative to the address
+    of the native instruction.
+    """
+
+    __slots__ = ('delta',)
+
+
+    def __init__(self, value, size, delta):
+        ImmediateOperand.__init__(self, value, size)
+        object.__setattr__(self, 'delta', delta)
+
+
+    def _key(self):
+        return (self.value, self.size, self.delta)
+
+
+class OffsetOperand(_Operand):
     """Class for REIL offset operands.
 
     Args:
@@ -284,15 +505,19 @@ class OffsetOperand(object):
 
 
     def __init__(self, offset):
-        self.offset = offset
-        self.size = 8
+        object.__setattr__(self, 'offset', offset)
+        object.__setattr__(self, 'size', 8)
+
+
+    def _key(self):
+        return (self.offset,)
 
 
     def __str__(self):
         return '(.{:02x}, {})'.format(self.offset, self.size)
 
 
-class RegisterOperand(object):
+class RegisterOperand(_Operand):
     """Class for REIL native register operands.
 
     Args:
@@ -308,8 +533,12 @@ class RegisterOperand(object):
 
 
     def __init__(self, name, size):
-        self.name = name
-        self.size = size
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'size', size)
+
+
+    def _key(self):
+        return (self.name, self.size)
 
 
     def __str__(self):
@@ -325,15 +554,20 @@ class TemporaryOperand(RegisterOperand):
 
     Attributes:
         index (int): The index of the temporary register.
+        name (string): The name of the temporary register.
         size (int): The size in bits of the operand.
     """
 
-    __slots__ = ('name', 'size')
+    __slots__ = ('index',)
 
 
     def __init__(self, index, size):
-        self.name = 't{:02}'.format(index)
-        self.size = size
+        RegisterOperand.__init__(self, 't{:02}'.format(index), size)
+        object.__setattr__(self, 'index', index)
+
+
+    def _key(self):
+        return (self.index, self.size)
 
 
 class Instruction(object):
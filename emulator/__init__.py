@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.emulator - REIL emulator
+
+This module executes the IL produced by the translators. The emulator is
+architecture independent; it is given a function that translates the
+code at an address, and reads the code to translate from its own memory.
+
+.. REIL language specification:
+    http://www.zynamics.com/binnavi/manual/html/reil_language.htm
+"""
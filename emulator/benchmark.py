@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.emulator.benchmark
+
+This module measures the throughput of the emulator, in native
+instructions per second, on a fixed corpus of small x86_64 routines, so
+that its performance can be tracked from one change to the next. Each
+routine is called with its arguments in registers as in the System V
+calling convention, and its result is checked once it returns. Run it
+with
+
+    python -m reil.emulator.benchmark [--engine compiler]
+"""
+
+import argparse
+import functools
+import random
+import time
+
+import reil.x86.translator as translator
+from reil.emulator.compiler import Compiler
+from reil.emulator.interpreter import Interpreter
+
+
+code_address = 0x400000
+data_address = 0x600000
+stack_address = 0x7ff000
+return_address = 0xdead0000
+
+engines = {
+    'compiler':     Compiler,
+    'interpreter':  Interpreter,
+}
+
+# checksum(data, length): the sum of the bytes of data
+#
+#       xor eax, eax
+#       xor ecx, ecx
+#   1:  movzx edx, byte ptr [rdi+rcx]
+#       add rax, rdx
+#       inc rcx
+#       cmp rcx, rsi
+#       jb 1b
+#       ret
+_checksum_code = (
+    b'\x31\xc0\x31\xc9\x0f\xb6\x14\x0f\x48\x01\xd0\x48'
+    b'\xff\xc1\x48\x39\xf1\x72\xf1\xc3')
+
+# fnv(data, length): the 64-bit FNV-1a hash of data
+#
+#       movabs rax, 0xcbf29ce484222325
+#       movabs r8, 0x100000001b3
+#       test rsi, rsi
+#       jz 2f
+#   1:  movzx edx, byte ptr [rdi]
+#       xor rax, rdx
+#       imul rax, r8
+#       inc rdi
+#       dec rsi
+#       jnz 1b
+#   2:  ret
+_fnv_code = (
+    b'\x48\xb8\x25\x23\x22\x84\xe4\x9c\xf2\xcb\x49\xb8'
+    b'\xb3\x01\x00\x00\x00\x01\x00\x00\x48\x85\xf6\x74'
+    b'\x12\x0f\xb6\x17\x48\x31\xd0\x49\x0f\xaf\xc0\x48'
+    b'\xff\xc7\x48\xff\xce\x75\xee\xc3')
+
+# copy(destination, source, count): copies count qwords
+#
+#       xor ecx, ecx
+#   1:  mov rax, [rsi+rcx*8]
+#       mov [rdi+rcx*8], rax
+#       add rcx, 1
+#       cmp rcx, rdx
+#       jne 1b
+#       ret
+_copy_code = (
+    b'\x31\xc9\x48\x8b\x04\xce\x48\x89\x04\xcf\x48\x83'
+    b'\xc1\x01\x48\x39\xd1\x75\xef\xc3')
+
+# strlen(string)
+#
+#       mov rax, rdi
+#   1:  cmp byte ptr [rax], 0
+#       je 2f
+#       inc rax
+#       jmp 1b
+#   2:  sub rax, rdi
+#       ret
+_strlen_code = (
+    b'\x48\x89\xf8\x80\x38\x00\x74\x05\x48\xff\xc0\xeb'
+    b'\xf6\x48\x29\xf8\xc3')
+
+# sort(array, count): insertion sort of an array of signed dwords
+#
+#       mov ecx, 1
+#   1:  cmp rcx, rsi
+#       jae 4f
+#       mov eax, [rdi+rcx*4]
+#       mov rdx, rcx
+#   2:  test rdx, rdx
+#       jz 3f
+#       mov r8d, [rdi+rdx*4-4]
+#       cmp r8d, eax
+#       jle 3f
+#       mov [rdi+rdx*4], r8d
+#       dec rdx
+#       jmp 2b
+#   3:  mov [rdi+rdx*4], eax
+#       inc rcx
+#       jmp 1b
+#   4:  ret
+_sort_code = (
+    b'\xb9\x01\x00\x00\x00\x48\x39\xf1\x73\x26\x8b\x04'
+    b'\x8f\x48\x89\xca\x48\x85\xd2\x74\x13\x44\x8b\x44'
+    b'\x97\xfc\x41\x39\xc0\x7e\x09\x44\x89\x04\x97\x48'
+    b'\xff\xca\xeb\xe8\x89\x04\x97\x48\xff\xc1\xeb\xd5'
+    b'\xc3')
+
+# fib(n): the nth Fibonacci number, computed recursively
+#
+#   fib:
+#       cmp rdi, 2
+#       jb 1f
+#       push rbx
+#       push rdi
+#       lea rdi, [rdi-1]
+#       call fib
+#       mov rbx, rax
+#       pop rdi
+#       push rdi
+#       lea rdi, [rdi-2]
+#       call fib
+#       add rax, rbx
+#       pop rdi
+#       pop rbx
+#       ret
+#   1:  mov rax, rdi
+#       ret
+_fib_code = (
+    b'\x48\x83\xff\x02\x72\x1f\x53\x57\x48\x8d\x7f\xff'
+    b'\xe8\xef\xff\xff\xff\x48\x89\xc3\x5f\x57\x48\x8d'
+    b'\x7f\xfe\xe8\xe1\xff\xff\xff\x48\x01\xd8\x5f\x5b'
+    b'\xc3\x48\x89\xf8\xc3')
+
+
+# sieve(bitmap, n): the number of primes below n, marking the composites
+# in a bitmap that starts 8 bytes into the buffer
+#
+#       mov rbx, rdi
+#       mov ecx, 2
+#   1:  mov eax, ecx
+#       imul eax, ecx
+#       cmp eax, esi
+#       jae 4f
+#       bt dword ptr [rbx+8], ecx
+#       jc 3f
+#   2:  bts dword ptr [rbx+8], eax
+#       add eax, ecx
+#       cmp eax, esi
+#       jb 2b
+#   3:  inc ecx
+#       jmp 1b
+#   4:  xor eax, eax
+#       mov ecx, 2
+#   5:  cmp ecx, esi
+#       jae 7f
+#       bt dword ptr [rbx+8], ecx
+#       jc 6f
+#       inc eax
+#   6:  inc ecx
+#       jmp 5b
+#   7:  ret
+_sieve_code = (
+    b'\x48\x89\xfb\xb9\x02\x00\x00\x00\x89\xc8\x0f\xaf'
+    b'\xc1\x39\xf0\x73\x14\x0f\xa3\x4b\x08\x72\x0a\x0f'
+    b'\xab\x43\x08\x01\xc8\x39\xf0\x72\xf6\xff\xc1\xeb'
+    b'\xe3\x31\xc0\xb9\x02\x00\x00\x00\x39\xf1\x73\x0c'
+    b'\x0f\xa3\x4b\x08\x72\x02\xff\xc0\xff\xc1\xeb\xf0'
+    b'\xc3')
+
+
+def _random_bytes(length, seed=0):
+    generator = random.Random(seed)
+    return bytes(generator.randrange(1, 256) for _ in range(length))
+
+
+# Each of these sets up the arguments for a routine, and returns a
+# function that checks the result.
+
+def _checksum(interpreter):
+    data = _random_bytes(8192)
+    interpreter.memory.write(data_address, data)
+    interpreter.registers['rdi'] = data_address
+    interpreter.registers['rsi'] = len(data)
+
+    return lambda: interpreter.registers['rax'] == sum(data)
+
+
+def _fnv(interpreter):
+    data = _random_bytes(8192)
+    interpreter.memory.write(data_address, data)
+    interpreter.registers['rdi'] = data_address
+    interpreter.registers['rsi'] = len(data)
+
+    value = 0xcbf29ce484222325
+    for byte in data:
+        value = ((value ^ byte) * 0x100000001b3) & 0xffffffffffffffff
+
+    return lambda: interpreter.registers['rax'] == value
+
+
+def _copy(interpreter):
+    data = _random_bytes(8 * 8192)
+    destination = data_address + len(data)
+    interpreter.memory.write(data_address, data)
+    interpreter.registers['rdi'] = destination
+    interpreter.registers['rsi'] = data_address
+    interpreter.registers['rdx'] = len(data) // 8
+
+    return lambda: interpreter.memory.read(destination, len(data)) == data
+
+
+def _strlen(interpreter):
+    data = _random_bytes(16384)
+    interpreter.memory.write(data_address, data + b'\x00')
+    interpreter.registers['rdi'] = data_address
+
+    return lambda: interpreter.registers['rax'] == len(data)
+
+
+def _sort(interpreter):
+    generator = random.Random(0)
+    values = [generator.randrange(-1 << 31, 1 << 31) for _ in range(128)]
+    for n, value in enumerate(values):
+        interpreter.memory.store(data_address + n * 4, 4, value & 0xffffffff)
+    interpreter.registers['rdi'] = data_address
+    interpreter.registers['rsi'] = len(values)
+
+    expected = b''.join(
+        (value & 0xffffffff).to_bytes(4, 'little') for value in sorted(values))
+
+    return lambda: interpreter.memory.read(data_address, len(expected)) == expected
+
+
+def _fib(interpreter):
+    interpreter.registers['rdi'] = 18
+
+    return lambda: interpreter.registers['rax'] == 2584
+
+
+def _sieve(interpreter):
+    n = 4096
+    header = _random_bytes(8)
+    interpreter.memory.write(data_address, header + bytes(n // 8))
+    interpreter.registers['rdi'] = data_address
+    interpreter.registers['rsi'] = n
+
+    composite = [False] * n
+    for i in range(2, n):
+        for j in range(i * i, n, i):
+            composite[j] = True
+    bitmap = bytes(
+        sum(composite[k + bit] << bit for bit in range(8))
+        for k in range(0, n, 8))
+    expected = header + bitmap
+
+    def check():
+        return (interpreter.registers['rax'] == composite[2:].count(False)
+                and interpreter.memory.read(data_address, len(expected)) == expected)
+
+    return check
+
+
+workloads = [
+    ('checksum',    _checksum_code, _checksum),
+    ('fnv',         _fnv_code,      _fnv),
+    ('copy',        _copy_code,     _copy),
+    ('strlen',      _strlen_code,   _strlen),
+    ('sort',        _sort_code,     _sort),
+    ('fib',         _fib_code,      _fib),
+    ('sieve',       _sieve_code,    _sieve),
+]
+
+
+def run_workload(code, setup, engine=Interpreter):
+    """Run one routine from the corpus to completion.
+
+    Args:
+        code (bytes): The machine code of the routine.
+        setup (callable): Sets up the arguments to the routine, and
+    returns a function that checks its result.
+        engine (class, optional): The emulator to use.
+
+    Returns:
+        A tuple of the number of native instructions executed and the
+    time taken in seconds.
+    """
+
+    emulator = engine(functools.partial(translator.translate, x86_64=True))
+    emulator.memory.write(code_address, code)
+    check = setup(emulator)
+
+    emulator.memory.store(stack_address - 8, 8, return_address)
+    emulator.registers['rsp'] = stack_address - 8
+
+    start = time.perf_counter()
+    emulator.run(code_address, stop=return_address)
+    elapsed = time.perf_counter() - start
+
+    if not check():
+        raise AssertionError('Wrong result from the emulator')
+
+    return emulator.executed, elapsed
+
+
+def benchmark(engine=Interpreter, repeat=3, output=print):
+    """Run each routine in the corpus, and report the throughput.
+
+    Args:
+        engine (class, optional): The emulator to use.
+        repeat (int, optional): The number of times to run each routine;
+    the fastest run is reported.
+        output (callable, optional): Called with each line of the report.
+
+    Returns:
+        The overall throughput in native instructions per second.
+    """
+
+    total_count = 0
+    total_time = 0.0
+
+    for name, code, setup in workloads:
+        results = [run_workload(code, setup, engine) for _ in range(repeat)]
+        count, elapsed = min(results, key=lambda result: result[1])
+
+        output('{:<12} {:>9} instructions {:>8.3f}s {:>12.0f}/s'.format(
+            name, count, elapsed, count / elapsed))
+
+        total_count += count
+        total_time += elapsed
+
+    throughput = total_count / total_time
+    output('{:<12} {:>9} instructions {:>8.3f}s {:>12.0f}/s'.format(
+        'total', total_count, total_time, throughput))
+
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of the REIL emulator.')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of times to run each routine (default 3)')
+    parser.add_argument(
+        '--engine', choices=sorted(engines), default='interpreter',
+        help='emulator to measure (default interpreter)')
+    arguments = parser.parse_args()
+
+    benchmark(engine=engines[arguments.engine], repeat=arguments.repeat)
+
+
+if __name__ == '__main__':
+    main()
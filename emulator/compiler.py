@@ -0,0 +1,664 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.emulator.compiler
+
+This module contains a block compiler for REIL, which turns the IL of each
+basic block into the source of a Python function, and compiles it once.
+
+Registers and temporaries are local variables of the generated function.
+Registers are loaded from the register file when the block is entered and
+stored back when it is left, so that within a block each IL instruction is
+a single Python statement. The IL of most native instructions runs
+straight through; the few that contain a loop or skip part of their own IL
+are run as a small state machine.
+
+The compiler runs exactly as the interpreter does, and falls back to it
+for a block that it has to stop part of the way through.
+"""
+
+import keyword
+
+import reil.definitions as definitions
+from reil.emulator.interpreter import (
+    Interpreter, IMMEDIATE, REGISTER, TEMPORARY, OFFSET, bit_shift,
+    lane_operations, lanewise, memory_compare, memory_copy, memory_fill,
+    signed_divide, trailing_zeros)
+from reil.error import EmulationError
+
+
+class _Fault(Exception):
+    # raised by a compiled block when an IL instruction fails, once the
+    # registers have been stored back, to pass the failing native
+    # instruction to Compiler._run_block.
+    def __init__(self, error, address):
+        Exception.__init__(self, error, address)
+        self.error = error
+        self.address = address
+
+
+def _signed(value, size):
+    if value >> (size - 1):
+        return value - (1 << size)
+
+    return value
+
+
+def _div(x, y):
+    if y == 0:
+        raise EmulationError('Division by zero')
+
+    return x // y
+
+
+def _mod(x, y):
+    if y == 0:
+        raise EmulationError('Division by zero')
+
+    return x % y
+
+
+def _load(interpreter, address, length, address_mask):
+    data = interpreter.read(address, length, address_mask)
+    return int.from_bytes(data, 'little')
+
+
+def _store(interpreter, address, length, value, address_mask):
+    interpreter.write(address, value.to_bytes(length, 'little'), address_mask)
+
+
+def _system_call(interpreter, number):
+    if interpreter.system_call is None:
+        raise EmulationError('Unhandled system call')
+
+    interpreter.system_call(interpreter, number)
+
+
+# the globals of every compiled block
+_namespace = {
+    'EmulationError':   EmulationError,
+    '_Fault':           _Fault,
+    '_bsh':             bit_shift,
+    '_ctz':             trailing_zeros,
+    '_div':             _div,
+    '_lane_operations': lane_operations,
+    '_lanewise':        lanewise,
+    '_load':            _load,
+    '_memory_compare':  memory_compare,
+    '_memory_copy':     memory_copy,
+    '_memory_fill':     memory_fill,
+    '_mod':             _mod,
+    '_sdiv':            signed_divide,
+    '_signed':          _signed,
+    '_store':           _store,
+    '_system_call':     _system_call,
+}
+
+
+def _literal(value):
+    if value < 10:
+        return str(value)
+
+    return '{:#x}'.format(value)
+
+
+def _local(prefix, name, index):
+    local = prefix + name
+    if not local.isidentifier() or keyword.iskeyword(local):
+        local = '{}_{}'.format(prefix, index)
+
+    return local
+
+
+def _sizes(il, kind):
+    # the sizes at which each register or temporary is accessed
+    sizes = dict()
+    for opcode, a, b, o in il:
+        for operand in (a, b, o):
+            if operand is not None and operand[0] == kind:
+                sizes.setdefault(operand[1], set()).add(operand[2])
+
+    return sizes
+
+
+def _written(il):
+    # the registers that are written, and those that are made undefined
+    written = set()
+    undefined = set()
+    for opcode, a, b, o in il:
+        if opcode in (definitions.JCC, definitions.STM,
+                      definitions.MCPY, definitions.MSET):
+            continue
+
+        if o is not None and o[0] == REGISTER:
+            written.add(o[1])
+            if opcode == definitions.UNDEF:
+                undefined.add(o[1])
+
+    return written, undefined
+
+
+class _Generator(object):
+    # generates the source of the function for one basic block.
+
+    __slots__ = ['lines', 'depth', 'registers', 'masked', 'written',
+                 'undefined', 'stored', 'temporaries', 'masked_temporaries']
+
+
+    def __init__(self, block):
+        self.lines = []
+        self.depth = 0
+
+        il = [i for address, next_address, native in block for i in native]
+
+        sizes = _sizes(il, REGISTER)
+        self.registers = dict(
+            (name, _local('r_', name, index))
+            for index, name in enumerate(sorted(sizes)))
+
+        # a register that is only ever accessed at one size is masked to
+        # that size when it is loaded, and needs no masking after that.
+        self.masked = dict(
+            (name, _literal((1 << max(sizes[name])) - 1))
+            for name in sizes if len(sizes[name]) == 1)
+
+        self.written, self.undefined = _written(il)
+        self.stored = self.written
+
+        self.temporaries = dict()
+        self.masked_temporaries = set()
+
+
+    def emit(self, line):
+        self.lines.append('    ' * self.depth + line)
+
+
+    def read(self, operand):
+        kind, value, size, mask = operand
+        if kind == IMMEDIATE:
+            return _literal(value)
+
+        elif kind == REGISTER:
+            local = self.registers[value]
+            if value in self.undefined:
+                local = '({} or 0)'.format(local)
+
+            if value in self.masked:
+                return local
+
+        else:
+            local = self.temporaries[value]
+            if value not in self.masked_temporaries:
+                return local
+
+        return '({} & {})'.format(local, _literal(mask))
+
+
+    def write(self, operand, expression):
+        if operand[0] == REGISTER:
+            local = self.registers[operand[1]]
+        else:
+            local = self.temporaries[operand[1]]
+
+        self.emit('{} = {}'.format(local, expression))
+
+
+    def load_registers(self, entry=False):
+        # masking a register that the block writes when it is loaded would
+        # truncate it if it is stored back unchanged, so on entry to the
+        # block it is checked instead, and the block is left to the
+        # interpreter if the register does not fit.
+        checks = []
+        for name in sorted(self.registers):
+            local = self.registers[name]
+            line = "{} = registers.get('{}', 0)".format(local, name)
+            if name in self.masked:
+                if entry and name in self.written:
+                    checks.append('{} > {}'.format(local, self.masked[name]))
+                else:
+                    line += ' & {}'.format(self.masked[name])
+
+            self.emit(line)
+
+        if checks:
+            self.emit('if {}:'.format(' or '.join(checks)))
+            self.emit('    return None')
+
+
+    def store_registers(self):
+        for name in sorted(self.stored):
+            local = self.registers[name]
+            if name in self.undefined:
+                self.emit('if {} is None:'.format(local))
+                self.emit("    registers.pop('{}', None)".format(name))
+                self.emit('else:')
+                self.emit("    registers['{}'] = {}".format(name, local))
+            else:
+                self.emit("registers['{}'] = {}".format(name, local))
+
+
+    def block(self, block):
+        self.emit('def block(interpreter):')
+        self.depth += 1
+
+        self.emit('registers = interpreter.registers')
+        self.emit('load = interpreter.memory.load')
+        self.emit('store = interpreter.memory.store')
+        self.load_registers(True)
+
+        self.emit('address = {:#x}'.format(block[0][0]))
+        self.emit('try:')
+        self.depth += 1
+        start = len(self.lines)
+
+        # leaving the block part of the way through only stores back the
+        # registers that could have been written so far.
+        self.stored = set()
+        for k, (address, next_address, il) in enumerate(block):
+            if k:
+                self.emit('address = {:#x}'.format(address))
+
+            self.stored = self.stored | _written(il)[0]
+            self.native(il, next_address, k + 1)
+
+        if len(self.lines) == start:
+            self.emit('pass')
+
+        self.stored = self.written
+
+        self.depth -= 1
+        self.emit('except EmulationError as error:')
+        self.depth += 1
+        self.store_registers()
+        self.emit('raise _Fault(error, address)')
+        self.depth -= 1
+
+        self.store_registers()
+        self.emit('return {:#x}, {}'.format(block[-1][1], len(block)))
+
+        return '\n'.join(self.lines) + '\n'
+
+
+    def native(self, il, next_address, executed):
+        sizes = _sizes(il, TEMPORARY)
+        self.temporaries = dict(
+            (name, _local('t_', name, index))
+            for index, name in enumerate(sorted(sizes)))
+        self.masked_temporaries = set(
+            name for name in sizes if len(sizes[name]) > 1)
+
+        # most IL runs straight through, leaving the native instruction,
+        # if at all, with its last IL instruction.
+        straight = True
+        for n, (opcode, a, b, o) in enumerate(il):
+            if opcode == definitions.JCC:
+                if o[0] == OFFSET or n != len(il) - 1:
+                    straight = False
+
+        if straight:
+            for opcode, a, b, o in il:
+                if opcode == definitions.JCC:
+                    self.leave(a, o, next_address, executed, False)
+                else:
+                    self.operation(opcode, a, b, o)
+            return
+
+        # otherwise run it as a state machine, with a state for each
+        # sequence of IL instructions that can only be entered at the top.
+        leaders = set([0])
+        for n, (opcode, a, b, o) in enumerate(il):
+            if opcode == definitions.JCC:
+                leaders.add(n + 1)
+                if o[0] == OFFSET:
+                    leaders.add(min(o[1], len(il)))
+
+        leaders = sorted(leader for leader in leaders if leader < len(il))
+        ends = leaders[1:] + [len(il)]
+
+        self.emit('state = 0')
+        self.emit('while True:')
+        self.depth += 1
+
+        for k, (start, end) in enumerate(zip(leaders, ends)):
+            self.emit('{} state == {}:'.format('elif' if k else 'if', start))
+            self.depth += 1
+
+            for opcode, a, b, o in il[start:end]:
+                if opcode != definitions.JCC:
+                    self.operation(opcode, a, b, o)
+                elif o[0] != OFFSET:
+                    self.leave(a, o, next_address, executed, True)
+                elif o[1] >= len(il):
+                    self.branch(a, ['break'])
+                else:
+                    self.branch(a, ['state = {}'.format(o[1]), 'continue'])
+
+            if end < len(il):
+                self.emit('state = {}'.format(end))
+            else:
+                self.emit('break')
+
+            self.depth -= 1
+
+        self.depth -= 1
+
+
+    def branch(self, condition, lines):
+        if condition[0] == IMMEDIATE:
+            if condition[1]:
+                for line in lines:
+                    self.emit(line)
+            return
+
+        self.emit('if {}:'.format(self.read(condition)))
+        self.depth += 1
+        for line in lines:
+            self.emit(line)
+        self.depth -= 1
+
+
+    def leave(self, condition, target, next_address, executed, machine):
+        # a jump to the next native instruction only skips the rest of the
+        # IL of this one; any other jump leaves the block.
+        if condition[0] == IMMEDIATE and not condition[1]:
+            return
+
+        if condition[0] != IMMEDIATE:
+            self.emit('if {}:'.format(self.read(condition)))
+            self.depth += 1
+
+        if target[0] == IMMEDIATE:
+            if target[1] != next_address:
+                self.store_registers()
+                self.emit('return {:#x}, {}'.format(target[1], executed))
+            elif not machine:
+                self.emit('pass')
+        else:
+            destination = self.read(target)
+            self.emit('if {} != {:#x}:'.format(destination, next_address))
+            self.depth += 1
+            self.store_registers()
+            self.emit('return {}, {}'.format(destination, executed))
+            self.depth -= 1
+
+        if machine:
+            self.emit('break')
+
+        if condition[0] != IMMEDIATE:
+            self.depth -= 1
+
+
+    def operation(self, opcode, a, b, o):
+        if opcode == definitions.NOP:
+            return
+
+        elif opcode == definitions.UNDEF:
+            self.write(o, 'None')
+            return
+
+        elif opcode == definitions.UNKN:
+            self.emit("raise EmulationError('Untranslated instruction')")
+            return
+
+        elif opcode == definitions.SYS:
+            # the handler sees and can change the registers
+            self.store_registers()
+            self.emit('_system_call(interpreter, {})'.format(
+                'None' if a is None else self.read(a)))
+            self.load_registers()
+            return
+
+        elif opcode == definitions.STM:
+            address = self.read(o)
+            length = a[2] // 8
+            limit = o[3] - length + 1
+            if o[0] == IMMEDIATE and o[1] <= limit:
+                self.emit('store({}, {}, {})'.format(
+                    address, length, self.read(a)))
+                return
+
+            self.emit('if {} <= {}:'.format(address, _literal(limit)))
+            self.emit('    store({}, {}, {})'.format(
+                address, length, self.read(a)))
+            self.emit('else:')
+            self.emit('    _store(interpreter, {}, {}, {}, {})'.format(
+                address, length, self.read(a), _literal(o[3])))
+            return
+
+        elif opcode == definitions.MCPY:
+            self.emit('_memory_copy(interpreter, {}, _signed({}, {}), {}, '
+                      '{}, {})'.format(self.read(a), self.read(b), b[2],
+                                       self.read(o), _literal(a[3]),
+                                       _literal(o[3])))
+            return
+
+        elif opcode == definitions.MSET:
+            self.emit('_memory_fill(interpreter, {}, {}, _signed({}, {}), '
+                      '{}, {})'.format(self.read(a), a[2] // 8, self.read(b),
+                                       b[2], self.read(o), _literal(o[3])))
+            return
+
+        self.write(o, self.expression(opcode, a, b, o))
+
+
+    def expression(self, opcode, a, b, o):
+        x = self.read(a)
+        if b is not None:
+            y = self.read(b)
+
+        mask = _literal(o[3])
+        size = o[2]
+
+        def masked(expression, needed=True):
+            if needed:
+                return '({}) & {}'.format(expression, mask)
+            return expression
+
+        if opcode == definitions.ADD:
+            return masked('{} + {}'.format(x, y))
+
+        elif opcode == definitions.SUB:
+            return masked('{} - {}'.format(x, y))
+
+        elif opcode == definitions.MUL:
+            return masked('{} * {}'.format(x, y))
+
+        elif opcode == definitions.AND:
+            return masked('{} & {}'.format(x, y), size < min(a[2], b[2]))
+
+        elif opcode == definitions.OR:
+            return masked('{} | {}'.format(x, y), size < max(a[2], b[2]))
+
+        elif opcode == definitions.XOR:
+            return masked('{} ^ {}'.format(x, y), size < max(a[2], b[2]))
+
+        elif opcode in (definitions.DIV, definitions.MOD):
+            if b[0] == IMMEDIATE and b[1]:
+                operator = '//' if opcode == definitions.DIV else '%'
+                expression = '{} {} {}'.format(x, operator, y)
+            else:
+                function = '_div' if opcode == definitions.DIV else '_mod'
+                expression = '{}({}, {})'.format(function, x, y)
+
+            return masked(expression, size < a[2])
+
+        elif opcode == definitions.SDIV:
+            return masked('_sdiv({}, {}, {}, {})'.format(x, y, a[2], b[2]))
+
+        elif opcode == definitions.LSHL:
+            if b[0] == IMMEDIATE:
+                if b[1] < size:
+                    return masked('{} << {}'.format(x, y))
+                return '0'
+
+            return '{} if {} < {} else 0'.format(
+                masked('{} << {}'.format(x, y)), y, size)
+
+        elif opcode == definitions.LSHR:
+            return masked('{} >> {}'.format(x, y), size < a[2])
+
+        elif opcode == definitions.ASHR:
+            sign = _literal(1 << (a[2] - 1))
+            return masked('(({} ^ {}) - {}) >> {}'.format(x, sign, sign, y))
+
+        elif opcode == definitions.BSH:
+            return masked('_bsh({}, {}, {}, {})'.format(x, y, b[2], size))
+
+        elif opcode == definitions.STR:
+            return masked(x, size < a[2])
+
+        elif opcode == definitions.SEX:
+            if size <= a[2]:
+                return masked(x, size < a[2])
+
+            sign = _literal(1 << (a[2] - 1))
+            return masked('({} ^ {}) - {}'.format(x, sign, sign))
+
+        elif opcode == definitions.BISZ:
+            return '1 if {} == 0 else 0'.format(x)
+
+        elif opcode == definitions.BISNZ:
+            return '1 if {} else 0'.format(x)
+
+        elif opcode == definitions.EQU:
+            return '1 if {} == {} else 0'.format(x, y)
+
+        elif opcode == definitions.LDM:
+            length = size // 8
+            limit = a[3] - length + 1
+            expression = 'load({}, {})'.format(x, length)
+            if a[0] != IMMEDIATE or a[1] > limit:
+                expression = '{} if {} <= {} else {}'.format(
+                    expression, x, _literal(limit),
+                    '_load(interpreter, {}, {}, {})'.format(
+                        x, length, _literal(a[3])))
+
+            return masked(expression, size % 8 != 0)
+
+        elif opcode == definitions.MCMP:
+            return masked('_memory_compare(interpreter, {}, {}, _signed({}, '
+                          '{}))'.format(x, a[2] // 2, y, b[2]))
+
+        elif opcode == definitions.CLZ:
+            return masked('{} - ({}).bit_length()'.format(a[2], x))
+
+        elif opcode == definitions.CTZ:
+            return masked('_ctz({}, {})'.format(x, a[2]))
+
+        elif opcode == definitions.POPCNT:
+            return masked("bin({}).count('1')".format(x))
+
+        elif opcode in lane_operations:
+            return masked('_lanewise(_lane_operations[{}], {}, {}, {})'.format(
+                opcode, x, a[2] // 2, y))
+
+        raise EmulationError('Unsupported opcode {}'.format(opcode))
+
+
+def generate(block):
+    """Generate the source of the function for a basic block.
+
+    Args:
+        block (tuple): The basic block, as returned by Interpreter.block.
+
+    Returns:
+        The source of a function named block, which takes the Compiler as
+    its only argument and returns a tuple of the address of the next native
+    instruction and the number of native instructions executed, or None,
+    without running any of the block, if it has to be interpreted instead.
+    """
+
+    return _Generator(block).block(block)
+
+
+def compile_block(block):
+    """Compile a basic block, as returned by Interpreter.block, into a
+    Python function. See generate.
+    """
+
+    source = generate(block)
+    code = compile(source, '<block {:#x}>'.format(block[0][0]), 'exec')
+
+    namespace = dict(_namespace)
+    exec(code, namespace)
+
+    return namespace['block']
+
+
+class Compiler(Interpreter):
+    """Executes native code by compiling each basic block into a Python
+    function. See Interpreter.
+
+    Compiled blocks are cached by address alongside the translated blocks,
+    and are discarded with them by flush. A register that is unset, and
+    that a block writes only on some paths through it, or had yet to write
+    when an IL instruction failed, may be left set to zero rather than
+    unset, which reads the same.
+    """
+
+    __slots__ = ['_compiled']
+
+
+    def __init__(self, translate, memory=None):
+        Interpreter.__init__(self, translate, memory)
+
+        self._compiled = dict()
+
+
+    def flush(self):
+        Interpreter.flush(self)
+
+        self._compiled.clear()
+
+
+    def compiled(self, address):
+        """Return the compiled function for the basic block at address,
+        compiling it if needed, and the addresses of its native
+        instructions.
+        """
+
+        compiled = self._compiled.get(address)
+        if compiled is None:
+            block = self.block(address)
+            compiled = self._compiled[address] = (
+                compile_block(block),
+                tuple(current for current, next_address, il in block))
+
+        return compiled
+
+
+    def _run_block(self, address, stop, remaining):
+        function, addresses = self.compiled(address)
+
+        # a compiled block can only be run from start to finish
+        if ((remaining is not None and remaining < len(addresses))
+                or (stop is not None and stop in addresses)):
+            return Interpreter._run_block(self, address, stop, remaining)
+
+        try:
+            result = function(self)
+
+        except _Fault as fault:
+            self.executed += addresses.index(fault.address)
+            raise EmulationError(
+                '{} (at {:#x})'.format(fault.error, fault.address))
+
+        if result is None:
+            return Interpreter._run_block(self, address, stop, remaining)
+
+        address, executed = result
+        self.executed += executed
+        return address
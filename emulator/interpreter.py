@@ -0,0 +1,657 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.emulator.interpreter
+
+This module contains a reference interpreter for REIL, which executes the
+IL of each native instruction one IL instruction at a time.
+
+IL is decoded before it is executed, into tuples of (opcode, input0,
+input1, output) in which each operand is None or a tuple of (kind, value,
+size, mask). The value is that of an immediate, already masked to its
+size, the interned name of a register or temporary, or a REIL offset.
+Decoded basic blocks are cached by address, so each block is translated
+and decoded only once.
+"""
+
+import operator
+import sys
+
+import reil.definitions as definitions
+from reil.emulator.memory import Memory, page_size
+from reil.error import EmulationError
+
+
+IMMEDIATE   = 0
+REGISTER    = 1
+TEMPORARY   = 2
+OFFSET      = 3
+
+# bytes of code handed to the translator at a time; a basic block that is
+# longer than this is split in two, which makes no difference to how it
+# runs.
+_block_window = 0x100
+
+
+def _mask(size):
+    return (1 << size) - 1
+
+
+def _signed(value, size):
+    if value >> (size - 1):
+        return value - (1 << size)
+
+    return value
+
+
+def decode_operand(operand):
+    """Decode a REIL operand into a (kind, value, size, mask) tuple."""
+
+    if operand is None:
+        return None
+
+    mask = _mask(operand.size)
+
+    if isinstance(operand, definitions.ImmediateOperand):
+        return (IMMEDIATE, operand.value & mask, operand.size, mask)
+
+    elif isinstance(operand, definitions.TemporaryOperand):
+        return (TEMPORARY, sys.intern(operand.name), operand.size, mask)
+
+    elif isinstance(operand, definitions.RegisterOperand):
+        return (REGISTER, sys.intern(operand.name), operand.size, mask)
+
+    elif isinstance(operand, definitions.OffsetOperand):
+        return (OFFSET, operand.offset, operand.size, mask)
+
+    raise TypeError('Unsupported operand type!')
+
+
+def decode(il_instructions):
+    """Decode the IL of a native instruction for the interpreter."""
+
+    return tuple(
+        (ri.opcode,
+         decode_operand(ri.input0),
+         decode_operand(ri.input1),
+         decode_operand(ri.output))
+        for ri in il_instructions)
+
+
+class Interpreter(object):
+    """Executes native code by interpreting its IL.
+
+    Args:
+        translate (callable): Called as translate(code_bytes, address) to
+    translate the basic block at address, returning an iterable of native
+    instructions, for example functools.partial(
+    reil.x86.translator.translate, x86_64=True).
+        memory (Memory, optional): The memory to run in, which also holds
+    the code.
+
+    Attributes:
+        memory (Memory): The memory to run in.
+        registers (dict): The value of each native register, by name.
+    Registers that have not been written, or have been made undefined,
+    read as zero.
+        temporaries (dict): The value of each temporary register, by name.
+        system_call (callable): Called as system_call(interpreter, number)
+    by each SYS instruction, with the value of its operand. If it is None,
+    SYS raises EmulationError.
+        executed (int): The number of native instructions executed.
+    """
+
+    __slots__ = ['memory', 'registers', 'temporaries', 'system_call',
+                 'executed', '_translate', '_blocks']
+
+
+    def __init__(self, translate, memory=None):
+        if memory is None:
+            memory = Memory()
+
+        self.memory = memory
+        self.registers = dict()
+        self.temporaries = dict()
+        self.system_call = None
+        self.executed = 0
+
+        self._translate = translate
+        self._blocks = dict()
+
+
+    def flush(self):
+        """Forget the translated blocks, which has to be done whenever the
+        code in memory changes.
+        """
+
+        self._blocks.clear()
+
+
+    def block(self, address):
+        """Return the basic block at address, translating it if needed, as
+        a tuple of (address, next address, decoded IL) for each native
+        instruction.
+        """
+
+        block = self._blocks.get(address)
+        if block is None:
+            block = self._blocks[address] = self._translate_block(address)
+
+        return block
+
+
+    def _translate_block(self, address):
+        if not self.memory.mapped(address):
+            raise EmulationError(
+                'Execution of unmapped memory at {:#x}'.format(address))
+
+        length = _block_window
+        if not self.memory.mapped(address + length - 1):
+            length = page_size - (address & (page_size - 1))
+
+        code = self.memory.read(address, length)
+
+        block = tuple(
+            (ni.address, ni.address + ni.size, decode(ni.il_instructions))
+            for ni in self._translate(code, address))
+
+        if not block:
+            raise EmulationError(
+                'Undecodable instruction at {:#x}'.format(address))
+
+        return block
+
+
+    def value(self, operand):
+        """Return the value of a decoded operand."""
+
+        kind = operand[0]
+        if kind == REGISTER:
+            return self.registers.get(operand[1], 0) & operand[3]
+
+        elif kind == TEMPORARY:
+            try:
+                return self.temporaries[operand[1]] & operand[3]
+            except KeyError:
+                raise EmulationError(
+                    'Read of unset temporary {}'.format(operand[1]))
+
+        return operand[1]
+
+
+    def set_value(self, operand, value):
+        """Write a value to a decoded register or temporary operand,
+        truncating it to the size of the operand.
+        """
+
+        kind = operand[0]
+        if kind == REGISTER:
+            self.registers[operand[1]] = value & operand[3]
+
+        elif kind == TEMPORARY:
+            self.temporaries[operand[1]] = value & operand[3]
+
+        else:
+            raise EmulationError('Write to an operand that is not a register')
+
+
+    def read(self, address, length, address_mask):
+        """Read bytes from memory, wrapping the addresses around at
+        address_mask.
+        """
+
+        if address + length - 1 <= address_mask:
+            return self.memory.read(address, length)
+
+        head = address_mask + 1 - address
+        return (self.memory.read(address, head) +
+                self.memory.read(0, length - head))
+
+
+    def write(self, address, data, address_mask):
+        """Write bytes to memory, wrapping the addresses around at
+        address_mask.
+        """
+
+        if address + len(data) - 1 <= address_mask:
+            self.memory.write(address, data)
+            return
+
+        head = address_mask + 1 - address
+        self.memory.write(address, data[:head])
+        self.memory.write(0, data[head:])
+
+
+    def execute(self, il_instructions):
+        """Execute the IL of one native instruction.
+
+        Args:
+            il_instructions (list): The IL to execute.
+
+        Returns:
+            The address that the IL jumps to, or None if it runs off the
+        end, in which case execution continues with the next native
+        instruction.
+        """
+
+        return self._execute(decode(il_instructions))
+
+
+    def _execute(self, il):
+        n = 0
+        count = len(il)
+        while n < count:
+            opcode, a, b, o = il[n]
+            n += 1
+
+            if opcode == definitions.JCC:
+                if self.value(a):
+                    if o[0] == OFFSET:
+                        n = o[1]
+                    else:
+                        return self.value(o)
+
+            else:
+                _operations[opcode](self, a, b, o)
+
+        return None
+
+
+    def run(self, address, stop=None, count=None):
+        """Execute native code.
+
+        Args:
+            address (int): The address of the first native instruction.
+            stop (int, optional): Stop when execution reaches this address.
+            count (int, optional): Stop after executing this many native
+        instructions.
+
+        Returns:
+            The address of the next native instruction to execute.
+        """
+
+        start = self.executed
+        remaining = count
+
+        while address != stop:
+            if count is not None:
+                remaining = count - (self.executed - start)
+                if remaining <= 0:
+                    break
+
+            address = self._run_block(address, stop, remaining)
+
+        return address
+
+
+    def _run_block(self, address, stop, remaining):
+        # runs the basic block at address until it is left, execution
+        # reaches stop or remaining native instructions have run, and
+        # returns the address of the next native instruction.
+        executed = 0
+        current = address
+
+        # errors from translating the block already give its address
+        block = self.block(address)
+
+        try:
+            for current, next_address, il in block:
+                target = self._execute(il)
+                executed += 1
+
+                if target is None:
+                    address = next_address
+                else:
+                    address = target
+                    if address != next_address:
+                        break
+
+                if address == stop or executed == remaining:
+                    break
+
+        except EmulationError as error:
+            raise EmulationError('{} (at {:#x})'.format(error, current))
+
+        finally:
+            self.executed += executed
+
+        return address
+
+
+def _binary(function):
+    def operation(interpreter, a, b, o):
+        interpreter.set_value(
+            o, function(interpreter.value(a), interpreter.value(b)))
+
+    return operation
+
+
+def _unary(function):
+    def operation(interpreter, a, b, o):
+        interpreter.set_value(o, function(interpreter.value(a)))
+
+    return operation
+
+
+def _lanes(value, width, count):
+    lane_mask = _mask(width)
+    return [(value >> (width * k)) & lane_mask for k in range(count)]
+
+
+def lanewise(function, vectors, size, width):
+    """Apply a lane-wise operation to a pair of vectors.
+
+    Args:
+        function (callable): Called as function(first, second, width) with
+    the lanes of each vector, returning the lanes of the result.
+        vectors (int): Both vectors, with the first in the low size bits.
+        size (int): The size of each vector.
+        width (int): The width of each lane.
+
+    Returns:
+        The resulting vector.
+    """
+
+    count = size // width
+    first = _lanes(vectors, width, count)
+    second = _lanes(vectors >> size, width, count)
+
+    result = 0
+    for k, lane in enumerate(function(first, second, width)):
+        result |= (lane & _mask(width)) << (width * k)
+
+    return result
+
+
+def _vector(function):
+    # the operands of the lane-wise opcodes are the same for all of them
+    def operation(interpreter, a, b, o):
+        interpreter.set_value(o, lanewise(
+            function, interpreter.value(a), a[2] // 2, interpreter.value(b)))
+
+    return operation
+
+
+def _division(function):
+    def operation(x, y):
+        if y == 0:
+            raise EmulationError('Division by zero')
+
+        return function(x, y)
+
+    return operation
+
+
+def signed_divide(x, y, x_size, y_size):
+    """Divide two signed values, rounding towards zero, as SDIV does."""
+
+    x = _signed(x, x_size)
+    y = _signed(y, y_size)
+    if y == 0:
+        raise EmulationError('Division by zero')
+
+    # rounds towards zero, unlike Python's //
+    quotient = abs(x) // abs(y)
+    if (x < 0) != (y < 0):
+        quotient = -quotient
+
+    return quotient
+
+
+def bit_shift(x, y, y_size, size):
+    """Shift a value left by a signed amount, or right if it is negative,
+    as BSH does.
+    """
+
+    y = _signed(y, y_size)
+    if y < 0:
+        return x >> -y
+    elif y < size:
+        return x << y
+
+    return 0
+
+
+def trailing_zeros(x, size):
+    """Count the trailing zero bits of a value, as CTZ does."""
+
+    if x == 0:
+        return size
+
+    return (x & -x).bit_length() - 1
+
+
+def _ashr(interpreter, a, b, o):
+    x = _signed(interpreter.value(a), a[2])
+    interpreter.set_value(o, x >> interpreter.value(b))
+
+
+def _bsh(interpreter, a, b, o):
+    interpreter.set_value(o, bit_shift(
+        interpreter.value(a), interpreter.value(b), b[2], o[2]))
+
+
+def _lshl(interpreter, a, b, o):
+    # the shift amount can be anything, so don't build a huge number only
+    # to throw it away.
+    y = interpreter.value(b)
+    if y < o[2]:
+        interpreter.set_value(o, interpreter.value(a) << y)
+    else:
+        interpreter.set_value(o, 0)
+
+
+def _sdiv(interpreter, a, b, o):
+    interpreter.set_value(o, signed_divide(
+        interpreter.value(a), interpreter.value(b), a[2], b[2]))
+
+
+def _sex(interpreter, a, b, o):
+    interpreter.set_value(o, _signed(interpreter.value(a), a[2]))
+
+
+def _clz(interpreter, a, b, o):
+    interpreter.set_value(o, a[2] - interpreter.value(a).bit_length())
+
+
+def _ctz(interpreter, a, b, o):
+    interpreter.set_value(o, trailing_zeros(interpreter.value(a), a[2]))
+
+
+def _ldm(interpreter, a, b, o):
+    address = interpreter.value(a)
+    length = o[2] // 8
+    if address + length - 1 <= a[3]:
+        interpreter.set_value(o, interpreter.memory.load(address, length))
+    else:
+        data = interpreter.read(address, length, a[3])
+        interpreter.set_value(o, int.from_bytes(data, 'little'))
+
+
+def _stm(interpreter, a, b, o):
+    address = interpreter.value(o)
+    length = a[2] // 8
+    if address + length - 1 <= o[3]:
+        interpreter.memory.store(address, length, interpreter.value(a))
+    else:
+        data = interpreter.value(a).to_bytes(length, 'little')
+        interpreter.write(address, data, o[3])
+
+
+def memory_copy(interpreter, source, length, destination,
+                source_mask, destination_mask):
+    """Copy abs(length) bytes of memory, forwards if length is positive and
+    backwards otherwise, as MCPY does.
+    """
+
+    count = abs(length)
+
+    # copying the whole block at once is only different from copying it a
+    # byte at a time if the destination overlaps the part of the source
+    # that is still to be copied.
+    if length >= 0:
+        distance = (destination - source) & destination_mask
+    else:
+        distance = (source - destination) & destination_mask
+
+    if not 0 < distance < count:
+        data = interpreter.read(source, count, source_mask)
+        interpreter.write(destination, data, destination_mask)
+        return
+
+    if length >= 0:
+        offsets = range(count)
+    else:
+        offsets = range(count - 1, -1, -1)
+
+    for k in offsets:
+        data = interpreter.read((source + k) & source_mask, 1, source_mask)
+        interpreter.write(
+            (destination + k) & destination_mask, data, destination_mask)
+
+
+def memory_fill(interpreter, value, element, length, destination,
+                destination_mask):
+    """Fill abs(length) bytes of memory with copies of an element bytes
+    long value, as MSET does.
+    """
+
+    data = value.to_bytes(element, 'little')
+    interpreter.write(
+        destination, data * (abs(length) // element), destination_mask)
+
+
+def memory_compare(interpreter, addresses, size, length):
+    """Return the number of equal bytes at the start of two regions of
+    memory, comparing abs(length) bytes forwards if length is positive and
+    backwards otherwise, as MCMP does.
+    """
+
+    count = abs(length)
+
+    first = interpreter.read(addresses & _mask(size), count, _mask(size))
+    second = interpreter.read(addresses >> size, count, _mask(size))
+
+    if length < 0:
+        first = first[::-1]
+        second = second[::-1]
+
+    equal = 0
+    for x, y in zip(first, second):
+        if x != y:
+            break
+        equal += 1
+
+    return equal
+
+
+def _mcpy(interpreter, a, b, o):
+    memory_copy(
+        interpreter, interpreter.value(a),
+        _signed(interpreter.value(b), b[2]), interpreter.value(o), a[3], o[3])
+
+
+def _mset(interpreter, a, b, o):
+    memory_fill(
+        interpreter, interpreter.value(a), a[2] // 8,
+        _signed(interpreter.value(b), b[2]), interpreter.value(o), o[3])
+
+
+def _mcmp(interpreter, a, b, o):
+    interpreter.set_value(o, memory_compare(
+        interpreter, interpreter.value(a), a[2] // 2,
+        _signed(interpreter.value(b), b[2])))
+
+
+def _nop(interpreter, a, b, o):
+    pass
+
+
+def _undef(interpreter, a, b, o):
+    if o[0] == REGISTER:
+        interpreter.registers.pop(o[1], None)
+    else:
+        interpreter.temporaries.pop(o[1], None)
+
+
+def _sys(interpreter, a, b, o):
+    if interpreter.system_call is None:
+        raise EmulationError('Unhandled system call')
+
+    number = None
+    if a is not None:
+        number = interpreter.value(a)
+
+    interpreter.system_call(interpreter, number)
+
+
+def _unkn(interpreter, a, b, o):
+    raise EmulationError('Untranslated instruction')
+
+
+def _vshuf(first, second, width):
+    return [first[index % len(first)] for index in second]
+
+
+# the lanes of the result of each lane-wise opcode, given the lanes of its
+# two vectors and their width.
+lane_operations = {
+    definitions.VADD:   lambda xs, ys, w: map(operator.add, xs, ys),
+    definitions.VEQU:   lambda xs, ys, w: [-(x == y) for x, y in zip(xs, ys)],
+    definitions.VMAXU:  lambda xs, ys, w: map(max, xs, ys),
+    definitions.VMINU:  lambda xs, ys, w: map(min, xs, ys),
+    definitions.VSGT:   lambda xs, ys, w: [
+        -(_signed(x, w) > _signed(y, w)) for x, y in zip(xs, ys)],
+    definitions.VSHUF:  _vshuf,
+    definitions.VSUB:   lambda xs, ys, w: map(operator.sub, xs, ys),
+}
+
+
+_operations = {
+    definitions.ADD:    _binary(operator.add),
+    definitions.AND:    _binary(operator.and_),
+    definitions.ASHR:   _ashr,
+    definitions.BISNZ:  _unary(lambda x: int(x != 0)),
+    definitions.BISZ:   _unary(lambda x: int(x == 0)),
+    definitions.BSH:    _bsh,
+    definitions.CLZ:    _clz,
+    definitions.CTZ:    _ctz,
+    definitions.DIV:    _binary(_division(operator.floordiv)),
+    definitions.EQU:    _binary(lambda x, y: int(x == y)),
+    definitions.LDM:    _ldm,
+    definitions.LSHL:   _lshl,
+    definitions.LSHR:   _binary(operator.rshift),
+    definitions.MCMP:   _mcmp,
+    definitions.MCPY:   _mcpy,
+    definitions.MOD:    _binary(_division(operator.mod)),
+    definitions.MSET:   _mset,
+    definitions.MUL:    _binary(operator.mul),
+    definitions.NOP:    _nop,
+    definitions.OR:     _binary(operator.or_),
+    definitions.POPCNT: _unary(lambda x: bin(x).count('1')),
+    definitions.SDIV:   _sdiv,
+    definitions.SEX:    _sex,
+    definitions.STM:    _stm,
+    definitions.STR:    _unary(lambda x: x),
+    definitions.SUB:    _binary(operator.sub),
+    definitions.SYS:    _sys,
+    definitions.UNDEF:  _undef,
+    definitions.UNKN:   _unkn,
+    definitions.XOR:    _binary(operator.xor),
+}
+
+for opcode, function in lane_operations.items():
+    _operations[opcode] = _vector(function)
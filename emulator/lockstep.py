@@ -0,0 +1,699 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.emulator.lockstep
+
+This module contains a batched engine for REIL, which runs the same native
+code over many machine states at once, for example one for each input to a
+fuzzing target. It requires NumPy.
+
+Each register and temporary is held as a column with a value for each
+state, an array of uint64 for operands of up to 64 bits, and an array of
+Python integers for wider ones, and each IL instruction is applied to a
+whole column at once. States at the same address run together as a group;
+a group is split when a jcc condition or the target of a jump differs
+between its states, and groups are merged again when they reach the same
+address. The group with the lowest address is always run first, so that
+states that take different sides of a branch wait for each other where
+the paths meet.
+
+Memory operations, and the rarer opcodes, are applied to one state at a
+time.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import reil.definitions as definitions
+from reil.emulator.interpreter import (
+    Interpreter, IMMEDIATE, REGISTER, OFFSET, bit_shift, lane_operations,
+    lanewise, memory_compare, memory_copy, memory_fill, signed_divide,
+    trailing_zeros)
+from reil.emulator.memory import Memory, Overlay
+from reil.error import EmulationError
+
+
+def _dtype(size):
+    if size > 64:
+        return object
+
+    return numpy.uint64
+
+
+def _wide(value):
+    # converts a value to Python integers, which can't overflow
+    if isinstance(value, numpy.ndarray):
+        if value.dtype == object:
+            return value
+        return value.astype(object)
+
+    return int(value)
+
+
+def _truncate(value, size, mask):
+    if size > 64:
+        return _wide(value) & mask
+
+    if isinstance(value, numpy.ndarray):
+        if value.dtype == object:
+            return (value & mask).astype(numpy.uint64)
+        elif value.dtype != numpy.uint64:
+            value = value.astype(numpy.uint64)
+    elif isinstance(value, int):
+        return numpy.uint64(value & mask)
+    else:
+        value = numpy.uint64(value)
+
+    if size < 64:
+        return value & numpy.uint64(mask)
+
+    return value
+
+
+def _signed(value, size):
+    if value >> (size - 1):
+        return value - (1 << size)
+
+    return value
+
+
+class _State(object):
+    # the memory of one state, with the same read and write as the
+    # interpreter, for the helpers shared with it.
+
+    __slots__ = ['memory']
+
+    read = Interpreter.read
+    write = Interpreter.write
+
+
+    def __init__(self, memory):
+        self.memory = memory
+
+
+class _Group(object):
+    # a group of states at the same address, with a column for each of
+    # their registers and temporaries.
+
+    __slots__ = ['lanes', 'registers', 'temporaries', 'executed']
+
+
+    def __init__(self, lanes, registers, executed):
+        self.lanes = lanes
+        self.registers = registers
+        self.temporaries = dict()
+        self.executed = executed
+
+
+    def __len__(self):
+        return len(self.lanes)
+
+
+    def select(self, selection):
+        group = _Group(
+            self.lanes[selection],
+            dict((name, column[selection])
+                 for name, column in self.registers.items()),
+            self.executed[selection])
+
+        group.temporaries = dict(
+            (name, column[selection])
+            for name, column in self.temporaries.items())
+
+        return group
+
+
+    def value(self, operand):
+        # the value of an operand, which is a scalar for an immediate
+        kind, value, size, mask = operand
+        if kind == IMMEDIATE:
+            if size > 64:
+                return value
+            return numpy.uint64(value)
+
+        elif kind == REGISTER:
+            column = self.registers.get(value)
+            if column is None:
+                return numpy.zeros(len(self), _dtype(size))
+
+        else:
+            try:
+                column = self.temporaries[value]
+            except KeyError:
+                raise EmulationError(
+                    'Read of unset temporary {}'.format(value))
+
+        return _truncate(column, size, mask)
+
+
+    def column(self, operand):
+        value = self.value(operand)
+        if numpy.ndim(value) == 0:
+            return numpy.full(len(self), value, _dtype(operand[2]))
+
+        return value
+
+
+    def values(self, operand):
+        if operand is None:
+            return [None] * len(self)
+
+        return self.column(operand).tolist()
+
+
+    def set_value(self, operand, value):
+        kind, name, size, mask = operand
+
+        value = _truncate(value, size, mask)
+        if numpy.ndim(value) == 0:
+            value = numpy.full(len(self), value, _dtype(size))
+
+        if kind == REGISTER:
+            self.registers[name] = value
+        else:
+            self.temporaries[name] = value
+
+
+def _merge(groups):
+    if len(groups) == 1:
+        return groups[0]
+
+    names = set()
+    for group in groups:
+        names.update(group.registers)
+
+    registers = dict()
+    for name in names:
+        columns = []
+        for group in groups:
+            column = group.registers.get(name)
+            if column is None:
+                column = numpy.zeros(len(group), numpy.uint64)
+            columns.append(column)
+
+        registers[name] = numpy.concatenate(columns)
+
+    return _Group(
+        numpy.concatenate([group.lanes for group in groups]),
+        registers,
+        numpy.concatenate([group.executed for group in groups]))
+
+
+def _truth(condition):
+    # True or False if a condition is the same for the whole group, and
+    # otherwise which of the states it holds for.
+    if numpy.ndim(condition) == 0:
+        return bool(condition)
+
+    taken = condition != 0
+    if taken.all():
+        return True
+    elif not taken.any():
+        return False
+
+    return taken
+
+
+def _arithmetic(function):
+    def operation(engine, group, a, b, o):
+        x = group.value(a)
+        y = group.value(b)
+        if o[2] > 64 or a[2] > 64 or b[2] > 64:
+            x = _wide(x)
+            y = _wide(y)
+
+        group.set_value(o, function(x, y))
+
+    return operation
+
+
+def _predicate(function):
+    def operation(engine, group, a, b, o):
+        x = group.value(a)
+        y = None
+        if b is not None:
+            y = group.value(b)
+
+        result = numpy.asarray(function(x, y))
+        group.set_value(o, result.astype(numpy.uint64))
+
+    return operation
+
+
+def _division(function):
+    def operation(engine, group, a, b, o):
+        x = group.value(a)
+        y = group.value(b)
+        if o[2] > 64 or a[2] > 64 or b[2] > 64:
+            x = _wide(x)
+            y = _wide(y)
+
+        zero = _truth(y == 0)
+        if zero is True:
+            return numpy.ones(len(group), bool), 'Division by zero'
+        elif zero is not False:
+            return zero, 'Division by zero'
+
+        group.set_value(o, function(x, y))
+
+    return operation
+
+
+def _each(function):
+    # applies an operation to one state at a time, as Python integers.
+    def operation(engine, group, a, b, o):
+        states = engine._states
+        faults = None
+        results = []
+        for k, (lane, x, y) in enumerate(zip(
+                group.lanes.tolist(), group.values(a), group.values(b))):
+            try:
+                results.append(function(states[lane], x, y, a, b, o) & o[3])
+            except EmulationError as error:
+                if faults is None:
+                    faults = numpy.zeros(len(group), bool)
+                    message = str(error)
+
+                faults[k] = True
+                results.append(0)
+
+        if faults is not None:
+            return faults, message
+
+        group.set_value(o, numpy.array(results, _dtype(o[2])))
+
+    return operation
+
+
+def _each_store(function):
+    # as _each, for an operation that writes to memory at the address in
+    # its output operand.
+    def operation(engine, group, a, b, o):
+        states = engine._states
+        for lane, x, y, z in zip(group.lanes.tolist(), group.values(a),
+                                 group.values(b), group.values(o)):
+            function(states[lane], x, y, z, a, b, o)
+
+    return operation
+
+
+def _lshl(engine, group, a, b, o):
+    if o[2] > 64 or a[2] > 64:
+        return _each(
+            lambda state, x, y, a, b, o: x << y if y < o[2] else 0)(
+                engine, group, a, b, o)
+
+    x = group.value(a)
+    y = group.value(b)
+    result = numpy.left_shift(x, numpy.minimum(y, numpy.uint64(63)))
+    group.set_value(o, numpy.where(y < o[2], result, numpy.uint64(0)))
+
+
+def _lshr(engine, group, a, b, o):
+    if a[2] > 64:
+        return _arithmetic(lambda x, y: x >> y)(engine, group, a, b, o)
+
+    x = group.value(a)
+    y = group.value(b)
+    result = numpy.right_shift(x, numpy.minimum(y, numpy.uint64(63)))
+    group.set_value(o, numpy.where(y < 64, result, numpy.uint64(0)))
+
+
+def _ashr(engine, group, a, b, o):
+    if a[2] > 64:
+        return _each(
+            lambda state, x, y, a, b, o: _signed(x, a[2]) >> y)(
+                engine, group, a, b, o)
+
+    # sign extend to 64 bits, and shift as signed 64-bit integers
+    sign = numpy.uint64(1 << (a[2] - 1))
+    x = ((group.column(a) ^ sign) - sign).view(numpy.int64)
+    y = numpy.minimum(group.value(b), numpy.uint64(63)).astype(numpy.int64)
+    group.set_value(o, numpy.right_shift(x, y).view(numpy.uint64))
+
+
+def _sex(engine, group, a, b, o):
+    x = group.value(a)
+    if o[2] <= a[2]:
+        group.set_value(o, x)
+        return
+
+    if o[2] > 64 or a[2] > 64:
+        x = _wide(x)
+        sign = 1 << (a[2] - 1)
+    else:
+        sign = numpy.uint64(1 << (a[2] - 1))
+
+    group.set_value(o, (x ^ sign) - sign)
+
+
+def _str(engine, group, a, b, o):
+    group.set_value(o, group.value(a))
+
+
+def _ldm(state, x, y, a, b, o):
+    length = o[2] // 8
+    if x + length - 1 <= a[3]:
+        return state.memory.load(x, length)
+
+    return int.from_bytes(state.read(x, length, a[3]), 'little')
+
+
+def _stm(state, x, y, z, a, b, o):
+    length = a[2] // 8
+    if z + length - 1 <= o[3]:
+        state.memory.store(z, length, x)
+    else:
+        state.write(z, x.to_bytes(length, 'little'), o[3])
+
+
+def _nop(engine, group, a, b, o):
+    pass
+
+
+def _undef(engine, group, a, b, o):
+    if o[0] == REGISTER:
+        group.registers.pop(o[1], None)
+    else:
+        group.temporaries.pop(o[1], None)
+
+
+def _stop(message):
+    def operation(engine, group, a, b, o):
+        return numpy.ones(len(group), bool), message
+
+    return operation
+
+
+def _vector(function):
+    def operation(state, x, y, a, b, o):
+        return lanewise(function, x, a[2] // 2, y)
+
+    return operation
+
+
+_operations = {
+    definitions.ADD:    _arithmetic(lambda x, y: x + y),
+    definitions.AND:    _arithmetic(lambda x, y: x & y),
+    definitions.ASHR:   _ashr,
+    definitions.BISNZ:  _predicate(lambda x, y: x != 0),
+    definitions.BISZ:   _predicate(lambda x, y: x == 0),
+    definitions.BSH:    _each(
+        lambda state, x, y, a, b, o: bit_shift(x, y, b[2], o[2])),
+    definitions.CLZ:    _each(
+        lambda state, x, y, a, b, o: a[2] - x.bit_length()),
+    definitions.CTZ:    _each(
+        lambda state, x, y, a, b, o: trailing_zeros(x, a[2])),
+    definitions.DIV:    _division(lambda x, y: x // y),
+    definitions.EQU:    _predicate(lambda x, y: x == y),
+    definitions.LDM:    _each(_ldm),
+    definitions.LSHL:   _lshl,
+    definitions.LSHR:   _lshr,
+    definitions.MCMP:   _each(
+        lambda state, x, y, a, b, o: memory_compare(
+            state, x, a[2] // 2, _signed(y, b[2]))),
+    definitions.MCPY:   _each_store(
+        lambda state, x, y, z, a, b, o: memory_copy(
+            state, x, _signed(y, b[2]), z, a[3], o[3])),
+    definitions.MOD:    _division(lambda x, y: x % y),
+    definitions.MSET:   _each_store(
+        lambda state, x, y, z, a, b, o: memory_fill(
+            state, x, a[2] // 8, _signed(y, b[2]), z, o[3])),
+    definitions.MUL:    _arithmetic(lambda x, y: x * y),
+    definitions.NOP:    _nop,
+    definitions.OR:     _arithmetic(lambda x, y: x | y),
+    definitions.POPCNT: _each(
+        lambda state, x, y, a, b, o: bin(x).count('1')),
+    definitions.SDIV:   _each(
+        lambda state, x, y, a, b, o: signed_divide(x, y, a[2], b[2])),
+    definitions.SEX:    _sex,
+    definitions.STM:    _each_store(_stm),
+    definitions.STR:    _str,
+    definitions.SUB:    _arithmetic(lambda x, y: x - y),
+    definitions.SYS:    _stop('Unhandled system call'),
+    definitions.UNDEF:  _undef,
+    definitions.UNKN:   _stop('Untranslated instruction'),
+    definitions.XOR:    _arithmetic(lambda x, y: x ^ y),
+}
+
+for opcode, function in lane_operations.items():
+    _operations[opcode] = _each(_vector(function))
+
+
+class Lockstep(object):
+    """Executes native code for many machine states at once.
+
+    Each state has its own registers and memory, and states run until they
+    reach the stop address, have executed the given number of native
+    instructions, or an IL instruction fails for them. System calls are not
+    handled; a state that reaches one stops there with an error, and can
+    be continued on its own with the interpreter.
+
+    Args:
+        translate (callable): Translates a basic block, as for Interpreter.
+        count (int): The number of states.
+        memory (Memory, optional): The memory that each state starts with,
+    which also holds the code. It must not be written once the states
+    exist.
+
+    Attributes:
+        count (int): The number of states.
+        registers (dict): A column of the values of each register, by name,
+    as a NumPy array with one value for each state, which can also be set
+    to a single value for all of them. Registers that have not been
+    written, or have been made undefined, read as zero.
+        memories (list): The memory of each state.
+        addresses (numpy.ndarray): The address that each state stopped at.
+        executed (numpy.ndarray): The number of native instructions that
+    each state has executed.
+        errors (list): For each state, None, or why it stopped if an IL
+    instruction failed, in which case its address is that of the native
+    instruction that failed.
+    """
+
+    __slots__ = ['count', 'registers', 'memories', 'addresses', 'executed',
+                 'errors', '_code', '_states']
+
+
+    def __init__(self, translate, count, memory=None):
+        if numpy is None:
+            raise ImportError('numpy is required for Lockstep')
+
+        if memory is None:
+            memory = Memory()
+
+        self.count = count
+        self.registers = dict()
+        self.memories = [Overlay(memory) for _ in range(count)]
+        self.addresses = numpy.zeros(count, numpy.uint64)
+        self.executed = numpy.zeros(count, numpy.int64)
+        self.errors = [None] * count
+
+        # translates and decodes the code once for all of the states
+        self._code = Interpreter(translate, memory)
+        self._states = [_State(memory) for memory in self.memories]
+
+
+    def flush(self):
+        """Forget the translated blocks. See Interpreter.flush."""
+
+        self._code.flush()
+
+
+    def run(self, address, stop=None, count=None):
+        """Execute native code for every state.
+
+        Args:
+            address (int): The address of the first native instruction.
+            stop (int, optional): Stop each state when it reaches this
+    address.
+            count (int, optional): Stop each state after it has executed
+    this many native instructions.
+
+        Returns:
+            The address that each state stopped at.
+        """
+
+        registers = dict()
+        for name, column in self.registers.items():
+            column = numpy.asarray(column)
+            if column.dtype != object:
+                column = column.astype(numpy.uint64)
+            if column.ndim == 0:
+                column = numpy.full(self.count, column, column.dtype)
+
+            registers[name] = column
+
+        self.registers = registers
+        self.errors = [None] * self.count
+
+        group = _Group(
+            numpy.arange(self.count),
+            dict((name, column.copy()) for name, column in registers.items()),
+            numpy.zeros(self.count, numpy.int64))
+
+        pending = dict()
+        self._queue(pending, group, address, stop, count)
+
+        with numpy.errstate(over='ignore'):
+            while pending:
+                address = min(pending)
+                group = _merge(pending.pop(address))
+                self._run_block(pending, group, address, stop, count)
+
+        return self.addresses
+
+
+    def _settle(self, group, address, stop, count):
+        # finishes the states in a group that are done once they reach
+        # address, and returns a group of the rest, if there are any.
+        if address == stop:
+            self._finish(group, address)
+            return None
+
+        if count is not None:
+            done = group.executed >= count
+            if done.all():
+                self._finish(group, address)
+                return None
+            elif done.any():
+                self._finish(group.select(done), address)
+                group = group.select(~done)
+
+        return group
+
+
+    def _queue(self, pending, group, address, stop, count):
+        group = self._settle(group, address, stop, count)
+        if group is not None:
+            pending.setdefault(address, []).append(group)
+
+
+    def _finish(self, group, address, error=None):
+        lanes = group.lanes
+
+        self.addresses[lanes] = address
+        self.executed[lanes] += group.executed
+
+        for lane in lanes.tolist():
+            self.errors[lane] = error
+
+        for name in set(self.registers) | set(group.registers):
+            column = group.registers.get(name)
+            if column is None:
+                column = numpy.zeros(len(group), numpy.uint64)
+
+            registers = self.registers.get(name)
+            if registers is None:
+                registers = numpy.zeros(self.count, column.dtype)
+            elif column.dtype == object and registers.dtype != object:
+                registers = registers.astype(object)
+
+            registers[lanes] = column
+            self.registers[name] = registers
+
+
+    def _run_block(self, pending, group, address, stop, count):
+        try:
+            block = self._code.block(address)
+        except EmulationError as error:
+            self._finish(group, address, str(error))
+            return
+
+        for current, next_address, il in block:
+            continuing = []
+            for part, outcome in self._execute(group, il):
+                if isinstance(outcome, str):
+                    error = '{} (at {:#x})'.format(outcome, current)
+                    self._finish(part, current, error)
+                    continue
+
+                part.executed += 1
+                if outcome is None:
+                    continuing.append(part)
+                    continue
+
+                same = outcome == next_address
+                if same.all():
+                    continuing.append(part)
+                    continue
+                elif same.any():
+                    continuing.append(part.select(same))
+
+                for target in numpy.unique(outcome[~same]).tolist():
+                    self._queue(pending, part.select(outcome == target),
+                                target, stop, count)
+
+            if not continuing:
+                return
+
+            group = self._settle(
+                _merge(continuing), next_address, stop, count)
+            if group is None:
+                return
+
+            group.temporaries = dict()
+
+        pending.setdefault(next_address, []).append(group)
+
+
+    def _execute(self, group, il):
+        # runs the IL of one native instruction, returning a list of the
+        # groups it splits into, each with None if it runs off the end of
+        # the IL, the target of a jump, or why an IL instruction failed.
+        results = []
+        work = [(group, 0)]
+        while work:
+            group, n = work.pop()
+            while n < len(il):
+                opcode, a, b, o = il[n]
+                n += 1
+
+                if opcode == definitions.JCC:
+                    taken = _truth(group.value(a))
+                    if taken is False:
+                        continue
+                    elif taken is not True:
+                        work.append((group.select(~taken), n))
+                        group = group.select(taken)
+
+                    if o[0] == OFFSET:
+                        n = o[1]
+                        continue
+
+                    results.append((group, group.column(o)))
+                    group = None
+                    break
+
+                fault = _operations[opcode](self, group, a, b, o)
+                if fault is not None:
+                    faults, message = fault
+                    if faults.all():
+                        results.append((group, message))
+                        group = None
+                        break
+
+                    # the other states run the instruction again
+                    results.append((group.select(faults), message))
+                    group = group.select(~faults)
+                    n -= 1
+
+            if group is not None:
+                results.append((group, None))
+
+        return results
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.emulator.memory
+
+This module contains the memory model used by the emulator, a sparse
+byte-addressed store that is allocated one page at a time as it is
+written. Memory that has never been written reads as zero.
+
+Multi-byte values are little-endian, and addresses are unbounded; it is
+up to the caller to wrap them at the size of the address space.
+"""
+
+page_bits = 12
+page_size = 1 << page_bits
+
+_offset_mask = page_size - 1
+
+
+class Memory(object):
+    """Sparse memory made up of bytearray pages.
+
+    Attributes:
+        pages (dict): The page for each page number that has been
+    written or mapped, where the page number is the address shifted
+    right by page_bits.
+    """
+
+    __slots__ = ['pages']
+
+
+    def __init__(self):
+        self.pages = dict()
+
+
+    def _page(self, number):
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = bytearray(page_size)
+
+        return page
+
+
+    def mapped(self, address):
+        """True if the page holding address has been written or mapped."""
+
+        return (address >> page_bits) in self.pages
+
+
+    def map(self, address, length):
+        """Allocate the pages covering a range of addresses, so that they
+        count as mapped even if they are never written.
+        """
+
+        first = address >> page_bits
+        last = (address + length - 1) >> page_bits
+        for number in range(first, last + 1):
+            self._page(number)
+
+
+    def read(self, address, length):
+        """Return length bytes of memory starting at address."""
+
+        offset = address & _offset_mask
+        if offset + length <= page_size:
+            page = self.pages.get(address >> page_bits)
+            if page is None:
+                return bytes(length)
+
+            return bytes(page[offset:offset + length])
+
+        chunks = []
+        while length > 0:
+            count = min(length, page_size - offset)
+            page = self.pages.get(address >> page_bits)
+            if page is None:
+                chunks.append(bytes(count))
+            else:
+                chunks.append(bytes(page[offset:offset + count]))
+
+            address += count
+            length -= count
+            offset = 0
+
+        return b''.join(chunks)
+
+
+    def write(self, address, data):
+        """Write a bytes-like object to memory starting at address."""
+
+        offset = address & _offset_mask
+        length = len(data)
+        if offset + length <= page_size:
+            self._page(address >> page_bits)[offset:offset + length] = data
+            return
+
+        data = memoryview(data)
+        while data:
+            count = min(len(data), page_size - offset)
+            self._page(address >> page_bits)[offset:offset + count] = data[:count]
+
+            address += count
+            data = data[count:]
+            offset = 0
+
+
+    def load(self, address, length):
+        """Return the unsigned value of length bytes starting at address."""
+
+        offset = address & _offset_mask
+        if offset + length <= page_size:
+            page = self.pages.get(address >> page_bits)
+            if page is None:
+                return 0
+
+            return int.from_bytes(page[offset:offset + length], 'little')
+
+        return int.from_bytes(self.read(address, length), 'little')
+
+
+    def store(self, address, length, value):
+        """Store an unsigned value that fits in length bytes starting at
+        address.
+        """
+
+        offset = address & _offset_mask
+        if offset + length <= page_size:
+            page = self._page(address >> page_bits)
+            page[offset:offset + length] = value.to_bytes(length, 'little')
+            return
+
+        self.write(address, value.to_bytes(length, 'little'))
+
+
+class Overlay(Memory):
+    """Memory that starts out as a copy of another, sharing its pages until
+    they are first written, so that many copies of a large memory are
+    cheap. The memory that is copied must not be written while the copy is
+    in use.
+
+    Args:
+        memory (Memory): The memory to copy.
+    """
+
+    __slots__ = ['_owned']
+
+
+    def __init__(self, memory):
+        Memory.__init__(self)
+
+        self.pages.update(memory.pages)
+        self._owned = set()
+
+
+    def _page(self, number):
+        if number in self._owned:
+            return self.pages[number]
+
+        page = self.pages.get(number)
+        if page is None:
+            page = bytearray(page_size)
+        else:
+            page = bytearray(page)
+
+        self.pages[number] = page
+        self._owned.add(number)
+
+        return page
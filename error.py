@@ -18,7 +18,7 @@
 reil.error
 
 This module contains exception definitions for various generic error
-conditions that can occur during translation.
+conditions that can occur during translation and emulation.
 """
 
 # TODO: better, less generic error types...
@@ -28,4 +28,12 @@ class TranslationError(Exception):
 
 
 class IllegalInstruction(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class FileFormatError(Exception):
+    pass
+
+
+class EmulationError(Exception):
+    pass
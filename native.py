@@ -35,4 +35,50 @@ class Instruction(object):
         self.size = size
 
     def __str__(self):
-        return '{:08x} {:1} {}'.format(self.address, self.ends_basic_block, self.mnemonic)
\ No newline at end of file
+        return '{:08x} {:1} {}'.format(self.address, self.ends_basic_block, self.mnemonic)
+
+
+_il_instructions = Instruction.il_instructions
+
+
+class LazyInstruction(Instruction):
+    """Native instruction whose IL is only translated when il_instructions
+    is first read. This is what the translators produce when called with
+    lazy=True, for consumers that mostly only need the addresses, sizes
+    and mnemonics. Lazy translation can't be combined with a translation
+    cache, which always holds the translated IL.
+
+    Args:
+        translate (callable): Called with no arguments to produce the IL.
+    """
+
+    __slots__ = ['_translate']
+
+    def __init__(self, address, mnemonic, translate, ends_basic_block=False, size=0):
+        Instruction.__init__(self, address, mnemonic, None, ends_basic_block, size)
+        self._translate = translate
+
+    @property
+    def il_instructions(self):
+        if self._translate is not None:
+            _il_instructions.__set__(self, self._translate())
+            self._translate = None
+        return _il_instructions.__get__(self)
+
+    @il_instructions.setter
+    def il_instructions(self, value):
+        self._translate = None
+        _il_instructions.__set__(self, value)
+
+
+class BasicBlock(object):
+
+    __slots__ = ['start', 'end', 'instructions']
+
+    def __init__(self, start, end, instructions):
+        self.start = start
+        self.end = end
+        self.instructions = instructions
+
+    def __str__(self):
+        return '{:08x}-{:08x}'.format(self.start, self.end)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.optimize - IL optimisation passes
+
+This module contains passes that simplify the IL produced by the
+translators without changing its meaning, so that it is faster to
+emulate and analyse.
+
+Each pass takes the IL of a single native instruction, as a list of
+reil.definitions.Instruction, and returns a new list; the instructions
+and operands in the original list are left unchanged. The passes rely on
+two conventions that all of the translators follow: temporary registers
+are local to the IL of one native instruction, and an OffsetOperand jump
+target is an index into that same IL.
+
+.. REIL language specification:
+    http://www.zynamics.com/binnavi/manual/html/reil_language.htm
+"""
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.optimize.constant_folding
+
+This module contains a pass that evaluates IL instructions whose inputs
+are all immediates, and carries the results on to the instructions that
+read them. Along the way it simplifies operations that turn out to leave
+their input unchanged, such as masking a value with all ones or adding
+zero, and removes conditional jumps whose condition is known.
+
+Values are computed at the sizes of the operands involved, in the same
+way as an emulator would: inputs are taken modulo their size, signed
+operations interpret their inputs at their own size, and results are
+truncated to the size of the output.
+
+fold_constants works on the IL of one native instruction, so it can be
+applied to each instruction as it comes out of the translator, or later
+to whole blocks with fold_constants_block.
+"""
+
+import reil.definitions as definitions
+import reil.optimize.utilities as utilities
+from reil.shorthand import imm
+
+
+_max_iterations = 4
+
+
+def _mask(size):
+    return (1 << size) - 1
+
+
+def _value(operand):
+    return operand.value & _mask(operand.size)
+
+
+def _signed(operand):
+    value = _value(operand)
+    if value >> (operand.size - 1):
+        value -= 1 << operand.size
+    return value
+
+
+def _sdiv(a, b):
+    quotient = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        quotient = -quotient
+    return quotient
+
+
+def _clz(a):
+    return a.size - _value(a).bit_length()
+
+
+def _ctz(a):
+    value = _value(a)
+    if value == 0:
+        return a.size
+    return (value & -value).bit_length() - 1
+
+
+def _bsh(a, b):
+    shift = _signed(b)
+    if shift >= 0:
+        return _value(a) << shift
+    return _value(a) >> -shift
+
+
+_binary = {
+    definitions.ADD:    lambda a, b: _value(a) + _value(b),
+    definitions.AND:    lambda a, b: _value(a) & _value(b),
+    definitions.ASHR:   lambda a, b: _signed(a) >> _value(b),
+    definitions.BSH:    _bsh,
+    definitions.DIV:    lambda a, b: _value(a) // _value(b),
+    definitions.EQU:    lambda a, b: int(_value(a) == _value(b)),
+    definitions.LSHL:   lambda a, b: _value(a) << _value(b),
+    definitions.LSHR:   lambda a, b: _value(a) >> _value(b),
+    definitions.MOD:    lambda a, b: _value(a) % _value(b),
+    definitions.MUL:    lambda a, b: _value(a) * _value(b),
+    definitions.OR:     lambda a, b: _value(a) | _value(b),
+    definitions.SDIV:   lambda a, b: _sdiv(_signed(a), _signed(b)),
+    definitions.SUB:    lambda a, b: _value(a) - _value(b),
+    definitions.XOR:    lambda a, b: _value(a) ^ _value(b),
+}
+
+_unary = {
+    definitions.BISNZ:  lambda a: int(_value(a) != 0),
+    definitions.BISZ:   lambda a: int(_value(a) == 0),
+    definitions.CLZ:    _clz,
+    definitions.CTZ:    _ctz,
+    definitions.POPCNT: lambda a: bin(_value(a)).count('1'),
+    definitions.SEX:    _signed,
+    definitions.STR:    _value,
+}
+
+_division = frozenset([
+    definitions.DIV,
+    definitions.MOD,
+    definitions.SDIV,
+])
+
+# shifts larger than this are computed without building huge integers
+_max_shift = 0x400
+
+
+def _evaluate(ri):
+    # return the value written by ri if it can be computed, or None.
+
+    if ri.opcode in _unary:
+        if utilities.is_constant(ri.input0):
+            return _unary[ri.opcode](ri.input0) & _mask(ri.output.size)
+
+    elif ri.opcode in _binary:
+        a, b = ri.input0, ri.input1
+        if not utilities.is_constant(a) or not utilities.is_constant(b):
+            return None
+
+        if ri.opcode in _division and _value(b) == 0:
+            return None
+
+        if ri.opcode == definitions.LSHL and _value(b) > _max_shift:
+            return 0
+
+        if (ri.opcode in (definitions.LSHR, definitions.ASHR) and
+                _value(b) > _max_shift):
+            b = imm(_max_shift, b.size)
+
+        return _binary[ri.opcode](a, b) & _mask(ri.output.size)
+
+    return None
+
+
+# operations that leave an input unchanged when the other input is a
+# particular constant, as opcode: (constant, commutative)
+_identities = {
+    definitions.ADD:    (0, True),
+    definitions.OR:     (0, True),
+    definitions.XOR:    (0, True),
+    definitions.MUL:    (1, True),
+    definitions.SUB:    (0, False),
+    definitions.LSHL:   (0, False),
+    definitions.LSHR:   (0, False),
+    definitions.DIV:    (1, False),
+}
+
+
+def _simplify(ri):
+    # rewrite ri into a cheaper instruction with the same effect, or
+    # return None if there isn't one.
+
+    opcode, a, b, output = ri.opcode, ri.input0, ri.input1, ri.output
+
+    if opcode in _identities:
+        identity, commutative = _identities[opcode]
+        if utilities.is_constant(b) and _value(b) == identity:
+            return definitions.Instruction(definitions.STR, a, None, output)
+
+        if (commutative and utilities.is_constant(a) and
+                _value(a) == identity):
+            return definitions.Instruction(definitions.STR, b, None, output)
+
+    elif opcode == definitions.ASHR:
+        if utilities.is_constant(b) and _value(b) == 0:
+            return definitions.Instruction(definitions.SEX, a, None, output)
+
+    elif opcode == definitions.AND:
+        if utilities.is_constant(a):
+            a, b = b, a
+
+        if utilities.is_constant(b):
+            # the result only has as many bits as the smaller of the other
+            # input and the output, so the mask only needs to cover those.
+            size = min(a.size, output.size)
+            if _value(b) & _mask(size) == _mask(size):
+                return definitions.Instruction(
+                    definitions.STR, a, None, output)
+
+            if _value(b) & _mask(size) == 0:
+                return definitions.Instruction(
+                    definitions.STR, imm(0, output.size), None, output)
+
+    if opcode == definitions.MUL:
+        if ((utilities.is_constant(a) and _value(a) == 0) or
+                (utilities.is_constant(b) and _value(b) == 0)):
+            return definitions.Instruction(
+                definitions.STR, imm(0, output.size), None, output)
+
+    return None
+
+
+def _fold(ris):
+    leaders = utilities.leaders(ris)
+    output = []
+    constants = dict()
+    removed = set()
+    changed = False
+
+    for n, ri in enumerate(ris):
+        if leaders[n]:
+            constants.clear()
+
+        written = utilities.writes(ri)
+
+        # replace reads of known values with immediates of the same size,
+        # which behave identically in every operand slot.
+        operands = [ri.input0, ri.input1, ri.output]
+        slots = (0, 1) if written is not None else (0, 1, 2)
+
+        replaced = False
+        for slot in slots:
+            operand = operands[slot]
+            if utilities.is_variable(operand) and operand.name in constants:
+                operands[slot] = imm(
+                    constants[operand.name] & _mask(operand.size),
+                    operand.size)
+                replaced = True
+
+        if replaced:
+            ri = definitions.Instruction(ri.opcode, *operands)
+
+        if written is not None:
+            value = _evaluate(ri)
+            if value is not None:
+                constants[written.name] = value
+                if ri.opcode != definitions.STR or ri.input0.size != written.size:
+                    ri = definitions.Instruction(
+                        definitions.STR, imm(value, written.size), None, written)
+                    replaced = True
+            else:
+                constants.pop(written.name, None)
+                simplified = _simplify(ri)
+                if simplified is not None:
+                    ri = simplified
+                    replaced = True
+
+        elif ri.opcode == definitions.JCC:
+            if ((utilities.is_constant(ri.input0) and
+                    _value(ri.input0) == 0) or
+                    (isinstance(ri.output, definitions.OffsetOperand) and
+                     ri.output.offset == n + 1)):
+                # never taken, or goes where it would anyway
+                removed.add(n)
+
+        if (ri.opcode == definitions.STR and
+                utilities.is_variable(ri.input0) and
+                ri.input0.name == ri.output.name and
+                ri.input0.size == ri.output.size):
+            removed.add(n)
+
+        changed = changed or replaced
+        output.append(ri)
+
+    return output, removed, changed
+
+
+def fold_constants(ris):
+    """Evaluate the constant parts of the IL of a native instruction.
+
+    Args:
+        ris (list): The IL instructions of one native instruction.
+
+    Returns:
+        A new list of IL instructions with the same effect.
+    """
+
+    for _ in range(_max_iterations):
+        count = len(ris)
+
+        ris, removed, changed = _fold(ris)
+        ris = utilities.remove(ris, removed)
+        ris = utilities.remove(ris, utilities.unreachable(ris))
+        ris = utilities.remove_dead(ris)
+
+        if not changed and len(ris) == count:
+            break
+
+    return ris
+
+
+def fold_constants_block(instructions):
+    """Apply fold_constants to each native instruction in a list, in
+    place, and return the list.
+    """
+
+    return utilities.apply_to_block(fold_constants, instructions)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.optimize.copy_propagation
+
+This module contains a pass that removes the chains of str instructions
+through temporaries that the operand helpers emit, such as reading a
+register into a temporary and then copying that into another temporary
+to truncate or extend it.
+
+It works in two directions. Reads of a temporary that holds a copy of
+another operand are replaced by reads of that operand, and a str from a
+temporary is folded into the instruction that computed the temporary, by
+having that instruction write to the str's output directly. Either way
+the str is left with no readers, and is then removed.
+"""
+
+import reil.definitions as definitions
+import reil.optimize.utilities as utilities
+from reil.shorthand import imm
+
+
+# operand slots (0 for input0, 1 for input1 and 2 for output) whose size
+# changes the result, rather than just limiting the value they hold.
+_sized_slots = {
+    definitions.ASHR:   (0,),
+    definitions.BSH:    (1,),
+    definitions.CLZ:    (0,),
+    definitions.CTZ:    (0,),
+    definitions.MCMP:   (0, 1),
+    definitions.MCPY:   (1,),
+    definitions.MSET:   (0, 1),
+    definitions.SDIV:   (0, 1),
+    definitions.SEX:    (0,),
+    definitions.STM:    (0,),
+    definitions.VADD:   (0,),
+    definitions.VEQU:   (0,),
+    definitions.VMAXU:  (0,),
+    definitions.VMINU:  (0,),
+    definitions.VSGT:   (0,),
+    definitions.VSHUF:  (0,),
+    definitions.VSUB:   (0,),
+}
+
+# opcodes whose result is always 0 or 1
+_boolean = frozenset([
+    definitions.BISNZ,
+    definitions.BISZ,
+    definitions.EQU,
+])
+
+_max_iterations = 4
+
+
+def _mask(size):
+    return (1 << size) - 1
+
+
+def _replacement(source, temporary, operand, sized):
+    # source was copied into temporary, and operand is a read of the same
+    # temporary, which may be at a different size.
+
+    if utilities.is_constant(source):
+        size = min(source.size, temporary.size, operand.size)
+        if source.size == operand.size and size == operand.size:
+            return source
+        return imm(source.value & _mask(size), operand.size)
+
+    if isinstance(source, definitions.ImmediateOperand):
+        # a relocation has to be kept as it is to stay relocatable
+        if source.size == operand.size <= temporary.size:
+            return source
+        return None
+
+    if sized:
+        if source.size == operand.size <= temporary.size:
+            return source
+        return None
+
+    if source.size <= min(temporary.size, operand.size):
+        return source
+
+    return None
+
+
+def _forward(ris):
+    leaders = utilities.leaders(ris)
+    output = []
+    copies = dict()
+    changed = False
+
+    for n, ri in enumerate(ris):
+        if leaders[n]:
+            copies.clear()
+
+        operands = [ri.input0, ri.input1, ri.output]
+        sized = _sized_slots.get(ri.opcode, ())
+        slots = (0, 1) if utilities.writes(ri) is not None else (0, 1, 2)
+
+        replaced = False
+        for slot in slots:
+            operand = operands[slot]
+            if not utilities.is_temporary(operand) or operand.name not in copies:
+                continue
+
+            source, temporary = copies[operand.name]
+            replacement = _replacement(
+                source, temporary, operand, slot in sized)
+
+            if replacement is not None:
+                operands[slot] = replacement
+                replaced = True
+
+        if replaced:
+            ri = definitions.Instruction(ri.opcode, *operands)
+            changed = True
+
+        output.append(ri)
+
+        written = utilities.writes(ri)
+        if written is None:
+            continue
+
+        # forget any copies that this instruction overwrites
+        for name, (source, temporary) in list(copies.items()):
+            if (temporary.name == written.name or
+                    (utilities.is_variable(source) and
+                     source.name == written.name)):
+                del copies[name]
+
+        if (ri.opcode == definitions.STR and
+                utilities.is_temporary(written) and
+                not (utilities.is_variable(ri.input0) and
+                     ri.input0.name == written.name)):
+            copies[written.name] = (ri.input0, written)
+
+    return output, changed
+
+
+def _foldable(ri, temporary, read, target):
+    # can ri, which writes temporary, write target instead, given that
+    # target = temporary is later read at size read.
+
+    if ri.opcode in _boolean:
+        return True
+
+    if ri.opcode == definitions.LDM:
+        return temporary.size == read.size == target.size
+
+    if ri.opcode == definitions.UNDEF:
+        return False
+
+    size = target.size
+    if ri.opcode == definitions.STR:
+        size = min(ri.input0.size, target.size)
+
+    return size <= min(temporary.size, read.size)
+
+
+def _coalesce(ris):
+    leaders = utilities.leaders(ris)
+    after = utilities.liveness(ris)
+    ris = list(ris)
+    touched = set()
+    removed = set()
+
+    for j, ri in enumerate(ris):
+        if (ri.opcode != definitions.STR or
+                not utilities.is_temporary(ri.input0) or
+                not utilities.is_variable(ri.output) or
+                ri.input0.name in after[j][0]):
+            continue
+
+        read = ri.input0
+        target = ri.output
+
+        # look back through the region for the instruction that wrote the
+        # temporary, making sure that nothing in between uses it, or uses
+        # the register that we're going to write to earlier.
+        i = j - 1
+        while i >= 0 and not leaders[i + 1] and i not in touched:
+            previous = ris[i]
+            written = utilities.writes(previous)
+
+            if written is not None and written.name == read.name:
+                break
+
+            names = set(operand.name for operand in utilities.reads(previous))
+            if written is not None:
+                names.add(written.name)
+
+            if read.name in names or target.name in names:
+                i = -1
+                break
+
+            i -= 1
+        else:
+            continue
+
+        if i < 0 or not _foldable(ris[i], ris[i].output, read, target):
+            continue
+
+        previous = ris[i]
+        ris[i] = definitions.Instruction(
+            previous.opcode, previous.input0, previous.input1, target)
+
+        touched.update(range(i, j + 1))
+        removed.add(j)
+
+    return utilities.remove(ris, removed), bool(removed)
+
+
+def propagate_copies(ris):
+    """Remove the copies through temporaries in the IL of a native
+    instruction.
+
+    Args:
+        ris (list): The IL instructions of one native instruction.
+
+    Returns:
+        A new list of IL instructions with the same effect.
+    """
+
+    for _ in range(_max_iterations):
+        count = len(ris)
+
+        ris, forward = _forward(ris)
+        ris, backward = _coalesce(ris)
+        ris = utilities.remove_dead(ris)
+
+        if not forward and not backward and len(ris) == count:
+            break
+
+    return ris
+
+
+def propagate_copies_block(instructions):
+    """Apply propagate_copies to each native instruction in a list, in
+    place, and return the list.
+    """
+
+    return utilities.apply_to_block(propagate_copies, instructions)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.optimize.dead_flags
+
+This module contains a pass that removes flag computations whose result
+is never read. Most arithmetic instructions set every flag, and most of
+those flags are set again by the next arithmetic instruction before
+anything looks at them.
+
+The pass works backwards through a basic block, tracking which registers
+will certainly be written before they are next read. By default nothing
+is assumed about the code after the block, so the flags set by the last
+instruction that sets them are always kept; remove_dead_flags_cfg uses
+the blocks that follow each block to do better.
+
+The IL doesn't model faults, so a flag that would only be seen by an
+exception handler, for example one raised by a division by zero later in
+the block, is treated as dead.
+"""
+
+import reil.definitions as definitions
+import reil.optimize.utilities as utilities
+
+
+FLAGS = frozenset([
+    # x86
+    'af', 'cf', 'df', 'of', 'pf', 'sf', 'zf',
+    # arm and arm64
+    'c', 'n', 'v', 'z',
+])
+"""The names of the flag registers for each architecture."""
+
+
+def _exits_to_next(ni):
+    # True if every jump out of the IL of ni goes to the next native
+    # instruction, as with the rep prefix.
+
+    next_address = ni.address + ni.size
+
+    for ri in ni.il_instructions:
+        if (ri.opcode == definitions.JCC and
+                not isinstance(ri.output, definitions.OffsetOperand) and
+                not (isinstance(ri.output, definitions.ImmediateOperand) and
+                     ri.output.value == next_address)):
+            return False
+
+    return True
+
+
+def _remove_flags(ris, dead_out, flags):
+    dead = set()
+    for n, (_, dead_after) in enumerate(utilities.liveness(ris, dead_out)):
+        ri = ris[n]
+        output = utilities.writes(ri)
+        if (output is not None and output.name in flags and
+                output.name in dead_after and
+                not utilities.has_side_effects(ri)):
+            dead.add(n)
+
+    if not dead:
+        return ris
+
+    return utilities.remove_dead(utilities.remove(ris, dead))
+
+
+def _block_dead_in(instructions, dead_out, flags=None):
+    # dead registers at the start of a block, given those at the end;
+    # if flags is given, also remove the dead writes to them in place.
+
+    dead = frozenset(dead_out)
+
+    for n in reversed(range(len(instructions))):
+        ni = instructions[n]
+
+        if n != len(instructions) - 1 and not _exits_to_next(ni):
+            dead = frozenset()
+
+        if flags is not None:
+            ni.il_instructions = _remove_flags(ni.il_instructions, dead, flags)
+
+        dead = frozenset(utilities.dead_on_entry(ni.il_instructions, dead))
+
+    return dead
+
+
+def remove_dead_flags(instructions, dead_out=frozenset(), flags=FLAGS):
+    """Remove the flag computations in a basic block whose results are
+    overwritten before they are read, in place.
+
+    Args:
+        instructions (list): The native instructions of the block.
+        dead_out (set, optional): The names of the registers that are
+    known to be written before they are read after the block.
+        flags (set, optional): The names of the registers to remove
+    writes to.
+
+    Returns:
+        The list of native instructions.
+    """
+
+    _block_dead_in(instructions, dead_out, flags)
+    return instructions
+
+
+def _successors(block):
+    # the start addresses of the blocks that can follow block, or None if
+    # they aren't all known.
+
+    last = block.instructions[-1]
+    ris = last.il_instructions
+    targets = []
+
+    # find out whether the IL can fall off the end, treating the jumps
+    # out of it as dead ends.
+    falls_through = not ris
+    reached = set()
+    pending = [0]
+    while pending:
+        n = pending.pop()
+        if n >= len(ris):
+            falls_through = True
+            continue
+
+        if n in reached:
+            continue
+
+        reached.add(n)
+        ri = ris[n]
+
+        if (ri.opcode != definitions.JCC or
+                isinstance(ri.output, definitions.OffsetOperand)):
+            pending.extend(utilities.successors(ris, n))
+            continue
+
+        if not isinstance(ri.output, definitions.ImmediateOperand):
+            return None
+
+        targets.append(ri.output.value)
+        if not (utilities.is_constant(ri.input0) and ri.input0.value != 0):
+            pending.append(n + 1)
+
+    if falls_through:
+        targets.append(block.end)
+
+    return targets
+
+
+def remove_dead_flags_cfg(blocks, flags=FLAGS):
+    """Remove dead flag computations from a set of basic blocks, in
+    place, using the control flow between them.
+
+    The successors of a block are found from the jumps at its end. If a
+    block can continue at an address where none of the blocks start, or
+    through an indirect jump, nothing is assumed about the registers
+    there.
+
+    Args:
+        blocks (list): The native.BasicBlock objects to optimise.
+        flags (set, optional): The names of the registers to remove
+    writes to.
+
+    Returns:
+        The list of blocks.
+    """
+
+    blocks = [block for block in blocks if block.instructions]
+    starts = dict((block.start, block) for block in blocks)
+    successors = dict((block.start, _successors(block)) for block in blocks)
+
+    universe = set(flags)
+    for block in blocks:
+        for ni in block.instructions:
+            for ri in ni.il_instructions:
+                for operand in (ri.input0, ri.input1, ri.output):
+                    if (utilities.is_variable(operand) and
+                            not utilities.is_temporary(operand)):
+                        universe.add(operand.name)
+
+    universe = frozenset(universe)
+    dead_in = dict((block.start, universe) for block in blocks)
+
+    def dead_out(block):
+        targets = successors[block.start]
+        if targets is None:
+            return frozenset()
+
+        dead = universe
+        for target in targets:
+            dead = dead & dead_in.get(target, frozenset())
+        return dead
+
+    changed = True
+    while changed:
+        changed = False
+
+        for block in reversed(blocks):
+            dead = _block_dead_in(block.instructions, dead_out(block))
+            if dead != dead_in[block.start]:
+                dead_in[block.start] = dead
+                changed = True
+
+    for block in blocks:
+        _block_dead_in(block.instructions, dead_out(block), flags)
+
+    return blocks
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+"""reil.optimize.peephole
+
+This module contains a peephole pass, which looks for short sequences of
+IL instructions that match a known idiom and replaces them with fewer or
+cheaper instructions.
+
+The translators often compute a result at twice the word size and then
+mask it back down, so that the carry out of the operation is available:
+
+    add (base, 64), (disp, 64), (t0, 128)
+    and (t0, 128), (0xffffffffffffffff, 128), (t1, 64)
+
+When nothing else reads the wide temporary the carry can never be seen,
+and since the low bits of a sum, difference, product, left shift or
+bitwise operation only depend on the low bits of the inputs, the pair can
+be replaced by a single operation into the narrow output:
+
+    add (base, 64), (disp, 64), (t1, 64)
+
+The idioms are listed in PATTERNS, which can be extended with further
+patterns. A pattern is a function taking the IL, the index of the first
+instruction to try, and a dictionary with the number of times each
+temporary is read and written, and returning None if it doesn't match, or
+a tuple (count, replacement) to replace the count instructions starting
+at that index with the list of instructions replacement, which must not
+be longer. A pattern only ever sees instructions that run in sequence;
+the pass doesn't try one where a jump lands part way through.
+"""
+
+import reil.definitions as definitions
+import reil.optimize.utilities as utilities
+
+
+# operations whose low n bits of output only depend on the low n bits of
+# their inputs (and for shifts, on the shift amount)
+NARROWABLE = frozenset([
+    definitions.ADD,
+    definitions.AND,
+    definitions.LSHL,
+    definitions.MUL,
+    definitions.OR,
+    definitions.STR,
+    definitions.SUB,
+    definitions.XOR,
+])
+
+
+def _mask_width(operand):
+    # number of low bits kept by an and with operand, or None if operand
+    # isn't a constant of the form 2**n - 1
+    if not utilities.is_constant(operand):
+        return None
+
+    value = operand.value & ((1 << operand.size) - 1)
+    width = value.bit_length()
+    if value != (1 << width) - 1:
+        return None
+
+    return width
+
+
+def _narrowed(ri, wide, narrow, counts):
+    # ri writes the temporary wide, which is only read to produce narrow.
+    # If nothing of wide beyond the bits that end up in narrow can be
+    # seen, return ri writing narrow directly.
+
+    if (ri.opcode not in NARROWABLE or
+            not utilities.is_temporary(wide) or ri.output != wide or
+            wide.size < narrow.size or
+            counts.get(wide.name) != (1, 1)):
+        return None
+
+    return definitions.Instruction(ri.opcode, ri.input0, ri.input1, narrow)
+
+
+def masked_result(ris, n, counts):
+    """op (a), (b), (t0, 2n); and (t0, 2n), (2**n - 1), (t1, n)
+    becomes op (a), (b), (t1, n)
+    """
+
+    if n + 1 >= len(ris) or ris[n + 1].opcode != definitions.AND:
+        return None
+
+    ri = ris[n]
+    mask = ris[n + 1]
+
+    if mask.input0 == ri.output:
+        width = _mask_width(mask.input1)
+    elif mask.input1 == ri.output:
+        width = _mask_width(mask.input0)
+    else:
+        return None
+
+    if width is None or mask.output.size > width:
+        return None
+
+    narrow = _narrowed(ri, ri.output, mask.output, counts)
+    if narrow is None:
+        return None
+
+    return (2, [narrow])
+
+
+def truncated_result(ris, n, counts):
+    """op (a), (b), (t0, 2n); str (t0, 2n), (t1, n)
+    becomes op (a), (b), (t1, n)
+    """
+
+    if n + 1 >= len(ris) or ris[n + 1].opcode != definitions.STR:
+        return None
+
+    ri = ris[n]
+    truncate = ris[n + 1]
+
+    if truncate.input0 != ri.output:
+        return None
+
+    narrow = _narrowed(ri, ri.output, truncate.output, counts)
+    if narrow is None:
+        return None
+
+    return (2, [narrow])
+
+
+PATTERNS = [
+    masked_result,
+    truncated_result,
+]
+
+
+def _counts(ris):
+    # map from the name of each temporary to (reads, writes)
+    reads = dict()
+    writes = dict()
+
+    for ri in ris:
+        for operand in utilities.reads(ri):
+            if utilities.is_temporary(operand):
+                reads[operand.name] = reads.get(operand.name, 0) + 1
+
+        output = utilities.writes(ri)
+        if output is not None and utilities.is_temporary(output):
+            writes[output.name] = writes.get(output.name, 0) + 1
+
+    return dict((name, (reads.get(name, 0), writes.get(name, 0)))
+                for name in set(reads) | set(writes))
+
+
+def apply_patterns(ris, patterns=None):
+    """Replace the idioms in the IL of a native instruction.
+
+    Args:
+        ris (list): The IL instructions of one native instruction.
+        patterns (list, optional): The patterns to look for, defaults to
+    PATTERNS.
+
+    Returns:
+        A new list of IL instructions with the same effect.
+    """
+
+    if patterns is None:
+        patterns = PATTERNS
+
+    ris = list(ris)
+    leaders = utilities.leaders(ris)
+    counts = _counts(ris)
+    removed = set()
+
+    n = 0
+    while n < len(ris):
+        for pattern in patterns:
+            match = pattern(ris, n, counts)
+            if match is None:
+                continue
+
+            count, replacement = match
+            if (len(replacement) > count or
+                    any(leaders[n + 1:n + count])):
+                continue
+
+            ris[n:n + len(replacement)] = replacement
+            removed.update(range(n + len(replacement), n + count))
+
+            # later patterns need to see the new number of uses
+            counts = _counts(ris[:n + len(replacement)] + ris[n + count:])
+            n += count - 1
+            break
+
+        n += 1
+
+    return utilities.remove(ris, removed)
+
+
+def apply_patterns_block(instructions):
+    """Apply apply_patterns to each native instruction in a list, in
+    place, and return the list.
+    """
+
+    return utilities.apply_to_block(apply_patterns, instructions)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.optimize.renumber
+
+This module contains a pass that renumbers the temporaries in the IL of
+a native instruction, so that temporaries whose values are never needed
+at the same time share a number.
+
+The translators hand out a new temporary every time one is needed, so
+the long expansions end up using dozens of them. After renumbering, the
+temporaries of each size are numbered consecutively, smallest size
+first, and the number of temporaries of each size is the most that are
+ever live at once; an emulator can keep them in a small array instead of
+a dictionary.
+
+Temporaries of different sizes are never given the same number, so the
+result is also correct for consumers that only look at the names of
+operands.
+"""
+
+import reil.definitions as definitions
+import reil.optimize.utilities as utilities
+from reil.shorthand import t
+
+
+def _interference(ris):
+    # map from the name of each temporary to the names of the temporaries
+    # that it can't share a number with.
+
+    edges = dict()
+
+    after = utilities.liveness(ris)
+    for n, ri in enumerate(ris):
+        output = utilities.writes(ri)
+        if output is None or not utilities.is_temporary(output):
+            continue
+
+        # a write clobbers anything else that is still needed
+        edges.setdefault(output.name, set())
+        for name in after[n][0]:
+            edges[output.name].add(name)
+            edges.setdefault(name, set()).add(output.name)
+
+    # temporaries that are read before they are written have to be kept
+    # apart from each other as well
+    live = utilities.live_on_entry(ris)
+    for name in live:
+        edges.setdefault(name, set()).update(live)
+
+    return edges
+
+
+def renumber_temporaries(ris):
+    """Renumber the temporaries in the IL of a native instruction.
+
+    Args:
+        ris (list): The IL instructions of one native instruction.
+
+    Returns:
+        A new list of IL instructions with the same effect.
+    """
+
+    # each temporary in order of first appearance, with the largest size
+    # that it is used at
+    sizes = dict()
+    for ri in ris:
+        for operand in (ri.input0, ri.input1, ri.output):
+            if utilities.is_temporary(operand):
+                sizes[operand.name] = max(
+                    operand.size, sizes.get(operand.name, 0))
+
+    if not sizes:
+        return list(ris)
+
+    order = []
+    seen = set()
+    for ri in ris:
+        for operand in (ri.input0, ri.input1, ri.output):
+            if utilities.is_temporary(operand) and operand.name not in seen:
+                seen.add(operand.name)
+                order.append(operand.name)
+
+    edges = _interference(ris)
+
+    # colour each size separately, giving each temporary the lowest
+    # number not used by one that it interferes with.
+    colours = dict()
+    counts = dict()
+    for name in order:
+        size = sizes[name]
+        used = set(colours[other] for other in edges.get(name, ())
+                   if other != name and other in colours and
+                   sizes[other] == size)
+
+        colour = 0
+        while colour in used:
+            colour += 1
+
+        colours[name] = colour
+        counts[size] = max(counts.get(size, 0), colour + 1)
+
+    first = dict()
+    index = 0
+    for size in sorted(counts):
+        first[size] = index
+        index += counts[size]
+
+    numbers = dict(
+        (name, first[sizes[name]] + colours[name]) for name in order)
+
+    def rename(operand):
+        if utilities.is_temporary(operand):
+            return t(numbers[operand.name], operand.size)
+        return operand
+
+    return [definitions.Instruction(
+                ri.opcode, rename(ri.input0), rename(ri.input1),
+                rename(ri.output))
+            for ri in ris]
+
+
+def renumber_temporaries_block(instructions):
+    """Apply renumber_temporaries to each native instruction in a list, in
+    place, and return the list.
+    """
+
+    return utilities.apply_to_block(renumber_temporaries, instructions)
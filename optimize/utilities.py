@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.optimize.utilities
+
+This module contains helpers shared by the optimisation passes, for
+finding the operands that an IL instruction reads and writes and the
+control flow between the IL instructions of one native instruction.
+"""
+
+import reil.definitions as definitions
+from reil.shorthand import off
+
+
+# opcodes that don't write to their output operand; for stm, mcpy and
+# mset it is the address to store to, and for jcc the jump target.
+_no_output = frozenset([
+    definitions.JCC,
+    definitions.MCPY,
+    definitions.MSET,
+    definitions.NOP,
+    definitions.STM,
+    definitions.SYS,
+    definitions.UNKN,
+])
+
+# opcodes that do something other than write to their output operand,
+# and so can't be removed even if the output is never read.
+_side_effects = frozenset([
+    definitions.JCC,
+    definitions.LDM,
+    definitions.MCMP,
+    definitions.MCPY,
+    definitions.MSET,
+    definitions.NOP,
+    definitions.STM,
+    definitions.SYS,
+    definitions.UNKN,
+])
+
+# opcodes after which nothing can be assumed about the registers
+_barriers = frozenset([
+    definitions.SYS,
+    definitions.UNKN,
+])
+
+
+def is_variable(operand):
+    """True if operand is a register or a temporary register."""
+
+    return isinstance(operand, definitions.RegisterOperand)
+
+
+def is_temporary(operand):
+    """True if operand is a temporary register."""
+
+    return isinstance(operand, definitions.TemporaryOperand)
+
+
+def is_constant(operand):
+    """True if operand is an immediate whose value can be used at
+    translation time; relocations are excluded, since their value
+    depends on where the code is loaded.
+    """
+
+    return type(operand) is definitions.ImmediateOperand
+
+
+def is_barrier(ri):
+    """True if ri may read or write any register."""
+
+    return ri.opcode in _barriers
+
+
+def has_side_effects(ri):
+    """True if ri can't be removed even when its output is never read."""
+
+    return ri.opcode in _side_effects
+
+
+def reads(ri):
+    """Return the registers and temporaries that ri reads."""
+
+    operands = [ri.input0, ri.input1]
+    if ri.opcode in _no_output:
+        operands.append(ri.output)
+
+    return [operand for operand in operands if is_variable(operand)]
+
+
+def writes(ri):
+    """Return the register or temporary that ri writes, or None."""
+
+    if ri.opcode in _no_output or not is_variable(ri.output):
+        return None
+
+    return ri.output
+
+
+def successors(ris, n):
+    """Return the indices of the IL instructions that can follow IL
+    instruction n. Leaving the native instruction, either by falling off
+    the end or by jumping to a native address, is index len(ris).
+    """
+
+    ri = ris[n]
+    if ri.opcode != definitions.JCC:
+        return [n + 1]
+
+    if isinstance(ri.output, definitions.OffsetOperand):
+        target = min(ri.output.offset, len(ris))
+    else:
+        target = len(ris)
+
+    if is_constant(ri.input0) and ri.input0.value != 0:
+        return [target]
+
+    return [n + 1, target]
+
+
+def leaders(ris):
+    """Return a list of flags, one per IL instruction, that are True
+    where an instruction can be reached other than from the instruction
+    before it. The instructions from one leader up to the next are a
+    straight-line region, which the passes can treat as a single unit.
+    """
+
+    flags = [False] * (len(ris) + 1)
+    flags[0] = True
+
+    for n, ri in enumerate(ris):
+        if ri.opcode == definitions.JCC:
+            flags[n + 1] = True
+            if isinstance(ri.output, definitions.OffsetOperand):
+                flags[min(ri.output.offset, len(ris))] = True
+
+        elif ri.opcode in _barriers:
+            flags[n + 1] = True
+
+    return flags[:len(ris)]
+
+
+def _transfer(ri, live, dead):
+    # the live temporaries and dead registers before ri, given those after
+
+    live = set(live)
+    dead = set(dead)
+
+    output = writes(ri)
+    if output is not None:
+        if is_temporary(output):
+            live.discard(output.name)
+        else:
+            dead.add(output.name)
+
+    if ri.opcode in _barriers:
+        dead.clear()
+
+    for operand in reads(ri):
+        if is_temporary(operand):
+            live.add(operand.name)
+        else:
+            dead.discard(operand.name)
+
+    return live, dead
+
+
+def liveness(ris, dead_out=frozenset()):
+    """Compute which registers and temporaries are needed after each IL
+    instruction in the IL of a native instruction.
+
+    Temporaries are tracked as a set of the names that may still be read,
+    and are never live after the native instruction. Registers are
+    tracked the other way around, as a set of the names that will
+    certainly be written before they are read, since everything not
+    mentioned in the IL has to be assumed to be needed.
+
+    Args:
+        ris (list): The IL of one native instruction.
+        dead_out (set, optional): The names of the registers that are
+    known to be dead after the native instruction.
+
+    Returns:
+        A list of (live, dead) pairs of sets of names, one per IL
+    instruction, for the point just after that instruction.
+    """
+
+    count = len(ris)
+
+    # the dead sets start out as every register name in the IL, and
+    # shrink until they are consistent.
+    universe = set(dead_out)
+    for ri in ris:
+        for operand in (ri.input0, ri.input1, ri.output):
+            if is_variable(operand) and not is_temporary(operand):
+                universe.add(operand.name)
+
+    live_in = [set() for _ in range(count)] + [set()]
+    dead_in = [universe] * count + [set(dead_out)]
+    after = [None] * count
+
+    # without any backward jumps, a single pass is enough
+    loops = any(
+        isinstance(ri.output, definitions.OffsetOperand) and
+        ri.output.offset <= n
+        for n, ri in enumerate(ris) if ri.opcode == definitions.JCC)
+
+    changed = True
+    while changed:
+        changed = False
+
+        for n in reversed(range(count)):
+            live = set()
+            dead = None
+            for s in successors(ris, n):
+                live.update(live_in[s])
+                dead = set(dead_in[s]) if dead is None else dead & dead_in[s]
+
+            after[n] = (live, dead)
+
+            live, dead = _transfer(ris[n], live, dead)
+            if live != live_in[n] or dead != dead_in[n]:
+                live_in[n] = live
+                dead_in[n] = dead
+                changed = loops
+
+    return after
+
+
+def live_on_entry(ris):
+    """Return the names of the temporaries that may be read before they
+    are written, from the start of the IL of a native instruction.
+    """
+
+    if not ris:
+        return set()
+
+    live, dead = liveness(ris)[0]
+    return _transfer(ris[0], live, dead)[0]
+
+
+def dead_on_entry(ris, dead_out=frozenset()):
+    """Return the names of the registers that will certainly be written
+    before they are read, from the start of the IL of a native
+    instruction.
+    """
+
+    if not ris:
+        return set(dead_out)
+
+    live, dead = liveness(ris, dead_out)[0]
+    return _transfer(ris[0], live, dead)[1]
+
+
+def unreachable(ris):
+    """Return the set of indices of the IL instructions that can't be
+    reached from the start of the IL.
+    """
+
+    reached = set()
+    pending = [0]
+    while pending:
+        n = pending.pop()
+        if n in reached or n >= len(ris):
+            continue
+
+        reached.add(n)
+        pending.extend(successors(ris, n))
+
+    return set(range(len(ris))) - reached
+
+
+def remove(ris, indices):
+    """Return a copy of ris without the IL instructions at indices,
+    with any REIL offsets adjusted to match. A jump to a removed
+    instruction becomes a jump to the instruction that followed it.
+    """
+
+    if not indices:
+        return list(ris)
+
+    # new index for each old index, including the end of the IL
+    remap = []
+    count = 0
+    for n in range(len(ris) + 1):
+        remap.append(count)
+        if n not in indices:
+            count += 1
+
+    output = []
+    for n, ri in enumerate(ris):
+        if n in indices:
+            continue
+
+        if isinstance(ri.output, definitions.OffsetOperand):
+            ri = definitions.Instruction(
+                ri.opcode, ri.input0, ri.input1,
+                off(remap[min(ri.output.offset, len(ris))]))
+
+        output.append(ri)
+
+    return output
+
+
+def remove_dead(ris):
+    """Return a copy of ris without the IL instructions that only write a
+    temporary that is never read.
+    """
+
+    while True:
+        dead = set()
+        for n, (live, _) in enumerate(liveness(ris)):
+            ri = ris[n]
+            output = writes(ri)
+            if (output is not None and is_temporary(output) and
+                    output.name not in live and not has_side_effects(ri)):
+                dead.add(n)
+
+        if not dead:
+            return list(ris)
+
+        ris = remove(ris, dead)
+
+
+def apply_to_block(function, instructions):
+    """Apply a pass to the IL of each native instruction in a list, in
+    place.
+
+    Args:
+        function (callable): The pass, taking and returning a list of IL
+    instructions.
+        instructions (list): The native instructions to update.
+
+    Returns:
+        The list of native instructions.
+    """
+
+    for ni in instructions:
+        ni.il_instructions = function(ni.il_instructions)
+
+    return instructions
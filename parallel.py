@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.parallel
+
+This module spreads the translation of large code regions over a pool of
+worker processes, to get around the GIL for CPU-bound lifting jobs.
+
+Each worker receives the code bytes once, when it starts, and is then
+handed chunks of the region (or lists of block addresses) to translate.
+Results come back packed into plain tuples, which are much cheaper to
+pickle than the IL objects; unpack_block turns them back into
+native.BasicBlock objects.
+
+A packed instruction is (address, size, mnemonic, ends_basic_block, il),
+where il is a tuple of (opcode, input0, input1, output) and each operand
+is None or a tuple (kind, value, size) as produced by pack_operand. A
+packed block is (start, end, instructions).
+"""
+
+import importlib
+import multiprocessing
+
+import reil.definitions as definitions
+import reil.native as native
+from reil.shorthand import imm, off, r, t
+
+
+IMMEDIATE   = 0
+REGISTER    = 1
+TEMPORARY   = 2
+OFFSET      = 3
+RELOCATION  = 4
+
+
+def pack_operand(operand):
+    """Pack a REIL operand into a tuple of plain values."""
+
+    if operand is None:
+        return None
+
+    elif isinstance(operand, definitions.RelocationOperand):
+        return (RELOCATION, operand.value, operand.size, operand.delta)
+
+    elif isinstance(operand, definitions.ImmediateOperand):
+        return (IMMEDIATE, operand.value, operand.size)
+
+    elif isinstance(operand, definitions.TemporaryOperand):
+        return (TEMPORARY, operand.index, operand.size)
+
+    elif isinstance(operand, definitions.RegisterOperand):
+        return (REGISTER, operand.name, operand.size)
+
+    elif isinstance(operand, definitions.OffsetOperand):
+        return (OFFSET, operand.offset, operand.size)
+
+    raise TypeError('Unsupported operand type!')
+
+
+def unpack_operand(packed):
+    """Rebuild a REIL operand from the output of pack_operand."""
+
+    if packed is None:
+        return None
+
+    kind = packed[0]
+
+    if kind == IMMEDIATE:
+        return imm(packed[1], packed[2])
+
+    elif kind == REGISTER:
+        return r(packed[1], packed[2])
+
+    elif kind == TEMPORARY:
+        return t(packed[1], packed[2])
+
+    elif kind == OFFSET:
+        return off(packed[1])
+
+    elif kind == RELOCATION:
+        return definitions.RelocationOperand(packed[1], packed[2], packed[3])
+
+    raise TypeError('Unsupported operand type!')
+
+
+def pack_instruction(ni):
+    """Pack a native instruction and its IL into a tuple of plain values."""
+
+    il = tuple(
+        (ri.opcode,
+         pack_operand(ri.input0),
+         pack_operand(ri.input1),
+         pack_operand(ri.output))
+        for ri in ni.il_instructions)
+
+    return (ni.address, ni.size, ni.mnemonic, ni.ends_basic_block, il)
+
+
+def unpack_instruction(packed):
+    """Rebuild a native instruction from the output of pack_instruction."""
+
+    address, size, mnemonic, ends_basic_block, il = packed
+
+    il_instructions = [
+        definitions.Instruction(
+            opcode,
+            unpack_operand(input0),
+            unpack_operand(input1),
+            unpack_operand(output))
+        for opcode, input0, input1, output in il]
+
+    return native.Instruction(
+        address, mnemonic, il_instructions, ends_basic_block, size)
+
+
+def unpack_block(packed):
+    """Rebuild a native.BasicBlock from a packed block."""
+
+    start, end, instructions = packed
+
+    return native.BasicBlock(
+        start, end, [unpack_instruction(p) for p in instructions])
+
+
+def _translator(architecture):
+    return importlib.import_module('reil.{}.translator'.format(architecture))
+
+
+# worker process state, set up once per process by _initialise
+
+_worker = None
+
+
+class _Worker(object):
+
+    def __init__(self, architecture, code_bytes, base_address, options):
+        self.translator = _translator(architecture)
+        self.code_bytes = code_bytes
+        self.base_address = base_address
+        self.options = options
+
+
+def _initialise(architecture, code_bytes, base_address, options):
+    global _worker
+    _worker = _Worker(architecture, code_bytes, base_address, options)
+
+
+# longest possible instruction on any of the supported architectures
+_max_instruction_size = 15
+
+
+def _translate_chunk(bounds):
+    start, end = bounds
+
+    # include enough trailing bytes to decode an instruction that starts
+    # before the end of the chunk but extends past it.
+    code_bytes = _worker.code_bytes[start:end + _max_instruction_size]
+
+    # the start of the chunk is a guess at an instruction boundary, and
+    # decoding from the wrong one can reach instructions that the linear
+    # sweep would never see. If those fail to translate, leave the whole
+    # chunk to be translated by the parent instead.
+    try:
+        blocks = _worker.translator.translate_range(
+            code_bytes, _worker.base_address + start, **_worker.options)
+    except Exception:
+        return None
+
+    last_address = _worker.base_address + end
+
+    return [pack_instruction(ni)
+            for block in blocks
+            for ni in block.instructions
+            if ni.address < last_address]
+
+
+_block_window = 0x1000
+
+
+def _translate_block(translator, code_bytes, base_address, address, options):
+    instructions = []
+    offset = address - base_address
+
+    # translate in windows, so that we never hand capstone the rest of a
+    # large buffer just to decode a single block.
+    while offset < len(code_bytes):
+        window = code_bytes[offset:offset + _block_window]
+        block = list(translator.translate(
+            window, base_address + offset, **options))
+
+        instructions.extend(block)
+
+        if not block or block[-1].ends_basic_block:
+            break
+
+        last = block[-1]
+        offset = last.address + last.size - base_address
+
+    return instructions
+
+
+def _translate_blocks(addresses):
+    blocks = []
+
+    for address in addresses:
+        instructions = _translate_block(
+            _worker.translator, _worker.code_bytes, _worker.base_address,
+            address, _worker.options)
+
+        if instructions:
+            last = instructions[-1]
+            end = last.address + last.size
+        else:
+            end = address
+
+        blocks.append((address, end,
+                       tuple(pack_instruction(ni) for ni in instructions)))
+
+    return blocks
+
+
+def _resynchronise(translator, code_bytes, base_address, address, end,
+                   chunk, options):
+    # The worker for this chunk started decoding at the start of the chunk,
+    # which need not be an instruction boundary in the linear sweep from
+    # the start of the region. Continue the linear sweep from address until
+    # it lands on an instruction that the worker also decoded; from there
+    # on both are identical, since decoding is deterministic.
+
+    starts = dict((p[0], n) for n, p in enumerate(chunk))
+    instructions = []
+
+    while address < end:
+        offset = address - base_address
+        window = code_bytes[offset:offset + _block_window]
+
+        # don't trust instructions that could have been truncated by the
+        # end of the window.
+        if offset + len(window) < len(code_bytes):
+            limit = address + len(window) - _max_instruction_size
+        else:
+            limit = address + len(window)
+
+        blocks = translator.translate_range(window, address, **options)
+        decoded = [ni for block in blocks for ni in block.instructions
+                   if ni.address < min(limit, end)]
+
+        for ni in decoded:
+            if ni.address in starts:
+                return instructions, chunk[starts[ni.address]:]
+
+            instructions.append(pack_instruction(ni))
+            address = ni.address + ni.size
+
+        if not decoded:
+            address = limit
+
+    return instructions, []
+
+
+def _split_blocks(instructions):
+    blocks = []
+    block = []
+    next_address = None
+
+    for packed in instructions:
+        address, size, _, ends_basic_block, _ = packed
+
+        if block and address != next_address:
+            blocks.append((block[0][0], next_address, tuple(block)))
+            block = []
+
+        block.append(packed)
+        next_address = address + size
+
+        if ends_basic_block:
+            blocks.append((block[0][0], next_address, tuple(block)))
+            block = []
+
+    if block:
+        blocks.append((block[0][0], next_address, tuple(block)))
+
+    return blocks
+
+
+def translate_range(code_bytes, base_address, architecture='x86',
+                    processes=None, chunk_size=0x10000, **options):
+    """Translate a whole buffer using a pool of worker processes.
+
+    The result is the same as the translate_range function of the
+    translator for the architecture, but in packed form.
+
+    Args:
+        code_bytes (bytes): The code to translate.
+        base_address (int): The address of the first code byte.
+        architecture (string): One of 'x86', 'arm' or 'arm64'.
+        processes (int, optional): The number of worker processes,
+    defaults to the number of cpus.
+        chunk_size (int, optional): The number of bytes handed to a
+    worker at a time.
+        options: Passed on to the translator, e.g. x86_64=True.
+
+    Returns:
+        A list of packed basic blocks in address order.
+    """
+
+    code_bytes = bytes(code_bytes)
+    translator = _translator(architecture)
+
+    chunks = [(start, min(start + chunk_size, len(code_bytes)))
+              for start in range(0, len(code_bytes), chunk_size)]
+
+    pool = multiprocessing.Pool(
+        processes, _initialise,
+        (architecture, code_bytes, base_address, options))
+
+    try:
+        instructions = []
+        for n, chunk in enumerate(pool.imap(_translate_chunk, chunks)):
+            start, end = chunks[n]
+
+            if instructions:
+                last = instructions[-1]
+                address = last[0] + last[1]
+            else:
+                address = base_address + start
+
+            if chunk is None or address != base_address + start:
+                fixup, chunk = _resynchronise(
+                    translator, code_bytes, base_address, address,
+                    base_address + end, chunk or [], options)
+
+                instructions.extend(fixup)
+
+            instructions.extend(chunk)
+    finally:
+        pool.close()
+        pool.join()
+
+    return _split_blocks(instructions)
+
+
+def translate_blocks(code_bytes, base_address, addresses, architecture='x86',
+                     processes=None, batch_size=256, **options):
+    """Translate the basic blocks starting at each of a list of addresses
+    using a pool of worker processes.
+
+    Args:
+        code_bytes (bytes): The code containing the blocks.
+        base_address (int): The address of the first code byte.
+        addresses (list): The start address of each block.
+        architecture (string): One of 'x86', 'arm' or 'arm64'.
+        processes (int, optional): The number of worker processes,
+    defaults to the number of cpus.
+        batch_size (int, optional): The number of blocks handed to a
+    worker at a time.
+        options: Passed on to the translator, e.g. x86_64=True.
+
+    Returns:
+        A list of packed basic blocks, in the same order as addresses.
+    """
+
+    code_bytes = bytes(code_bytes)
+    addresses = list(addresses)
+
+    batches = [addresses[n:n + batch_size]
+               for n in range(0, len(addresses), batch_size)]
+
+    pool = multiprocessing.Pool(
+        processes, _initialise,
+        (architecture, code_bytes, base_address, options))
+
+    try:
+        blocks = []
+        for batch in pool.imap(_translate_blocks, batches):
+            blocks.extend(batch)
+    finally:
+        pool.close()
+        pool.join()
+
+    return blocks
@@ -24,6 +24,18 @@ instructions and operands.
 import reil.definitions as definitions
 
 
+# Operands are immutable, so the shorthand functions hand out a single
+# shared object for each distinct operand rather than allocating a new one
+# on every call. Immediates can take any value, so only the first
+# _max_immediates distinct values are pooled.
+
+_immediates = dict()
+_max_immediates = 0x10000
+_offsets = dict()
+_registers = dict()
+_temporaries = dict()
+
+
 def imm(value, size):
     """Shorthand function for creating a REIL immediate operand.
 
@@ -32,7 +44,14 @@ def imm(value, size):
         size (int): The size in bits of the operand.
     """
 
-    return definitions.ImmediateOperand(value, size)
+    key = (value, size)
+    operand = _immediates.get(key)
+    if operand is None:
+        operand = definitions.ImmediateOperand(value, size)
+        if len(_immediates) < _max_immediates:
+            _immediates[key] = operand
+
+    return operand
 
 
 def off(offset):
@@ -43,7 +62,11 @@ def off(offset):
     the current native instruction).
     """
 
-    return definitions.OffsetOperand(offset)
+    operand = _offsets.get(offset)
+    if operand is None:
+        operand = _offsets[offset] = definitions.OffsetOperand(offset)
+
+    return operand
 
 
 def r(name, size):
@@ -54,7 +77,12 @@ def r(name, size):
         size (int): The size in bits of the operand.
     """
 
-    return definitions.RegisterOperand(name, size)
+    key = (name, size)
+    operand = _registers.get(key)
+    if operand is None:
+        operand = _registers[key] = definitions.RegisterOperand(name, size)
+
+    return operand
 
 
 def t(index, size):
@@ -65,7 +93,12 @@ def t(index, size):
         size (int): The size in bits of the operand.
     """
 
-    return definitions.TemporaryOperand(index, size)
+    key = (index, size)
+    operand = _temporaries.get(key)
+    if operand is None:
+        operand = _temporaries[key] = definitions.TemporaryOperand(index, size)
+
+    return operand
 
 
 def add_(input0, input1, output):
@@ -320,3 +353,156 @@ def sys_(input0=None):
     """
 
     return definitions.Instruction(definitions.SYS, input0, None, None)
+
+
+def mcpy_(source, length, destination):
+    """Extended REIL opcode.
+
+    Copies a block of memory. The first operand is the address of the
+    source, and the third operand is the address of the destination. The
+    second operand is the length of the block in bytes, interpreted as a
+    signed value of its own size. If it is positive the bytes are copied
+    one at a time from the lowest address upwards, and if it is negative
+    the block is the same but the bytes are copied from the highest
+    address downwards. The third operand is not written.
+    """
+
+    return definitions.Instruction(definitions.MCPY, source, length, destination)
+
+
+def mset_(value, length, destination):
+    """Extended REIL opcode.
+
+    Fills a block of memory. The first operand is the value to store, and
+    its size is the size of each element of the block. The third operand
+    is the address of the block. The second operand is the length of the
+    block in bytes, interpreted as a signed value of its own size, and
+    only its magnitude matters. The third operand is not written.
+    """
+
+    return definitions.Instruction(definitions.MSET, value, length, destination)
+
+
+def mcmp_(addresses, length, output):
+    """Extended REIL opcode.
+
+    Compares two blocks of memory. The first operand holds the addresses
+    of both blocks, the first in its low half and the second in its high
+    half. The second operand is the length of the blocks in bytes,
+    interpreted as a signed value of its own size; if it is negative the
+    bytes are compared from the highest address downwards. The output
+    operand is set to the number of bytes compared before the first pair
+    that differ, or to the length of the blocks if they are identical.
+    """
+
+    return definitions.Instruction(definitions.MCMP, addresses, length, output)
+
+
+def clz_(input0, output):
+    """Extended REIL opcode.
+
+    Counts the leading zero bits of a value. The input operand can be a
+    literal or a register value, and its size is the number of bits
+    counted, so the result is the size of the input operand if it is
+    zero. The output operand is a register.
+    """
+
+    return definitions.Instruction(definitions.CLZ, input0, None, output)
+
+
+def ctz_(input0, output):
+    """Extended REIL opcode.
+
+    Counts the trailing zero bits of a value. The input operand can be a
+    literal or a register value, and the result is the size of the input
+    operand if it is zero. The output operand is a register.
+    """
+
+    return definitions.Instruction(definitions.CTZ, input0, None, output)
+
+
+def popcnt_(input0, output):
+    """Extended REIL opcode.
+
+    Counts the bits that are set in a value. The input operand can be a
+    literal or a register value. The output operand is a register.
+    """
+
+    return definitions.Instruction(definitions.POPCNT, input0, None, output)
+
+
+def vadd_(vectors, width, output):
+    """Extended REIL opcode.
+
+    Adds two vectors lane by lane. The first operand holds both vectors,
+    the first in its low half and the second in its high half, and the
+    second operand is a literal giving the width of each lane in bits.
+    The output operand is a register of half the size of the first
+    operand.
+    """
+
+    return definitions.Instruction(definitions.VADD, vectors, width, output)
+
+
+def vsub_(vectors, width, output):
+    """Extended REIL opcode.
+
+    Subtracts the second vector from the first lane by lane. The operands
+    are the same as for vadd_.
+    """
+
+    return definitions.Instruction(definitions.VSUB, vectors, width, output)
+
+
+def vequ_(vectors, width, output):
+    """Extended REIL opcode.
+
+    Sets every bit of each lane of the output where the lanes of the two
+    vectors are equal. The operands are the same as for vadd_.
+    """
+
+    return definitions.Instruction(definitions.VEQU, vectors, width, output)
+
+
+def vsgt_(vectors, width, output):
+    """Extended REIL opcode.
+
+    Sets every bit of each lane of the output where the lane of the first
+    vector is greater than the lane of the second, treating the lanes as
+    signed values. The operands are the same as for vadd_.
+    """
+
+    return definitions.Instruction(definitions.VSGT, vectors, width, output)
+
+
+def vmaxu_(vectors, width, output):
+    """Extended REIL opcode.
+
+    Takes the larger of each pair of unsigned lanes of two vectors. The
+    operands are the same as for vadd_.
+    """
+
+    return definitions.Instruction(definitions.VMAXU, vectors, width, output)
+
+
+def vminu_(vectors, width, output):
+    """Extended REIL opcode.
+
+    Takes the smaller of each pair of unsigned lanes of two vectors. The
+    operands are the same as for vadd_.
+    """
+
+    return definitions.Instruction(definitions.VMINU, vectors, width, output)
+
+
+def vshuf_(vectors, width, output):
+    """Extended REIL opcode.
+
+    Rearranges the lanes of a vector. The first operand holds the vector
+    in its low half and a vector of lane indices in its high half, and the
+    second operand is a literal giving the width of each lane in bits.
+    Each lane of the output is the lane of the vector selected by the
+    corresponding lane of the indices.
+    """
+
+    return definitions.Instruction(definitions.VSHUF, vectors, width, output)
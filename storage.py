@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.storage
+
+This module contains a binary file format for saving translated code, so
+that it can be loaded again without re-translating it.
+
+The file is memory-mapped when it is read, and only the blocks that are
+asked for are decoded; a sorted index of block addresses at the end of
+the file is searched in place, so opening a file costs the same however
+large it is.
+
+All values are little-endian. The file is laid out as:
+
+    header      magic 'REIL', version, block count and the offsets of
+                the index, names and constants sections
+    blocks      for each block, the instruction count, then for each
+                native instruction its address, size, ends_basic_block
+                flag, mnemonic and IL, with operands encoded as in
+                reil.compact
+    index       (start, end, offset) of each block, sorted by start
+    names       the register names referenced by operands
+    constants   a table of offsets followed by the immediates and
+                relocations referenced by operands
+"""
+
+import mmap
+import os
+import struct
+
+import reil.compact as compact
+import reil.definitions as definitions
+import reil.native as native
+from reil.error import FileFormatError
+from reil.shorthand import imm, off, r, t
+
+
+MAGIC = b'REIL'
+VERSION = 1
+
+_header = struct.Struct('<4sHHIQQQ')
+_index_entry = struct.Struct('<QQQ')
+_count = struct.Struct('<I')
+_offset = struct.Struct('<Q')
+_string = struct.Struct('<H')
+_instruction = struct.Struct('<QBBHH')
+_il_instruction = struct.Struct('<BBHqBHqBHq')
+_constant = struct.Struct('<BH')
+
+_IMMEDIATE_CONSTANT = 0
+_RELOCATION_CONSTANT = 1
+
+
+def _pack_string(value):
+    data = value.encode('utf-8')
+    return _string.pack(len(data)) + data
+
+
+def _unpack_string(data, offset):
+    length, = _string.unpack_from(data, offset)
+    offset += _string.size
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+class Writer(object):
+    """Writes translated basic blocks to a file.
+
+    Args:
+        path (string): The file to create.
+
+    Example:
+
+        with reil.storage.Writer('ls.reil') as writer:
+            for block in reil.x86.translator.translate_range(code, base):
+                writer.add_block(block.instructions)
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._offset = 0
+        self._index = []
+
+        # the header is filled in by close
+        self._write(b'\0' * _header.size)
+
+        # only used for its names and constants tables
+        self._encoder = compact.CompactIL()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def add_block(self, instructions):
+        """Add a basic block.
+
+        Args:
+            instructions (list): The native instructions in the block.
+        """
+
+        instructions = list(instructions)
+        if not instructions:
+            return
+
+        chunks = [_count.pack(len(instructions))]
+
+        for ni in instructions:
+            mnemonic = ni.mnemonic.encode('utf-8')
+            chunks.append(_instruction.pack(
+                ni.address, ni.size, 1 if ni.ends_basic_block else 0,
+                len(mnemonic), len(ni.il_instructions)))
+            chunks.append(mnemonic)
+
+            for ri in ni.il_instructions:
+                encoded = [ri.opcode]
+                for operand in (ri.input0, ri.input1, ri.output):
+                    kind, value, size = self._encoder.encode_operand(operand)
+                    encoded.extend((kind, size, value))
+
+                chunks.append(_il_instruction.pack(*encoded))
+
+        last = instructions[-1]
+        self._index.append(
+            (instructions[0].address, last.address + last.size, self._offset))
+
+        self._write(b''.join(chunks))
+
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+
+    def close(self):
+        """Write the index and tables and close the file."""
+
+        if self._file is None:
+            return
+
+        self._index.sort()
+
+        index_offset = self._offset
+        self._write(b''.join(_index_entry.pack(*entry) for entry in self._index))
+
+        names_offset = self._offset
+        chunks = [_count.pack(len(self._encoder.names))]
+        for name in self._encoder.names:
+            chunks.append(_pack_string(name))
+        self._write(b''.join(chunks))
+
+        # the constants are preceded by a table of their offsets, so that
+        # they can be decoded individually as they are needed.
+        constants_offset = self._offset
+        table_size = _count.size + _offset.size * len(self._encoder.constants)
+
+        offsets = []
+        chunks = []
+        offset = constants_offset + table_size
+        for operand in self._encoder.constants:
+            if isinstance(operand, definitions.RelocationOperand):
+                chunk = (_constant.pack(_RELOCATION_CONSTANT, operand.size) +
+                         _pack_string(str(operand.value)) +
+                         _pack_string(str(operand.delta)))
+            else:
+                chunk = (_constant.pack(_IMMEDIATE_CONSTANT, operand.size) +
+                         _pack_string(str(operand.value)))
+
+            offsets.append(_offset.pack(offset))
+            chunks.append(chunk)
+            offset += len(chunk)
+
+        self._write(_count.pack(len(self._encoder.constants)))
+        self._write(b''.join(offsets))
+        self._write(b''.join(chunks))
+
+        self._file.seek(0)
+        self._file.write(_header.pack(
+            MAGIC, VERSION, 0, len(self._index),
+            index_offset, names_offset, constants_offset))
+
+        self._file.close()
+        self._file = None
+
+
+def save(path, blocks):
+    """Write a list of native.BasicBlock objects to a file."""
+
+    with Writer(path) as writer:
+        for block in blocks:
+            writer.add_block(block.instructions)
+
+
+class Reader(object):
+    """Reads translated basic blocks from a file written by Writer.
+
+    Blocks are decoded when they are requested, and are not cached.
+    Closing the reader unmaps the file, so it must stay open while blocks
+    are being read.
+
+    Args:
+        path (string): The file to open.
+
+    Raises:
+        FileFormatError: If the file is not a REIL file, is truncated, or
+    was written by an incompatible version of this module.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._data = None
+
+        try:
+            # mmap can't map an empty file, so short files are rejected first
+            if os.fstat(self._file.fileno()).st_size < _header.size:
+                raise FileFormatError('File is too short')
+
+            self._data = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            (magic, version, _, self._count, self._index_offset,
+             names_offset, constants_offset) = _header.unpack_from(self._data, 0)
+
+            if magic != MAGIC:
+                raise FileFormatError('Not a REIL file')
+
+            if version != VERSION:
+                raise FileFormatError(
+                    'Unsupported file version {}'.format(version))
+
+            # the sections are written in order with nothing between them,
+            # and the constants run to the end of the file.
+            if not (_header.size <= self._index_offset <= names_offset <=
+                    constants_offset <= len(self._data) - _count.size):
+                raise FileFormatError('Section offsets are out of range')
+
+            index_end = self._index_offset + self._count * _index_entry.size
+            if index_end != names_offset:
+                raise FileFormatError('Index does not match the block count')
+
+            self._names = self._read_names(names_offset, constants_offset)
+            self._constants_offset = constants_offset
+            self._constants = dict()
+            self._check_constants()
+
+        except Exception:
+            self.close()
+            raise
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def __len__(self):
+        return self._count
+
+
+    def __iter__(self):
+        for n in range(self._count):
+            yield self._block(n)
+
+
+    def __contains__(self, address):
+        n = self._search(address)
+        return n < self._count and self._entry(n)[0] == address
+
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+        self._file.close()
+
+
+    def _read_string(self, offset, end):
+        if offset + _string.size > end:
+            raise FileFormatError('String is truncated')
+
+        length, = _string.unpack_from(self._data, offset)
+        if offset + _string.size + length > end:
+            raise FileFormatError('String is truncated')
+
+        try:
+            return _unpack_string(self._data, offset)
+        except UnicodeDecodeError:
+            raise FileFormatError('String is not valid UTF-8')
+
+
+    def _read_names(self, offset, end):
+        if offset + _count.size > end:
+            raise FileFormatError('Names table is truncated')
+
+        count, = _count.unpack_from(self._data, offset)
+        offset += _count.size
+
+        names = []
+        for _ in range(count):
+            name, offset = self._read_string(offset, end)
+            names.append(name)
+
+        if offset != end:
+            raise FileFormatError('Names table does not match its size')
+
+        return names
+
+
+    def _check_constants(self):
+        count, = _count.unpack_from(self._data, self._constants_offset)
+        end = self._constants_offset + _count.size + count * _offset.size
+        if end > len(self._data):
+            raise FileFormatError('Constants table is truncated')
+
+        # the last constant ends the file, so decoding it is enough to
+        # find a truncated file.
+        if count:
+            _, end = self._read_constant(count - 1)
+
+        if end != len(self._data):
+            raise FileFormatError('File is truncated')
+
+
+    def _read_constant(self, n):
+        offset, = _offset.unpack_from(
+            self._data, self._constants_offset + _count.size + n * _offset.size)
+
+        if offset + _constant.size > len(self._data):
+            raise FileFormatError('Constant is truncated')
+
+        kind, size = _constant.unpack_from(self._data, offset)
+        offset += _constant.size
+
+        value, offset = self._read_string(offset, len(self._data))
+        try:
+            if kind == _RELOCATION_CONSTANT:
+                delta, offset = self._read_string(offset, len(self._data))
+                operand = definitions.RelocationOperand(
+                    int(value), size, int(delta))
+            else:
+                operand = imm(int(value), size)
+        except ValueError:
+            raise FileFormatError('Invalid constant {}'.format(n))
+
+        return operand, offset
+
+
+    def _constant(self, n):
+        operand = self._constants.get(n)
+        if operand is None:
+            operand, _ = self._read_constant(n)
+            self._constants[n] = operand
+
+        return operand
+
+
+    def _entry(self, n):
+        return _index_entry.unpack_from(
+            self._data, self._index_offset + n * _index_entry.size)
+
+
+    def _search(self, address):
+        # index of the first block starting at or after address
+        lo = 0
+        hi = self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < address:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+    def _operand(self, kind, size, value):
+        if kind == compact.NONE:
+            return None
+
+        elif kind == compact.IMMEDIATE:
+            return imm(value, size)
+
+        elif kind == compact.REGISTER:
+            return r(self._names[value], size)
+
+        elif kind == compact.TEMPORARY:
+            return t(value, size)
+
+        elif kind == compact.OFFSET:
+            return off(value)
+
+        return self._constant(value)
+
+
+    def _block(self, n):
+        start, end, offset = self._entry(n)
+        data = self._data
+
+        if not _header.size <= offset < self._index_offset:
+            raise FileFormatError('Block {} is out of range'.format(n))
+
+        count, = _count.unpack_from(data, offset)
+        offset += _count.size
+
+        instructions = []
+        for _ in range(count):
+            (address, size, ends_basic_block, mnemonic_length,
+             il_count) = _instruction.unpack_from(data, offset)
+            offset += _instruction.size
+
+            mnemonic = data[offset:offset + mnemonic_length].decode('utf-8')
+            offset += mnemonic_length
+
+            il_instructions = []
+            for _ in range(il_count):
+                (opcode, k0, s0, v0, k1, s1, v1, k2, s2,
+                 v2) = _il_instruction.unpack_from(data, offset)
+                offset += _il_instruction.size
+
+                il_instructions.append(definitions.Instruction(
+                    opcode,
+                    self._operand(k0, s0, v0),
+                    self._operand(k1, s1, v1),
+                    self._operand(k2, s2, v2)))
+
+            instructions.append(native.Instruction(
+                address, mnemonic, il_instructions,
+                bool(ends_basic_block), size))
+
+        return native.BasicBlock(start, end, instructions)
+
+
+    def addresses(self):
+        """Iterate over the start address of each block, in order."""
+
+        for n in range(self._count):
+            yield self._entry(n)[0]
+
+
+    def block(self, address):
+        """Decode the block starting at address.
+
+        Raises:
+            KeyError: If no block starts at address.
+        """
+
+        n = self._search(address)
+        if n == self._count or self._entry(n)[0] != address:
+            raise KeyError(address)
+
+        return self._block(n)
+
+
+    def find(self, address):
+        """Decode the block containing address, or return None."""
+
+        n = self._search(address + 1) - 1
+        if n < 0:
+            return None
+
+        start, end, _ = self._entry(n)
+        if not start <= address < end:
+            return None
+
+        return self._block(n)
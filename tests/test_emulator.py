@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.tests.test_emulator
+
+Checks that the interpreter, the compiler and the lockstep engine agree,
+on each instruction in each translation mode and on the benchmark
+routines.
+"""
+
+import random
+import struct
+
+import pytest
+
+import reil.emulator.benchmark as benchmark
+from reil.emulator.compiler import Compiler
+from reil.emulator.interpreter import Interpreter
+from reil.emulator.memory import Memory
+from reil.error import EmulationError
+
+from reil.tests.utilities import (
+    code_address, instruction_ids, instructions, materialise_il, memories,
+    memory_contents, modes, new_memory, random_registers, register_sizes,
+    translate_function, write_image)
+
+
+lanes = 8
+
+# each instruction is followed by a jump here, so that the engines run it
+# as part of a whole basic block, which is what the compiler compiles.
+stop_address = code_address + 0x100
+
+
+def _code(encoding):
+    code = bytes.fromhex(encoding)
+    jump = stop_address - (code_address + len(code) + 5)
+    return code + b'\xe9' + struct.pack('<i', jump)
+
+
+def _run(engine, translate, code, registers, image):
+    emulator = engine(translate, new_memory(image, code))
+    emulator.registers.update(registers)
+
+    try:
+        outcome = emulator.run(code_address, stop=stop_address)
+    except EmulationError as error:
+        outcome = str(error)
+
+    return (outcome, emulator.executed, dict(emulator.registers),
+            memory_contents(emulator.memory))
+
+
+def _run_lockstep(translate, code, states, images):
+    numpy = pytest.importorskip('numpy')
+    from reil.emulator.lockstep import Lockstep
+
+    memory = Memory()
+    memory.write(code_address, code)
+    lockstep = Lockstep(translate, len(states), memory)
+
+    for lane, image in enumerate(images):
+        write_image(lockstep.memories[lane], image)
+
+    for name in states[0]:
+        values = [state[name] for state in states]
+        if max(values).bit_length() > 64:
+            lockstep.registers[name] = numpy.array(values, object)
+        else:
+            lockstep.registers[name] = numpy.array(values, numpy.uint64)
+
+    lockstep.run(code_address, stop=stop_address)
+
+    results = []
+    for lane in range(len(states)):
+        error = lockstep.errors[lane]
+        outcome = int(lockstep.addresses[lane]) if error is None else error
+        registers = dict((name, int(column[lane]))
+                         for name, column in lockstep.registers.items())
+        results.append((outcome, int(lockstep.executed[lane]), registers,
+                        memory_contents(lockstep.memories[lane])))
+
+    return results
+
+
+def _compare(expected, actual, context):
+    outcome, executed, registers, memory = expected
+    assert actual[0] == outcome, context
+    assert actual[1] == executed, context
+
+    # registers that haven't been written read as zero
+    for name in set(registers) | set(actual[2]):
+        assert actual[2].get(name, 0) == registers.get(name, 0), \
+            '{}: {}'.format(context, name)
+
+    assert actual[3] == memory, context
+
+
+@pytest.mark.parametrize('mode', [None] + modes)
+@pytest.mark.parametrize('encoding', [e for e, _ in instructions],
+                         ids=instruction_ids)
+def test_engines_agree(mode, encoding):
+    code = _code(encoding)
+    translate = translate_function(mode)
+
+    ni = next(iter(translate(code, code_address)))
+    ils = [ni.il_instructions]
+    if mode == 'lazy_flags':
+        ils.append(materialise_il)
+    sizes = register_sizes(ils)
+
+    generator = random.Random(encoding)
+    states = [random_registers(generator, sizes) for _ in range(lanes)]
+    images = [memories[lane % len(memories)] for lane in range(lanes)]
+
+    expected = [_run(Interpreter, translate, code, state, image)
+                for state, image in zip(states, images)]
+
+    for lane, (state, image) in enumerate(zip(states, images)):
+        _compare(expected[lane],
+                 _run(Compiler, translate, code, state, image),
+                 '{} {} compiler lane {}'.format(ni.mnemonic, mode, lane))
+
+    results = _run_lockstep(translate, code, states, images)
+    for lane, actual in enumerate(results):
+        _compare(expected[lane], actual,
+                 '{} {} lockstep lane {}'.format(ni.mnemonic, mode, lane))
+
+
+@pytest.mark.parametrize('mode', [None] + modes)
+@pytest.mark.parametrize('name, code, setup', benchmark.workloads,
+                         ids=[name for name, _, _ in benchmark.workloads])
+def test_workload(name, code, setup, mode):
+    translate = translate_function(mode)
+
+    # run_workload raises AssertionError if the result is wrong
+    benchmark.run_workload(code, setup, lambda _: Interpreter(translate))
+    benchmark.run_workload(code, setup, lambda _: Compiler(translate))
+
+
+def _sort_states(generator):
+    # arrays of different lengths, so that the states take different
+    # paths through the routine.
+    states = []
+    for _ in range(lanes):
+        length = generator.randrange(1, 24)
+        values = [generator.randrange(-8, 8) for _ in range(length)]
+        data = b''.join(struct.pack('<i', value) for value in values)
+        states.append(
+            (data, {'rdi': benchmark.data_address, 'rsi': len(values)}))
+
+    return states
+
+
+def _checksum_states(generator):
+    states = []
+    for _ in range(lanes):
+        length = generator.randrange(64)
+        data = bytes(generator.randrange(256) for _ in range(length))
+        states.append(
+            (data, {'rdi': benchmark.data_address, 'rsi': len(data)}))
+
+    return states
+
+
+@pytest.mark.parametrize('name, code, states', [
+    ('checksum',    benchmark._checksum_code,   _checksum_states),
+    ('sort',        benchmark._sort_code,       _sort_states),
+])
+def test_lockstep_workload(name, code, states):
+    numpy = pytest.importorskip('numpy')
+    from reil.emulator.lockstep import Lockstep
+
+    translate = translate_function()
+    states = states(random.Random(name))
+
+    memory = Memory()
+    memory.write(code_address, code)
+    memory.store(benchmark.stack_address - 8, 8, benchmark.return_address)
+
+    lockstep = Lockstep(translate, lanes, memory)
+    for lane, (data, registers) in enumerate(states):
+        lockstep.memories[lane].write(benchmark.data_address, data)
+    for name in ('rdi', 'rsi'):
+        lockstep.registers[name] = numpy.array(
+            [registers[name] for _, registers in states], numpy.uint64)
+    lockstep.registers['rsp'] = benchmark.stack_address - 8
+
+    lockstep.run(code_address, stop=benchmark.return_address)
+
+    for lane, (data, registers) in enumerate(states):
+        interpreter = Interpreter(translate)
+        interpreter.memory.write(code_address, code)
+        interpreter.memory.store(
+            benchmark.stack_address - 8, 8, benchmark.return_address)
+        interpreter.memory.write(benchmark.data_address, data)
+        interpreter.registers.update(registers)
+        interpreter.registers['rsp'] = benchmark.stack_address - 8
+
+        interpreter.run(code_address, stop=benchmark.return_address)
+
+        assert lockstep.errors[lane] is None
+        assert int(lockstep.addresses[lane]) == benchmark.return_address
+        assert int(lockstep.executed[lane]) == interpreter.executed
+        assert (int(lockstep.registers['rax'][lane]) ==
+                interpreter.registers['rax'])
+
+        address = benchmark.data_address
+        assert (lockstep.memories[lane].read(address, len(data)) ==
+                interpreter.memory.read(address, len(data)))
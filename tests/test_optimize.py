@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.tests.test_optimize
+
+Checks that the optimisation passes don't change the meaning of the IL,
+by running the IL before and after each pass on the same random states,
+and by running the benchmark routines with optimised IL.
+"""
+
+import random
+
+import pytest
+
+import reil.x86.translator as translator
+from reil.emulator.benchmark import run_workload, workloads
+from reil.emulator.interpreter import Interpreter
+from reil.error import EmulationError
+from reil.optimize.constant_folding import fold_constants
+from reil.optimize.copy_propagation import propagate_copies
+from reil.optimize.dead_flags import remove_dead_flags, remove_dead_flags_cfg
+from reil.optimize.peephole import apply_patterns
+from reil.optimize.renumber import renumber_temporaries
+from reil.optimize.utilities import apply_to_block
+
+from reil.tests.utilities import (
+    code_address, compare_runs, instruction_ids, instructions,
+    materialise_il, memories, memory_contents, modes, new_memory,
+    random_registers, register_sizes, run, translate, translate_function)
+
+
+states = 8
+
+
+def optimise(ris):
+    """Apply all of the single instruction passes, in the order that they
+    do the most good in.
+    """
+
+    ris = propagate_copies(ris)
+    ris = fold_constants(ris)
+    ris = apply_patterns(ris)
+    ris = propagate_copies(ris)
+    return renumber_temporaries(ris)
+
+
+passes = [
+    ('propagate_copies',        propagate_copies),
+    ('fold_constants',          fold_constants),
+    ('apply_patterns',          apply_patterns),
+    ('renumber_temporaries',    renumber_temporaries),
+    ('all',                     optimise),
+]
+
+
+def _compare(il, optimised, materialise, generator, context):
+    ils = [il, optimised]
+    if materialise:
+        ils.append(materialise_il)
+    sizes = register_sizes(ils)
+    for n in range(states):
+        registers = random_registers(generator, sizes)
+        image = memories[n % len(memories)]
+
+        compare_runs(
+            run(il, registers, image, materialise),
+            run(optimised, registers, image, materialise),
+            '{} state {}'.format(context, n))
+
+
+@pytest.mark.parametrize('function', [f for _, f in passes],
+                         ids=[name for name, _ in passes])
+@pytest.mark.parametrize('encoding', [e for e, _ in instructions],
+                         ids=instruction_ids)
+def test_pass(function, encoding):
+    ni = translate(bytes.fromhex(encoding))
+    il = ni.il_instructions
+    before = [str(ri) for ri in il]
+
+    optimised = function(il)
+
+    # the passes return a new list and leave their input alone
+    assert [str(ri) for ri in il] == before
+
+    _compare(il, optimised, False, random.Random(encoding), ni.mnemonic)
+
+
+@pytest.mark.parametrize('mode', modes)
+@pytest.mark.parametrize('encoding', [e for e, _ in instructions],
+                         ids=instruction_ids)
+def test_passes_in_mode(mode, encoding):
+    ni = translate(bytes.fromhex(encoding), mode)
+    il = ni.il_instructions
+
+    _compare(il, optimise(il), mode == 'lazy_flags', random.Random(encoding),
+             '{} {}'.format(ni.mnemonic, mode))
+
+
+def _straight_line(encoding):
+    code = bytes.fromhex(encoding)
+    ni = translate(code)
+    return not ni.ends_basic_block and ni.mnemonic != 'unkn'
+
+
+_straight_line_instructions = [
+    encoding for encoding, _ in instructions if _straight_line(encoding)]
+
+
+def _run_block(block, registers, image):
+    # runs the native instructions in a block one by one, until one of
+    # them jumps out of it.
+    interpreter = Interpreter(None, new_memory(image))
+    interpreter.registers.update(registers)
+
+    outcome = None
+    try:
+        for ni in block:
+            outcome = interpreter.execute(ni.il_instructions)
+            if outcome is not None and outcome != ni.address + ni.size:
+                break
+    except EmulationError as error:
+        outcome = str(error)
+
+    return (outcome, dict(interpreter.registers),
+            memory_contents(interpreter.memory))
+
+
+@pytest.mark.parametrize('seed', range(32))
+def test_remove_dead_flags(seed):
+    generator = random.Random(seed)
+    code = b''.join(
+        bytes.fromhex(generator.choice(_straight_line_instructions))
+        for _ in range(4))
+
+    block = list(translator.translate(code, code_address, x86_64=True))
+    optimised = remove_dead_flags(
+        list(translator.translate(code, code_address, x86_64=True)))
+
+    sizes = register_sizes(ni.il_instructions for ni in block)
+    for n in range(states):
+        registers = random_registers(generator, sizes)
+        image = memories[n % len(memories)]
+
+        compare_runs(
+            _run_block(block, registers, image),
+            _run_block(optimised, registers, image),
+            '{} state {}'.format(
+                '; '.join(ni.mnemonic for ni in block), n))
+
+
+def _optimised_translate(code, mode):
+    # translates the whole routine up front, optimises it, and serves the
+    # blocks to the emulator, translating any address that isn't the start
+    # of a block as usual.
+    kwargs = {mode: True} if mode else {}
+    blocks = remove_dead_flags_cfg(list(translator.translate_range(
+        code, code_address, x86_64=True, **kwargs)))
+
+    for block in blocks:
+        apply_to_block(optimise, block.instructions)
+
+    starts = dict((block.start, block.instructions) for block in blocks)
+    fallback = translate_function(mode)
+
+    def translate_block(code_bytes, address):
+        instructions = starts.get(address)
+        if instructions is None:
+            return fallback(code_bytes, address)
+        return instructions
+
+    return translate_block
+
+
+@pytest.mark.parametrize('mode', [None] + modes)
+@pytest.mark.parametrize('name, code, setup', workloads,
+                         ids=[name for name, _, _ in workloads])
+def test_optimised_workload(name, code, setup, mode):
+    optimised = _optimised_translate(code, mode)
+
+    # run_workload raises AssertionError if the result is wrong
+    run_workload(code, setup, lambda _: Interpreter(optimised))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.tests.test_storage
+
+Checks that translated code comes back unchanged from a CompactIL
+container and from a file written by reil.storage, and that damaged files
+are rejected.
+"""
+
+import pytest
+
+import reil.storage as storage
+import reil.x86.translator as translator
+from reil.compact import CompactIL
+from reil.error import FileFormatError
+
+from reil.tests.utilities import code_address, instructions, modes
+
+
+code = b''.join(bytes.fromhex(encoding) for encoding, _ in instructions)
+
+translations = [
+    ('default',     {}),
+    ('relocatable', {'relocatable': True}),
+] + [(mode, {mode: True}) for mode in modes]
+
+
+def _blocks(kwargs):
+    return list(translator.translate_range(
+        code, code_address, x86_64=True, **kwargs))
+
+
+def _key(ni):
+    # operands compare equal when they have the same type and attributes
+    return (ni.address, ni.mnemonic, ni.size, ni.ends_basic_block,
+            [(ri.opcode, ri.input0, ri.input1, ri.output)
+             for ri in ni.il_instructions])
+
+
+def _keys(instructions):
+    return [_key(ni) for ni in instructions]
+
+
+@pytest.mark.parametrize('kwargs', [k for _, k in translations],
+                         ids=[name for name, _ in translations])
+def test_compact_round_trip(kwargs):
+    instructions = [
+        ni for block in _blocks(kwargs) for ni in block.instructions]
+
+    compact = CompactIL(instructions)
+
+    assert len(compact) == len(instructions)
+    assert _keys(compact.to_instructions()) == _keys(instructions)
+
+
+@pytest.mark.parametrize('kwargs', [k for _, k in translations],
+                         ids=[name for name, _ in translations])
+def test_storage_round_trip(kwargs, tmp_path):
+    blocks = _blocks(kwargs)
+    path = str(tmp_path / 'code.reil')
+
+    storage.save(path, blocks)
+
+    with storage.Reader(path) as reader:
+        assert len(reader) == len(blocks)
+        starts = sorted(block.start for block in blocks)
+        assert list(reader.addresses()) == starts
+
+        for block in blocks:
+            assert block.start in reader
+
+            stored = reader.block(block.start)
+            assert (stored.start, stored.end) == (block.start, block.end)
+            assert _keys(stored.instructions) == _keys(block.instructions)
+
+            last = block.instructions[-1]
+            assert reader.find(last.address).start == block.start
+
+        assert code_address - 1 not in reader
+        assert reader.find(code_address - 1) is None
+        assert reader.find(code_address + len(code)) is None
+
+        with pytest.raises(KeyError):
+            reader.block(code_address + len(code))
+
+
+def test_storage_rejects_damaged_files(tmp_path):
+    path = str(tmp_path / 'code.reil')
+    storage.save(path, _blocks({'relocatable': True}))
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    damaged = str(tmp_path / 'damaged.reil')
+    lengths = sorted(set([0, 1, storage._header.size - 1, storage._header.size,
+                          len(data) // 2, len(data) - 1] +
+                         list(range(0, len(data), max(1, len(data) // 64)))))
+
+    for length in lengths:
+        with open(damaged, 'wb') as f:
+            f.write(data[:length])
+
+        with pytest.raises(FileFormatError):
+            storage.Reader(damaged)
+
+    with open(damaged, 'wb') as f:
+        f.write(b'ELF!' + data[4:])
+
+    with pytest.raises(FileFormatError):
+        storage.Reader(damaged)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.tests.test_translation_modes
+
+Checks that each translation mode emits IL with the same meaning as the
+default translation, by running both on the same random states.
+"""
+
+import random
+
+import pytest
+
+from reil.tests.utilities import (
+    compare_runs, instruction_ids, instructions, materialise_il, memories,
+    modes, random_registers, register_sizes, run, translate)
+
+
+states = 16
+
+
+@pytest.mark.parametrize('mode', modes)
+@pytest.mark.parametrize('encoding', [e for e, _ in instructions],
+                         ids=instruction_ids)
+def test_mode_matches_default(mode, encoding):
+    code = bytes.fromhex(encoding)
+    expected = translate(code)
+    actual = translate(code, mode)
+
+    lazy = mode == 'lazy_flags'
+    ils = [expected.il_instructions, actual.il_instructions]
+    if lazy:
+        ils.append(materialise_il)
+    sizes = register_sizes(ils)
+
+    generator = random.Random(encoding)
+    for n in range(states):
+        registers = random_registers(generator, sizes)
+        image = memories[n % len(memories)]
+
+        compare_runs(
+            run(expected.il_instructions, registers, image),
+            run(actual.il_instructions, registers, image, materialise=lazy),
+            '{} {} state {}'.format(expected.mnemonic, mode, n))
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.tests.utilities
+
+This module contains the instructions that the tests translate, and
+helpers for running their IL on random machine states.
+"""
+
+import functools
+import random
+
+import reil.x86.flags as flags
+import reil.x86.translator as translator
+from reil.emulator.interpreter import Interpreter
+from reil.emulator.memory import Memory
+from reil.error import EmulationError
+from reil.optimize.dead_flags import FLAGS
+from reil.optimize.utilities import is_temporary, is_variable
+from reil.utilities import mask, sign_bit
+
+
+code_address = 0x400000
+
+# the pointer registers point into one of these, and the second is a
+# near copy of the first so that string compares find some matches.
+source_address = 0x10000
+destination_address = 0x20000
+data_size = 0x1100
+
+_pointers = [
+    source_address,
+    source_address + 8,
+    source_address + 0xff8,
+    destination_address,
+    destination_address + 3,
+]
+
+_pointer_registers = frozenset(['rbx', 'rbp', 'rdi', 'rsi', 'rsp'])
+
+
+# x86_64 instructions, as (hex encoding, disassembly), covering the
+# general-purpose instructions and each of the paths that the translation
+# modes change: the lazy flags, the bulk memory string instructions, the
+# bit counting instructions and the sse lane operations.
+instructions = [
+    # arithmetic and logic
+    ('4801d8',          'add rax, rbx'),
+    ('05ffffff7f',      'add eax, 0x7fffffff'),
+    ('4811d8',          'adc rax, rbx'),
+    ('1412',            'adc al, 0x12'),
+    ('4829d8',          'sub rax, rbx'),
+    ('19d1',            'sbb ecx, edx'),
+    ('4839d8',          'cmp rax, rbx'),
+    ('3c80',            'cmp al, 0x80'),
+    ('4885d8',          'test rax, rbx'),
+    ('4821d8',          'and rax, rbx'),
+    ('09d1',            'or ecx, edx'),
+    ('31c0',            'xor eax, eax'),
+    ('48ffc0',          'inc rax'),
+    ('ffc9',            'dec ecx'),
+    ('48f7d8',          'neg rax'),
+    ('48f7d2',          'not rdx'),
+
+    # multiply and divide
+    ('480fafc3',        'imul rax, rbx'),
+    ('69ca34120000',    'imul ecx, edx, 0x1234'),
+    ('48f7e3',          'mul rbx'),
+    ('48f7f1',          'div rcx'),
+    ('f7f9',            'idiv ecx'),
+
+    # shifts and rotates
+    ('48d3e0',          'shl rax, cl'),
+    ('c1e803',          'shr eax, 3'),
+    ('48d3f8',          'sar rax, cl'),
+    ('48c1c005',        'rol rax, 5'),
+    ('d3c9',            'ror ecx, cl'),
+    ('480facd807',      'shrd rax, rbx, 7'),
+
+    # bit tests
+    ('480fa3d8',        'bt rax, rbx'),
+    ('480fbae807',      'bts rax, 7'),
+    ('0fb3d1',          'btr ecx, edx'),
+    ('480fbaf83f',      'btc rax, 0x3f'),
+    ('0fa34308',        'bt dword ptr [rbx + 8], eax'),
+    ('0fab4308',        'bts dword ptr [rbx + 8], eax'),
+    ('480fba750830',    'btr qword ptr [rbp + 8], 0x30'),
+
+    # conditional sets and moves
+    ('0f92c0',          'setb al'),
+    ('0f9fc1',          'setg cl'),
+    ('0f95c2',          'setne dl'),
+    ('480f42c3',        'cmovb rax, rbx'),
+    ('0f4dca',          'cmovge ecx, edx'),
+
+    # moves and the stack
+    ('480fc1d8',        'xadd rax, rbx'),
+    ('4893',            'xchg rax, rbx'),
+    ('480fbec3',        'movsx rax, bl'),
+    ('0fb60e',          'movzx ecx, byte ptr [rsi]'),
+    ('4863c1',          'movsxd rax, ecx'),
+    ('488d448b08',      'lea rax, [rbx + rcx*4 + 8]'),
+    ('488b442408',      'mov rax, qword ptr [rsp + 8]'),
+    ('48894c24f8',      'mov qword ptr [rsp - 8], rcx'),
+    ('89048f',          'mov dword ptr [rdi + rcx*4], eax'),
+    ('53',              'push rbx'),
+    ('59',              'pop rcx'),
+    ('4899',            'cqo'),
+
+    # control flow
+    ('0f8200000000',    'jb 6'),
+    ('0f8f00000000',    'jg 6'),
+    ('e900000000',      'jmp 5'),
+    ('e800000000',      'call 5'),
+    ('c3',              'ret'),
+
+    # bit counting
+    ('f3480fb8c3',      'popcnt rax, rbx'),
+    ('f30fb8ca',        'popcnt ecx, edx'),
+    ('f3480fbdc3',      'lzcnt rax, rbx'),
+    ('f30fbdca',        'lzcnt ecx, edx'),
+    ('f3480fbcc3',      'tzcnt rax, rbx'),
+    ('66f30fbcca',      'tzcnt cx, dx'),
+    ('480fbcc3',        'bsf rax, rbx'),
+    ('0fbdca',          'bsr ecx, edx'),
+
+    # string instructions
+    ('a4',              'movsb'),
+    ('48ab',            'stosq'),
+    ('f3a4',            'rep movsb'),
+    ('f348a5',          'rep movsq'),
+    ('f3aa',            'rep stosb'),
+    ('f3ab',            'rep stosd'),
+    ('f348ab',          'rep stosq'),
+    ('f3a6',            'repe cmpsb'),
+    ('f2a6',            'repne cmpsb'),
+    ('f348a7',          'repe cmpsq'),
+    ('f2ae',            'repne scasb'),
+    ('f3af',            'repe scasd'),
+
+    # sse addition and subtraction
+    ('660ffcc1',        'paddb xmm0, xmm1'),
+    ('660ffdc1',        'paddw xmm0, xmm1'),
+    ('660ffec1',        'paddd xmm0, xmm1'),
+    ('660fd4c1',        'paddq xmm0, xmm1'),
+    ('660ffe06',        'paddd xmm0, xmmword ptr [rsi]'),
+    ('660ff8c1',        'psubb xmm0, xmm1'),
+    ('660ff9c1',        'psubw xmm0, xmm1'),
+    ('660ffac1',        'psubd xmm0, xmm1'),
+    ('660ffbc1',        'psubq xmm0, xmm1'),
+
+    # sse compares
+    ('660f74c1',        'pcmpeqb xmm0, xmm1'),
+    ('660f75c1',        'pcmpeqw xmm0, xmm1'),
+    ('660f76c1',        'pcmpeqd xmm0, xmm1'),
+    ('660f3829c1',      'pcmpeqq xmm0, xmm1'),
+    ('660f64c1',        'pcmpgtb xmm0, xmm1'),
+    ('660f65c1',        'pcmpgtw xmm0, xmm1'),
+    ('660f66c1',        'pcmpgtd xmm0, xmm1'),
+    ('660f3837c1',      'pcmpgtq xmm0, xmm1'),
+
+    # sse minimum and maximum
+    ('660fdac1',        'pminub xmm0, xmm1'),
+    ('660fdec1',        'pmaxub xmm0, xmm1'),
+    ('660f383ac1',      'pminuw xmm0, xmm1'),
+    ('660f383ec1',      'pmaxuw xmm0, xmm1'),
+    ('660f383bc1',      'pminud xmm0, xmm1'),
+    ('660f383fc1',      'pmaxud xmm0, xmm1'),
+
+    # sse logic
+    ('660fdbc1',        'pand xmm0, xmm1'),
+    ('660fdfc1',        'pandn xmm0, xmm1'),
+    ('660febc1',        'por xmm0, xmm1'),
+    ('660fefc1',        'pxor xmm0, xmm1'),
+
+    # sse shuffles, unpacks and moves
+    ('660f70c11b',      'pshufd xmm0, xmm1, 0x1b'),
+    ('660fd7c0',        'pmovmskb eax, xmm0'),
+    ('660f60c1',        'punpcklbw xmm0, xmm1'),
+    ('660f61c1',        'punpcklwd xmm0, xmm1'),
+    ('660f62c1',        'punpckldq xmm0, xmm1'),
+    ('660f6cc1',        'punpcklqdq xmm0, xmm1'),
+    ('660f73f803',      'pslldq xmm0, 3'),
+    ('660f73d805',      'psrldq xmm0, 5'),
+    ('660f6f06',        'movdqa xmm0, xmmword ptr [rsi]'),
+    ('f30f7f0f',        'movdqu xmmword ptr [rdi], xmm1'),
+    ('66480f6ec0',      'movq xmm0, rax'),
+
+    # avx
+    ('c5f1fcc2',        'vpaddb xmm0, xmm1, xmm2'),
+    ('c5f1d4c2',        'vpaddq xmm0, xmm1, xmm2'),
+    ('c5f1fbc2',        'vpsubq xmm0, xmm1, xmm2'),
+    ('c5f174c2',        'vpcmpeqb xmm0, xmm1, xmm2'),
+    ('c5f166c2',        'vpcmpgtd xmm0, xmm1, xmm2'),
+    ('c5f1dfc2',        'vpandn xmm0, xmm1, xmm2'),
+    ('c5f1dac2',        'vpminub xmm0, xmm1, xmm2'),
+    ('c5f5d4c2',        'vpaddq ymm0, ymm1, ymm2'),
+]
+
+instruction_ids = [disassembly for _, disassembly in instructions]
+
+
+# each mode that changes the IL that the translator emits, by the keyword
+# argument that enables it.
+modes = ['lazy_flags', 'bulk_memory', 'bit_counting', 'vector_lanes']
+
+
+def translate_function(mode=None):
+    """Return a translate function for the emulator that translates
+    x86_64 code with the given mode enabled.
+    """
+
+    if mode is None:
+        return functools.partial(translator.translate, x86_64=True)
+
+    return functools.partial(translator.translate, x86_64=True, **{mode: True})
+
+
+def translate(code, mode=None):
+    """Translate the native instruction at the start of code."""
+
+    return list(translate_function(mode)(code, code_address))[0]
+
+
+def _materialise_il():
+    ctx = translator._mode_context(
+        True, False, False, (True, False, False, False))
+    flags.materialise(ctx)
+    return ctx.finalise()
+
+
+# computes the lazy flags into the flag registers, so that the state after
+# an instruction translated with lazy_flags can be compared.
+materialise_il = _materialise_il()
+
+
+def is_lazy(name):
+    return name.startswith('lazy_')
+
+
+def register_sizes(ils):
+    """Return the size of each native register used by any of the IL."""
+
+    sizes = dict()
+    for il in ils:
+        for ri in il:
+            for operand in (ri.input0, ri.input1, ri.output):
+                if is_variable(operand) and not is_temporary(operand):
+                    size = max(sizes.get(operand.name, 0), operand.size)
+                    sizes[operand.name] = size
+
+    return sizes
+
+
+def random_registers(generator, sizes):
+    """Return random values for registers, biased towards the edge cases
+    of the instructions that use them.
+    """
+
+    registers = dict()
+    for name, size in sorted(sizes.items()):
+        if is_lazy(name):
+            continue
+
+        if name in FLAGS:
+            value = generator.randrange(2)
+        elif name == 'rcx':
+            # bounds the repeated string instructions
+            value = generator.randrange(40)
+        elif name in _pointer_registers:
+            value = generator.choice(_pointers)
+        else:
+            value = generator.choice([
+                0,
+                1,
+                mask(size),
+                sign_bit(size),
+                sign_bit(size) - 1,
+                generator.randrange(64),
+                generator.getrandbits(size),
+            ])
+
+        registers[name] = value & mask(size)
+
+    return registers
+
+
+def _random_memory(generator):
+    # low-entropy bytes, so that compares and scans stop at varying places
+    source = bytes(
+        generator.choice([0, 1, 0x80, 0xff, generator.randrange(256)])
+        for _ in range(data_size))
+    destination = bytearray(source)
+    for _ in range(16):
+        destination[generator.randrange(data_size)] = generator.randrange(256)
+
+    return source, bytes(destination)
+
+
+_generator = random.Random(0x5eed)
+
+# memory images that each run starts with
+memories = [_random_memory(_generator) for _ in range(8)]
+
+
+def write_image(memory, image):
+    """Write a memory image to memory."""
+
+    source, destination = image
+    memory.write(source_address, source)
+    memory.write(destination_address, destination)
+
+
+def new_memory(image, code=b''):
+    """Return a Memory holding a memory image and code."""
+
+    memory = Memory()
+    write_image(memory, image)
+    if code:
+        memory.write(code_address, code)
+
+    return memory
+
+
+def memory_contents(memory):
+    """Return the pages of memory that aren't all zero."""
+
+    return dict((number, bytes(page)) for number, page in memory.pages.items()
+                if any(page))
+
+
+def run(il, registers, image, materialise=False):
+    """Run the IL of one native instruction on a machine state.
+
+    Returns:
+        A tuple of the outcome, which is the target of a jump, None or why
+    the IL failed, the native registers and the memory contents.
+    """
+
+    interpreter = Interpreter(None, new_memory(image))
+    interpreter.registers.update(registers)
+
+    try:
+        outcome = interpreter.execute(il)
+        if materialise:
+            interpreter.execute(materialise_il)
+    except EmulationError as error:
+        outcome = str(error)
+
+    registers = dict((name, value)
+                     for name, value in interpreter.registers.items()
+                     if not is_lazy(name))
+
+    return outcome, registers, memory_contents(interpreter.memory)
+
+
+def compare_runs(expected, actual, context):
+    """Check that two results from run agree.
+
+    Registers missing from the expected result have been made undefined,
+    so can hold anything in the actual one.
+    """
+
+    outcome, registers, memory = expected
+    assert actual[0] == outcome, context
+
+    if isinstance(outcome, str):
+        return
+
+    for name, value in registers.items():
+        assert actual[1].get(name, 0) == value, '{}: {}'.format(context, name)
+
+    assert actual[2] == memory, context
@@ -20,6 +20,12 @@ This module contains a couple of helper functions used in more than one
 translator module.
 """
 
+import functools
+import threading
+
+import reil.native as native
+
+
 def carry_bit(size):
     """The mask required for the carry bit on a computation with a
     result of bit-size 'size'.
@@ -48,4 +54,237 @@ def mask(size):
     elif size == 64:
         return 0xffffffffffffffff
     elif size == 128:
-        return 0xffffffffffffffffffffffffffffffff
\ No newline at end of file
+        return 0xffffffffffffffffffffffffffffffff
+
+_window_size = 0x1000
+
+# longest instruction on any of the supported architectures, rounded up
+_max_instruction_size = 16
+
+
+def disassemble_block(disassembler, code_bytes, base_address, batch=8):
+    """Disassemble a buffer a few instructions at a time.
+
+    capstone decodes everything that it is given before returning the
+    first instruction, which is mostly wasted when the caller stops at
+    the end of the first basic block. Decoding stops at the first
+    instruction that can't be decoded, as with disasm.
+    """
+
+    offset = 0
+    while offset < len(code_bytes):
+        window = code_bytes[offset:offset + batch * _max_instruction_size]
+
+        count = 0
+        for i in disassembler.disasm(window, base_address + offset, batch):
+            count += 1
+            yield i
+
+        if count < batch:
+            return
+
+        offset = i.address + i.size - base_address
+
+
+
+def disassemble_range(disassembler, code_bytes, base_address, skip=1):
+    """Linear sweep disassembly of a whole buffer.
+
+    The buffer is decoded a window at a time with a single capstone
+    handle, so that the decoded instructions for a large buffer are never
+    all held in memory at once. Bytes that can't be decoded are skipped
+    in steps of 'skip' bytes, leaving a gap in the instruction addresses.
+    """
+
+    offset = 0
+    while offset < len(code_bytes):
+        window = code_bytes[offset:offset + _window_size]
+        next_offset = offset
+
+        for i in disassembler.disasm(window, base_address + offset):
+            next_offset = i.address - base_address + i.size
+            yield i
+
+        if next_offset == offset:
+            # nothing could be decoded at offset
+            next_offset += skip
+
+        offset = next_offset
+
+
+class ContextPool(object):
+    """Per-thread pool of translation contexts.
+
+    Building a translation context creates a capstone handle and the
+    register tables for the mode, which is far more expensive than
+    translating a short block. The pool builds each context once per
+    thread and hands the same one back on every later request from that
+    thread, so contexts are reused without being shared between threads.
+
+    Args:
+        factory (callable): Called with the key to build a new context.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+
+
+    def get(self, *key):
+        """Return this thread's context for key, building it if needed."""
+
+        contexts = getattr(self._local, 'contexts', None)
+        if contexts is None:
+            contexts = self._local.contexts = dict()
+
+        ctx = contexts.get(key)
+        if ctx is None:
+            ctx = contexts[key] = self._factory(*key)
+
+        return ctx
+
+
+def translate_block(context, translate, ends_basic_block, code_bytes,
+                    base_address):
+    """Translate the first basic block in a buffer, an instruction at a
+    time.
+
+    Args:
+        context (callable): Returns this thread's translation context, with
+    the translation mode set.
+        translate (callable): The translator's function from a context and
+    a capstone instruction to the IL for that instruction.
+        ends_basic_block (callable): The translator's function that decides
+    whether a capstone instruction ends a basic block.
+        code_bytes (bytes): The code bytes to translate.
+        base_address (int): The address of the first code byte.
+
+    Yields:
+        A native.Instruction for each instruction in the block.
+    """
+
+    ctx = context()
+
+    for i in disassemble_block(ctx.disassembler, code_bytes, base_address):
+        # the context is shared by every generator on this thread, so the
+        # mode has to be set again each time this one resumes.
+        ctx = context()
+
+        mnemonic = '{} {}'.format(i.mnemonic, i.op_str)
+        end = ends_basic_block(i)
+        yield native.Instruction(
+            i.address, mnemonic, translate(ctx, i), end, i.size)
+
+        if end:
+            break
+
+
+def _translate_lazy(context, translate, code_bytes, address):
+    ctx = context()
+
+    # the instruction is decoded again rather than holding on to the
+    # capstone instruction and all its details until the IL is needed.
+    for i in ctx.disassembler.disasm(code_bytes, address, 1):
+        return translate(ctx, i)
+
+
+def translate_block_lazy(context, translate, ends_basic_block, code_bytes,
+                         base_address):
+    """As translate_block, but each instruction is only translated when
+    its IL is first used.
+
+    Yields:
+        A native.LazyInstruction for each instruction in the block.
+    """
+
+    ctx = context()
+
+    for i in disassemble_block(ctx.disassembler, code_bytes, base_address):
+
+        mnemonic = '{} {}'.format(i.mnemonic, i.op_str)
+        end = ends_basic_block(i)
+        offset = i.address - base_address
+        il = functools.partial(
+            _translate_lazy, context, translate,
+            code_bytes[offset:offset + i.size], i.address)
+        yield native.LazyInstruction(
+            i.address, mnemonic, il, end, i.size)
+
+        if end:
+            break
+
+
+def translate_blocks(context, translate, ends_basic_block, code_bytes,
+                     base_address, skip):
+    """Linear sweep translation of a whole buffer into basic blocks.
+
+    The arguments are as for translate_block; bytes that can't be decoded
+    are skipped in steps of 'skip' bytes, and also end a basic block.
+
+    Returns:
+        A list of native.BasicBlock.
+    """
+
+    ctx = context()
+
+    blocks = []
+    instructions = []
+    next_address = None
+
+    for i in disassemble_range(ctx.disassembler, code_bytes, base_address, skip):
+
+        if instructions and i.address != next_address:
+            # undecodable bytes also end a basic block
+            blocks.append(native.BasicBlock(
+                instructions[0].address, next_address, instructions))
+            instructions = []
+
+        mnemonic = '{} {}'.format(i.mnemonic, i.op_str)
+        end = ends_basic_block(i)
+        instructions.append(native.Instruction(
+            i.address, mnemonic, translate(ctx, i), end, i.size))
+        next_address = i.address + i.size
+
+        if end:
+            blocks.append(native.BasicBlock(
+                instructions[0].address, next_address, instructions))
+            instructions = []
+
+    if instructions:
+        blocks.append(native.BasicBlock(
+            instructions[0].address, next_address, instructions))
+
+    return blocks
+
+
+def scan_range(ctx, code_bytes, base_address, skip, ends_basic_block,
+               branch_target, block_ends):
+    """Linear sweep of a whole buffer that reports the instruction
+    boundaries without translating anything.
+
+    The sweep uses ctx.scanner, a capstone handle with detail turned off.
+    Whether an instruction ends a basic block depends only on its id, so
+    ends_basic_block is called on a detailed decoding of the first
+    instance of each id and the result is remembered in block_ends.
+    Instructions that end a basic block are decoded in detail again to
+    find their targets.
+
+    Yields:
+        (address, size, ends_basic_block, target) for each instruction,
+    where target is the destination of a direct branch, or None.
+    """
+
+    for i in disassemble_range(ctx.scanner, code_bytes, base_address, skip):
+        end = block_ends.get(i.id)
+        target = None
+
+        if end is None or end:
+            offset = i.address - base_address
+            window = code_bytes[offset:offset + i.size]
+
+            for detailed in ctx.disassembler.disasm(window, i.address, 1):
+                end = block_ends[i.id] = ends_basic_block(detailed)
+                if end:
+                    target = branch_target(detailed)
+
+        yield (i.address, i.size, end, target)
@@ -28,6 +28,7 @@ from reil.shorthand import *
 from reil.utilities import *
 
 import reil.x86.conditional as conditional
+import reil.x86.flags as flags
 import reil.x86.operand as operand
 from reil.x86.utilities import *
 
@@ -75,6 +76,10 @@ def _arithmetic_set_flags(ctx, sign_a, sign_b, result, cf=True):
 
 
 def _add_set_flags(ctx, a, b, result, cf=True):
+    if ctx.lazy_flags:
+        flags.set_arithmetic(ctx, a, b, result, cf=cf)
+        return
+
     size = a.size
 
     sign_a = ctx.tmp(size)
@@ -102,6 +107,10 @@ def _imul_set_flags(ctx, result):
 
 
 def _sub_set_flags(ctx, a, b, result, cf=True):
+    if ctx.lazy_flags:
+        flags.set_arithmetic(ctx, a, b, result, subtract=True, cf=cf)
+        return
+
     size = a.size
 
     tmp0 = ctx.tmp(size)
@@ -134,8 +143,10 @@ def x86_adc(ctx, i):
 
     result = ctx.tmp(a.size * 2)
 
+    carry = flags.get(ctx, 'cf')
+
     ctx.emit(  add_  (a, b, result))
-    ctx.emit(  add_  (result, r('cf', 8), result))
+    ctx.emit(  add_  (result, carry, result))
 
     _add_set_flags(ctx, a, b, result)
 
@@ -463,8 +474,10 @@ def x86_sbb(ctx, i):
 
     result = ctx.tmp(a.size * 2)
 
+    carry = flags.get(ctx, 'cf')
+
     ctx.emit(  sub_  (a, b, result))
-    ctx.emit(  sub_  (result, r('cf', 8), result))
+    ctx.emit(  sub_  (result, carry, result))
 
     _sub_set_flags(ctx, a, b, result)
 
@@ -72,21 +72,30 @@ def _read_bit(ctx, i, base_index, offset_index):
         byte = ctx.tmp(8)
         bitmask = ctx.tmp(8)
 
+        # the address may be shared with the rest of the instruction, so
+        # the adjusted address goes in a new temporary.
+        address = ctx.tmp(base.size)
+
+        # the labels are named after a temporary so that they are unique
+        # within the instruction.
+        negative_offset = 'negative_offset_' + byte_offset.name
+        base_calculated = 'base_calculated_' + byte_offset.name
+
         ctx.emit(  and_  (offset, imm(sign_bit(offset.size), offset.size), tmp0))
         ctx.emit(  bisnz_(tmp0, offset_sign))
         ctx.emit(  and_  (offset, imm(~sign_bit(offset.size), offset.size), tmp1))
         ctx.emit(  div_  (tmp1, imm(8, offset.size), byte_offset))
         ctx.emit(  mod_  (tmp1, imm(8, offset.size), tmp2))
 
-        ctx.emit(  jcc_  (offset_sign, 'negative_offset'))
-        ctx.emit(  add_  (base, byte_offset, base))
-        ctx.emit(  jcc_  (imm(1, 8), 'base_calculated'))
+        ctx.emit(  jcc_  (offset_sign, negative_offset))
+        ctx.emit(  add_  (base, byte_offset, address))
+        ctx.emit(  jcc_  (imm(1, 8), base_calculated))
 
-        ctx.emit('negative_offset')
-        ctx.emit(  sub_  (base, byte_offset, base))
+        ctx.emit(negative_offset)
+        ctx.emit(  sub_  (base, byte_offset, address))
 
-        ctx.emit('base_calculated')
-        ctx.emit(  ldm_  (base, byte))
+        ctx.emit(base_calculated)
+        ctx.emit(  ldm_  (address, byte))
         ctx.emit(  lshl_ (imm(1, 8), tmp2, bitmask))
         ctx.emit(  and_  (byte, bitmask, byte))
         ctx.emit(  bisnz_(byte, bit))
@@ -115,30 +124,39 @@ def _write_bit(ctx, i, base_index, offset_index, bit):
         offset_sign = ctx.tmp(8)
         byte_offset = ctx.tmp(base.size)
         tmp0 = ctx.tmp(offset.size)
+        tmp1 = ctx.tmp(offset.size)
+        tmp2 = ctx.tmp(offset.size)
         byte = ctx.tmp(8)
         bitmask = ctx.tmp(8)
 
+        # as in _read_bit, neither the address nor the offset operand is
+        # written to.
+        address = ctx.tmp(base.size)
+
+        negative_offset = 'negative_offset_' + byte_offset.name
+        base_calculated = 'base_calculated_' + byte_offset.name
+
         ctx.emit(  and_  (offset, imm(sign_bit(offset.size), offset.size), tmp0))
         ctx.emit(  bisnz_(tmp0, offset_sign))
-        ctx.emit(  and_  (offset, imm(~sign_bit(offset.size), offset.size), offset))
-        ctx.emit(  div_  (offset, imm(8, offset.size), byte_offset))
-        ctx.emit(  mod_  (offset, imm(8, offset.size), offset))
+        ctx.emit(  and_  (offset, imm(~sign_bit(offset.size), offset.size), tmp1))
+        ctx.emit(  div_  (tmp1, imm(8, offset.size), byte_offset))
+        ctx.emit(  mod_  (tmp1, imm(8, offset.size), tmp2))
 
-        ctx.emit(  jcc_  (offset_sign, 'negative_offset'))
-        ctx.emit(  add_  (base, byte_offset, base))
-        ctx.emit(  jcc_  (imm(1, 8), 'base_calculated'))
+        ctx.emit(  jcc_  (offset_sign, negative_offset))
+        ctx.emit(  add_  (base, byte_offset, address))
+        ctx.emit(  jcc_  (imm(1, 8), base_calculated))
 
-        ctx.emit('negative_offset')
-        ctx.emit(  sub_  (base, byte_offset, base))
+        ctx.emit(negative_offset)
+        ctx.emit(  sub_  (base, byte_offset, address))
 
-        ctx.emit('base_calculated')
-        ctx.emit(  ldm_  (base, byte))
-        ctx.emit(  lshl_ (imm(1, 8), offset, bitmask))
+        ctx.emit(base_calculated)
+        ctx.emit(  ldm_  (address, byte))
+        ctx.emit(  lshl_ (imm(1, 8), tmp2, bitmask))
         ctx.emit(  xor_  (bitmask, imm(mask(8), 8), bitmask))
         ctx.emit(  and_  (byte, bitmask, byte))
-        ctx.emit(  lshl_ (bit, offset, bitmask))
-        ctx.emit(  or_   (byte, bit, byte))
-        ctx.emit(  stm_  (byte, base))
+        ctx.emit(  lshl_ (bit, tmp2, bitmask))
+        ctx.emit(  or_   (byte, bitmask, byte))
+        ctx.emit(  stm_  (byte, address))
 
     else:
         # simple case, it's a register
@@ -369,18 +387,22 @@ def x86_bsf(ctx, i):
     # set up loop variables and clear zf
     ctx.emit('non-zero')
     ctx.emit(  str_  (imm(0, 8), r('zf', 8)))
-    ctx.emit(  str_  (imm(0, a.size), index))
-    ctx.emit(  str_  (imm(1, a.size), bit))
 
-    # LOOP
-    ctx.emit('loop')
-    ctx.emit(  and_  (a, bit, tmp0))
-    ctx.emit(  jcc_  (tmp0, 'found'))
+    if ctx.bit_counting:
+        ctx.emit(  ctz_  (a, index))
+    else:
+        ctx.emit(  str_  (imm(0, a.size), index))
+        ctx.emit(  str_  (imm(1, a.size), bit))
 
-    # update these for the next one
-    ctx.emit(  add_  (index, imm(1, a.size), index))
-    ctx.emit(  lshl_ (bit, imm(1, a.size), bit))
-    ctx.emit(  jcc_  (imm(1, 8), 'loop'))
+        # LOOP
+        ctx.emit('loop')
+        ctx.emit(  and_  (a, bit, tmp0))
+        ctx.emit(  jcc_  (tmp0, 'found'))
+
+        # update these for the next one
+        ctx.emit(  add_  (index, imm(1, a.size), index))
+        ctx.emit(  lshl_ (bit, imm(1, a.size), bit))
+        ctx.emit(  jcc_  (imm(1, 8), 'loop'))
 
     # zero-case epilogue
     ctx.emit('found')
@@ -414,18 +436,23 @@ def x86_bsr(ctx, i):
     # set up loop variables and clear zf
     ctx.emit('non-zero')
     ctx.emit(  str_  (imm(0, 8), r('zf', 8)))
-    ctx.emit(  str_  (imm(a.size - 1, a.size), index))
-    ctx.emit(  str_  (imm(sign_bit(a.size), a.size), bit))
 
-    # LOOP
-    ctx.emit('loop')
-    ctx.emit(  and_  (a, bit, tmp0))
-    ctx.emit(  jcc_  (tmp0, 'found'))
+    if ctx.bit_counting:
+        ctx.emit(  clz_  (a, tmp0))
+        ctx.emit(  sub_  (imm(a.size - 1, a.size), tmp0, index))
+    else:
+        ctx.emit(  str_  (imm(a.size - 1, a.size), index))
+        ctx.emit(  str_  (imm(sign_bit(a.size), a.size), bit))
 
-    # update these for the next one
-    ctx.emit(  sub_  (index, imm(1, a.size), index))
-    ctx.emit(  lshr_ (bit, imm(1, a.size), bit))
-    ctx.emit(  jcc_  (imm(1, 8), 'loop'))
+        # LOOP
+        ctx.emit('loop')
+        ctx.emit(  and_  (a, bit, tmp0))
+        ctx.emit(  jcc_  (tmp0, 'found'))
+
+        # update these for the next one
+        ctx.emit(  sub_  (index, imm(1, a.size), index))
+        ctx.emit(  lshr_ (bit, imm(1, a.size), bit))
+        ctx.emit(  jcc_  (imm(1, 8), 'loop'))
 
     # zero-case epilogue
     ctx.emit('found')
@@ -495,51 +522,111 @@ def x86_bzhi(ctx, i):
     ctx.emit(  undef_(r('af', 8)))
 
 
-def x86_lzcnt(ctx, i):
+def _count_zeros(ctx, i, leading):
     a = operand.get(ctx, i, 1)
 
-    bit = imm(1, a.size)
-    index = imm(0, a.size)
+    result = ctx.tmp(a.size)
 
-    bit = ctx.tmp(a.size)
-    index = ctx.tmp(a.size)
-    tmp0 = ctx.tmp(a.size)
+    if ctx.bit_counting:
+        if leading:
+            ctx.emit(  clz_  (a, result))
+        else:
+            ctx.emit(  ctz_  (a, result))
+    else:
+        bit = ctx.tmp(a.size)
+        tmp0 = ctx.tmp(a.size)
 
-    ctx.emit(  jcc_  (a, 'non-zero'))
+        ctx.emit(  str_  (imm(a.size, a.size), result))
+        ctx.emit(  jcc_  (a, 'non-zero'))
+        ctx.emit(  jcc_  (imm(1, 8), 'done'))
 
-    # if a is zero
-    ctx.emit(  str_  (imm(1, 8), r('zf', 8)))
-    operand.set(i, 0, imm(a.size, a.size))
-    ctx.emit(  jcc_  (imm(1, 8), 'done'))
+        # set up loop variables
+        ctx.emit('non-zero')
+        ctx.emit(  str_  (imm(0, a.size), result))
+        if leading:
+            ctx.emit(  str_  (imm(sign_bit(a.size), a.size), bit))
+        else:
+            ctx.emit(  str_  (imm(1, a.size), bit))
 
-    # set up loop variables and clear zf
-    ctx.emit('non-zero')
-    ctx.emit(  str_  (imm(0, 8), r('zf', 8)))
-    ctx.emit(  str_  (imm(0, a.size), index))
-    ctx.emit(  str_  (imm(1, a.size), bit))
+        # LOOP
+        ctx.emit('loop')
+        ctx.emit(  and_  (a, bit, tmp0))
+        ctx.emit(  jcc_  (tmp0, 'done'))
 
-    # LOOP
-    ctx.emit('loop')
-    ctx.emit(  and_  (a, bit, tmp0))
-    ctx.emit(  jcc_  (tmp0, 'found'))
+        # update these for the next one
+        ctx.emit(  add_  (result, imm(1, a.size), result))
+        if leading:
+            ctx.emit(  lshr_ (bit, imm(1, a.size), bit))
+        else:
+            ctx.emit(  lshl_ (bit, imm(1, a.size), bit))
+        ctx.emit(  jcc_  (imm(1, 8), 'loop'))
 
-    # update these for the next one
-    ctx.emit(  add_  (index, imm(1, a.size), index))
-    ctx.emit(  lshr_ (bit, imm(1, a.size), bit))
-    ctx.emit(  jcc_  (imm(1, 8), 'loop'))
+        ctx.emit('done')
 
-    # zero-case epilogue
-    ctx.emit('found')
-    operand.set(ctx, i, 0, index, clear=True)
+    ctx.emit(  bisz_ (a, r('cf', 8)))
+    set_zf(ctx, result)
+
+    operand.set(ctx, i, 0, result, clear=True)
 
-    ctx.emit('done')
-    ctx.emit(  undef_(r('cf', 8)))
     ctx.emit(  undef_(r('of', 8)))
     ctx.emit(  undef_(r('sf', 8)))
     ctx.emit(  undef_(r('pf', 8)))
     ctx.emit(  undef_(r('af', 8)))
 
 
+def x86_lzcnt(ctx, i):
+    _count_zeros(ctx, i, True)
+
+
+def x86_popcnt(ctx, i):
+    a = operand.get(ctx, i, 1)
+
+    size = a.size
+    result = ctx.tmp(size)
+
+    if ctx.bit_counting:
+        ctx.emit(  popcnt_(a, result))
+    else:
+        tmp0 = ctx.tmp(size)
+        tmp1 = ctx.tmp(size)
+        tmp2 = ctx.tmp(size)
+        tmp3 = ctx.tmp(size)
+        tmp4 = ctx.tmp(size)
+        tmp5 = ctx.tmp(size)
+        tmp6 = ctx.tmp(size)
+        tmp7 = ctx.tmp(size)
+        tmp8 = ctx.tmp(size)
+        tmp9 = ctx.tmp(size)
+
+        # see http://graphics.stanford.edu/~seander/bithacks.html#CountBitsSetParallel
+        m1 = 0x5555555555555555 & mask(size)
+        m2 = 0x3333333333333333 & mask(size)
+        m4 = 0x0f0f0f0f0f0f0f0f & mask(size)
+        h01 = 0x0101010101010101 & mask(size)
+
+        ctx.emit(  lshr_ (a, imm(1, size), tmp0))
+        ctx.emit(  and_  (tmp0, imm(m1, size), tmp1))
+        ctx.emit(  sub_  (a, tmp1, tmp2))
+        ctx.emit(  and_  (tmp2, imm(m2, size), tmp3))
+        ctx.emit(  lshr_ (tmp2, imm(2, size), tmp4))
+        ctx.emit(  and_  (tmp4, imm(m2, size), tmp5))
+        ctx.emit(  add_  (tmp3, tmp5, tmp6))
+        ctx.emit(  lshr_ (tmp6, imm(4, size), tmp7))
+        ctx.emit(  add_  (tmp6, tmp7, tmp8))
+        ctx.emit(  and_  (tmp8, imm(m4, size), tmp9))
+        ctx.emit(  mul_  (tmp9, imm(h01, size), tmp9))
+        ctx.emit(  lshr_ (tmp9, imm(size - 8, size), result))
+
+    operand.set(ctx, i, 0, result, clear=True)
+
+    set_zf(ctx, result)
+    ctx.emit(  str_  (imm(0, 8), r('cf', 8)))
+    ctx.emit(  str_  (imm(0, 8), r('of', 8)))
+    ctx.emit(  str_  (imm(0, 8), r('sf', 8)))
+    ctx.emit(  str_  (imm(0, 8), r('pf', 8)))
+    ctx.emit(  str_  (imm(0, 8), r('af', 8)))
+
+
 def x86_rol(ctx, i):
     a = operand.get(ctx, i, 0)
     b = operand.get(ctx, i, 1)
@@ -888,3 +975,7 @@ def x86_shrd(ctx, i):
     _shift_set_flags(ctx, result)
 
     operand.set(ctx, i, 0, result)
+
+
+def x86_tzcnt(ctx, i):
+    _count_zeros(ctx, i, False)
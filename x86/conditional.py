@@ -25,6 +25,8 @@ This file contains helpers for x86 conditional instructions
 from reil.shorthand import *
 from reil.utilities import *
 
+import reil.x86.flags as flags
+
 A    = 0
 AE   = 1
 B    = 2
@@ -58,20 +60,20 @@ def condition(ctx, cc):
         if cc == A:
             # above (CF == 0 && ZF == 0)
             tmp0 = ctx.tmp(8)
-            ctx.emit(  or_    (r('cf', 8), r('zf', 8), tmp0))
+            ctx.emit(  or_    (flags.get(ctx, 'cf'), flags.get(ctx, 'zf'), tmp0))
             ctx.emit(  bisz_  (tmp0, cond))
 
         elif cc == AE:
             # above or equal (CF == 0)
-            ctx.emit(  bisz_  (r('cf', 8), cond))
+            ctx.emit(  bisz_  (flags.get(ctx, 'cf'), cond))
 
         elif cc == B:
             # below (CF == 1)
-            ctx.emit(  bisnz_ (r('cf', 8), cond))
+            ctx.emit(  bisnz_ (flags.get(ctx, 'cf'), cond))
 
         elif cc == BE:
             # below or equal (CF == 1 || ZF == 1)
-            ctx.emit(  or_    (r('cf', 8), r('zf', 8), cond))
+            ctx.emit(  or_    (flags.get(ctx, 'cf'), flags.get(ctx, 'zf'), cond))
 
         elif cc == CXZ:
             # if cx is zero (cx == 0)
@@ -87,60 +89,60 @@ def condition(ctx, cc):
 
         elif cc == E:
             # equal (ZF == 1)
-            ctx.emit(  bisnz_ (r('zf', 8), cond))
+            ctx.emit(  bisnz_ (flags.get(ctx, 'zf'), cond))
 
         elif cc == G:
             # greater (ZF == 0 && SF == OF)
             tmp0 = ctx.tmp(8)
             tmp1 = ctx.tmp(8)
-            ctx.emit(  equ_   (r('sf', 8), r('of', 8), tmp0))
-            ctx.emit(  bisz_  (r('zf', 8), tmp1))
+            ctx.emit(  equ_   (flags.get(ctx, 'sf'), flags.get(ctx, 'of'), tmp0))
+            ctx.emit(  bisz_  (flags.get(ctx, 'zf'), tmp1))
             ctx.emit(  and_   (tmp0, tmp1, cond))
 
         elif cc == GE:
             # greater or equal (SF == OF)
-            ctx.emit(  equ_   (r('sf', 8), r('of', 8), cond))
+            ctx.emit(  equ_   (flags.get(ctx, 'sf'), flags.get(ctx, 'of'), cond))
 
         elif cc == L:
             # less (SF != OF)
             tmp0 = ctx.tmp(8)
-            ctx.emit(  equ_   (r('sf', 8), r('of', 8), tmp0))
+            ctx.emit(  equ_   (flags.get(ctx, 'sf'), flags.get(ctx, 'of'), tmp0))
             ctx.emit(  bisz_  (tmp0, cond))
 
         elif cc == LE:
             # less or equal (ZF == 1 || SF != OF)
             tmp0 = ctx.tmp(8)
             tmp1 = ctx.tmp(8)
-            ctx.emit(  equ_   (r('sf', 8), r('of', 8), tmp0))
+            ctx.emit(  equ_   (flags.get(ctx, 'sf'), flags.get(ctx, 'of'), tmp0))
             ctx.emit(  bisz_  (tmp0, tmp1))
-            ctx.emit(  or_    (r('zf', 8), tmp1, cond))
+            ctx.emit(  or_    (flags.get(ctx, 'zf'), tmp1, cond))
 
         elif cc == NE:
             # not equal (ZF == 0)
-            ctx.emit(  bisz_  (r('zf', 8), cond))
+            ctx.emit(  bisz_  (flags.get(ctx, 'zf'), cond))
 
         elif cc == NO:
             # not overflow (OF == 0)
-            ctx.emit(  bisz_  (r('of', 8), cond))
+            ctx.emit(  bisz_  (flags.get(ctx, 'of'), cond))
 
         elif cc == NP:
             # not parity (PF == 0)
-            ctx.emit(  bisz_  (r('pf', 8), cond))
+            ctx.emit(  bisz_  (flags.get(ctx, 'pf'), cond))
 
         elif cc == NS:
             # not sign (SF == 0)
-            ctx.emit(  bisz_  (r('sf', 8), cond))
+            ctx.emit(  bisz_  (flags.get(ctx, 'sf'), cond))
 
         elif cc == O:
             # overflow (OF == 1)
-            ctx.emit(  bisnz_ (r('of', 8), cond))
+            ctx.emit(  bisnz_ (flags.get(ctx, 'of'), cond))
 
         elif cc == P:
             # parity (PF == 1)
-            ctx.emit(  bisnz_ (r('pf', 8), cond))
+            ctx.emit(  bisnz_ (flags.get(ctx, 'pf'), cond))
 
         elif cc == S:
             # sign (SF == 1)
-            ctx.emit(  bisnz_ (r('sf', 8), cond))
+            ctx.emit(  bisnz_ (flags.get(ctx, 'sf'), cond))
 
     return cond
\ No newline at end of file
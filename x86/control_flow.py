@@ -31,9 +31,17 @@ from reil.utilities import *
 
 # Helpers
 
+def branch_target(ctx, i):
+    if operand.is_immediate(ctx, i, 0):
+        # relative branch, capstone has already computed the target
+        return ctx.address_imm(i, i.operands[0].imm, ctx.word_size)
+
+    return operand.get(ctx, i, 0)
+
+
 def conditional_jump(ctx, i, condition):
     c = conditional.condition(ctx, condition)
-    dst = operand.get(ctx, i, 0)
+    dst = branch_target(ctx, i)
 
     ctx.emit(  jcc_   (c, dst))
 
@@ -55,9 +63,9 @@ def _push(ctx, i, value):
 
 def x86_call(ctx, i):
     """call procedure"""
-    dst = operand.get(ctx, i, 0)
+    dst = branch_target(ctx, i)
 
-    _push(ctx, i, imm(i.address + i.size, ctx.word_size))
+    _push(ctx, i, ctx.address_imm(i, i.address + i.size, ctx.word_size))
 
     ctx.emit(  jcc_  (imm(1, 8), dst))
 
@@ -186,7 +194,7 @@ def x86_js(ctx, i):
 
 def x86_loop(ctx, i):
     c = ctx.tmp(8)
-    dst = operand.get(ctx, i, 0)
+    dst = branch_target(ctx, i)
 
     ctx.emit(  sub_  (ctx.counter, imm(1, ctx.counter.size), ctx.counter))
     ctx.emit(  equ_  (ctx.counter, imm(0, ctx.counter.size), c))
@@ -195,7 +203,7 @@ def x86_loop(ctx, i):
 
 def x86_loope(ctx, i):
     c = conditional.condition(ctx, conditional.E)
-    dst = operand.get(ctx, i, 0)
+    dst = branch_target(ctx, i)
 
     tmp0 = ctx.tmp(8)
 
@@ -207,7 +215,7 @@ def x86_loope(ctx, i):
 
 def x86_loopne(ctx, i):
     c = conditional.condition(ctx, conditional.NE)
-    dst = operand.get(ctx, i, 0)
+    dst = branch_target(ctx, i)
 
     tmp0 = ctx.tmp(8)
 
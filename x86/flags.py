@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2014 Mark Brand - c01db33f (at) gmail.com
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""reil.x86.flags - x86 and x86_64 translators
+
+This module generates REIL (reverse engineering intermediate language)
+IL from x86 and x86_64 machine code.
+
+This file contains the helpers for the lazy flags translation mode. In
+this mode the arithmetic and logic instructions don't compute cf, of,
+sf, zf and pf; instead they record their inputs and result in a few
+pseudo-registers, and the flags are only computed from those where an
+instruction actually reads them:
+
+    lazy_op     0 if the flag registers hold the current flags, 1 if they
+                must be computed from the registers below
+    lazy_a      the first input
+    lazy_b      the second input, with its sign bit inverted for a
+                subtraction, so that one overflow test covers both
+    lazy_result the result, computed at twice the size of the inputs so
+                that bit n (for n-bit inputs) holds the carry
+    lazy_sign   the sign bit for the size of the inputs
+
+A logic operation stores its result as both inputs, which makes cf and
+of come out as zero without needing a separate kind of operation.
+
+Instructions that don't know about lazy flags but use the flags are
+translated with a prefix that computes all the flags into the flag
+registers first, so lazy_op must be 0 at the start of execution.
+"""
+
+import reil.definitions as reil
+from reil.shorthand import *
+from reil.utilities import *
+
+from reil.x86.utilities import *
+
+
+LAZY_FLAGS = ('cf', 'of', 'pf', 'sf', 'zf')
+"""The flags that are computed lazily; af and df are always stored."""
+
+_op = r('lazy_op', 8)
+_a = r('lazy_a', 64)
+_b = r('lazy_b', 64)
+_result = r('lazy_result', 128)
+_sign = r('lazy_sign', 64)
+
+
+def _compute(ctx, name, output):
+    # compute the flag called name from the lazy state into output
+
+    if name == 'cf':
+        carry = ctx.tmp(128)
+        ctx.emit(  lshl_ (_sign, imm(1, 8), carry))
+        ctx.emit(  and_  (_result, carry, carry))
+        ctx.emit(  bisnz_(carry, output))
+
+    elif name == 'of':
+        tmp0 = ctx.tmp(64)
+        tmp1 = ctx.tmp(64)
+        ctx.emit(  xor_  (_a, _result, tmp0))
+        ctx.emit(  xor_  (_b, _result, tmp1))
+        ctx.emit(  and_  (tmp0, tmp1, tmp0))
+        ctx.emit(  and_  (tmp0, _sign, tmp0))
+        ctx.emit(  bisnz_(tmp0, output))
+
+    elif name == 'pf':
+        set_pf(ctx, _result, output)
+
+    elif name == 'sf':
+        tmp0 = ctx.tmp(64)
+        ctx.emit(  and_  (_result, _sign, tmp0))
+        ctx.emit(  bisnz_(tmp0, output))
+
+    elif name == 'zf':
+        tmp0 = ctx.tmp(128)
+        ctx.emit(  lshl_ (_sign, imm(1, 8), tmp0))
+        ctx.emit(  sub_  (tmp0, imm(1, 128), tmp0))
+        ctx.emit(  and_  (_result, tmp0, tmp0))
+        ctx.emit(  bisz_ (tmp0, output))
+
+
+def get(ctx, name):
+    """Return an operand holding the value of the flag called name."""
+
+    if not ctx.lazy_flags or name not in LAZY_FLAGS:
+        return r(name, 8)
+
+    ctx.flags_handled = True
+
+    value = ctx.tmp(8)
+    concrete = ctx.tmp(8)
+    label = 'flag_{}'.format(value.index)
+
+    ctx.emit(  bisz_ (_op, concrete))
+    ctx.emit(  jcc_  (concrete, label + '_concrete'))
+
+    _compute(ctx, name, value)
+    ctx.emit(  jcc_  (imm(1, 8), label + '_done'))
+
+    ctx.emit(label + '_concrete')
+    ctx.emit(  str_  (r(name, 8), value))
+
+    ctx.emit(label + '_done')
+
+    return value
+
+
+def materialise(ctx):
+    """Compute all of the lazy flags into the flag registers, if they
+    aren't there already.
+    """
+
+    concrete = ctx.tmp(8)
+
+    ctx.emit(  bisz_ (_op, concrete))
+    ctx.emit(  jcc_  (concrete, 'flags_concrete'))
+
+    for name in LAZY_FLAGS:
+        _compute(ctx, name, r(name, 8))
+
+    ctx.emit(  str_  (imm(0, 8), _op))
+    ctx.emit('flags_concrete')
+
+
+def uses_flags(ris):
+    """True if the IL of a native instruction might read or write one of
+    the lazy flags directly.
+    """
+
+    for ri in ris:
+        if ri.opcode in (reil.UNKN, reil.SYS):
+            return True
+
+        for operand in (ri.input0, ri.input1, ri.output):
+            if (isinstance(operand, reil.RegisterOperand) and
+                    operand.name in LAZY_FLAGS):
+                return True
+
+    return False
+
+
+def set_arithmetic(ctx, a, b, result, subtract=False, cf=True):
+    """Record the flags for an addition or subtraction of a and b.
+
+    Args:
+        ctx: The translation context.
+        a: The first input.
+        b: The second input.
+        result: The result, at twice the size of the inputs.
+        subtract (bool, optional): True if result is a - b.
+        cf (bool, optional): False if the instruction leaves cf as it is.
+    """
+
+    ctx.flags_handled = True
+
+    size = a.size
+
+    if not cf:
+        # keep the current carry flag by moving it into the carry bit
+        # of the result.
+        carry = get(ctx, 'cf')
+        tmp0 = ctx.tmp(result.size)
+        tmp1 = ctx.tmp(result.size)
+
+        ctx.emit(  and_  (result, imm(mask(size), result.size), tmp0))
+        ctx.emit(  lshl_ (carry, imm(size, 8), tmp1))
+        ctx.emit(  or_   (tmp0, tmp1, tmp0))
+        result = tmp0
+
+    if subtract:
+        tmp0 = ctx.tmp(size)
+        ctx.emit(  xor_  (b, imm(sign_bit(size), size), tmp0))
+        b = tmp0
+
+    ctx.emit(  str_  (imm(1, 8), _op))
+    ctx.emit(  str_  (a, _a))
+    ctx.emit(  str_  (b, _b))
+    ctx.emit(  str_  (result, _result))
+    ctx.emit(  str_  (imm(sign_bit(size), 64), _sign))
+
+
+def set_logic(ctx, result):
+    """Record the flags for a logic operation, which clears cf and of."""
+
+    ctx.flags_handled = True
+
+    ctx.emit(  str_  (imm(1, 8), _op))
+    ctx.emit(  str_  (result, _a))
+    ctx.emit(  str_  (result, _b))
+    ctx.emit(  str_  (result, _result))
+    ctx.emit(  str_  (imm(sign_bit(result.size), 64), _sign))
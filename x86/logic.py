@@ -28,6 +28,7 @@ from reil.shorthand import *
 from reil.utilities import *
 
 import reil.x86.conditional as conditional
+import reil.x86.flags as flags
 import reil.x86.operand as operand
 from reil.x86.utilities import *
 
@@ -35,6 +36,9 @@ from reil.x86.utilities import *
 # Helpers
 
 def _logic_set_flags(ctx, result):
+    if ctx.lazy_flags:
+        flags.set_logic(ctx, result)
+        return
 
     size = result.size
 
@@ -32,6 +32,7 @@ from reil.utilities import *
 
 import reil.x86.arithmetic as arithmetic
 import reil.x86.conditional as conditional
+import reil.x86.flags as flags
 import reil.x86.operand as operand
 from reil.x86.utilities import *
 
@@ -62,7 +63,7 @@ def rep_prologue(ctx, i):
 
     # counter == 0 is only condition in which we terminate without executing
     ctx.emit(  bisz_ (ctx.counter, tmp))
-    ctx.emit(  jcc_  (tmp, imm(i.address + i.size, ctx.word_size)))
+    ctx.emit(  jcc_  (tmp, ctx.address_imm(i, i.address + i.size, ctx.word_size)))
 
 
 def rep_epilogue(ctx, i):
@@ -74,12 +75,12 @@ def rep_epilogue(ctx, i):
     if i.mnemonic.startswith('repne'):
         # repeat if counter > 0 and zf not set
         tmp = ctx.tmp(8)
-        ctx.emit(  bisz_ (r('zf', 8), tmp))
+        ctx.emit(  bisz_ (flags.get(ctx, 'zf'), tmp))
         ctx.emit(  and_  (tmp, cond, cond))
 
     elif i.mnemonic.startswith('repe') or 'cmps' in i.mnemonic:
         # repeat if counter > 0 and zf set
-        ctx.emit(  and_  (r('zf', 8), cond, cond))
+        ctx.emit(  and_  (flags.get(ctx, 'zf'), cond, cond))
 
     # we're not done, jump back to start of instruction
     ctx.emit(  jcc_  (cond, off(0)))
@@ -89,6 +90,73 @@ def rep_epilogue(ctx, i):
     #ctx.emit(  jcc_  (cond, imm(i.address, ctx.word_size)))
 
 
+def bulk_range(ctx, size, addresses):
+    """Emit IL to compute the operands of a bulk memory opcode that
+    replaces a whole rep prefixed string instruction.
+
+    Args:
+        ctx: The translation context.
+        size (int): The size in bits of each element.
+        addresses (list): The operands holding the address of the first
+    element of each block, as the string instruction uses them.
+
+    Returns:
+        (count, length, lows), where count is the number of bytes in
+    each block, length is the same as a signed value that is negative if
+    the direction flag is set, and lows are the lowest addresses of each
+    block.
+    """
+
+    count = ctx.tmp(ctx.word_size * 2)
+    length = ctx.tmp(ctx.word_size * 2)
+    extent = ctx.tmp(ctx.word_size * 2)
+    lows = [ctx.tmp(ctx.word_size) for _ in addresses]
+
+    ctx.emit(  mul_  (ctx.counter, imm(size // 8, ctx.word_size * 2), count))
+
+    ctx.emit(  jcc_  (r('df', 8), 'bulk_decrement'))
+    ctx.emit('bulk_increment')
+    ctx.emit(  str_  (count, length))
+    for address, low in zip(addresses, lows):
+        ctx.emit(  str_  (address, low))
+    ctx.emit(  jcc_  (imm(1, 8), 'bulk_set'))
+
+    ctx.emit('bulk_decrement')
+    # the elements are processed downwards, so the first element is the
+    # highest in each block.
+    ctx.emit(  sub_  (imm(0, ctx.word_size * 2), count, length))
+    ctx.emit(  sub_  (count, imm(size // 8, ctx.word_size * 2), extent))
+    for address, low in zip(addresses, lows):
+        tmp0 = ctx.tmp(ctx.word_size * 2)
+        ctx.emit(  sub_  (address, extent, tmp0))
+        ctx.emit(  and_  (tmp0, imm(mask(ctx.word_size), ctx.word_size * 2), low))
+    ctx.emit('bulk_set')
+
+    return count, length, lows
+
+
+def bulk_step(ctx, addresses, amount, outputs, label):
+    """Emit IL to move each of addresses on by amount bytes, in the
+    direction given by the direction flag, and write the results to
+    outputs.
+    """
+
+    ctx.emit(  jcc_  (r('df', 8), label + '_decrement'))
+    ctx.emit(label + '_increment')
+    for address, output in zip(addresses, outputs):
+        tmp0 = ctx.tmp(ctx.word_size * 2)
+        ctx.emit(  add_  (address, amount, tmp0))
+        ctx.emit(  and_  (tmp0, imm(mask(ctx.word_size), ctx.word_size * 2), output))
+    ctx.emit(  jcc_  (imm(1, 8), label + '_set'))
+
+    ctx.emit(label + '_decrement')
+    for address, output in zip(addresses, outputs):
+        tmp0 = ctx.tmp(ctx.word_size * 2)
+        ctx.emit(  sub_  (address, amount, tmp0))
+        ctx.emit(  and_  (tmp0, imm(mask(ctx.word_size), ctx.word_size * 2), output))
+    ctx.emit(label + '_set')
+
+
 def x86_cmova(ctx, i):
     """mov if above"""
     conditional_mov(ctx, i, conditional.A)
@@ -185,6 +253,12 @@ def x86_cmps(ctx, i, size):
     if i.mnemonic.startswith('rep'):
         rep_prologue(ctx, i)
 
+        # repne has to stop at the first pair of elements that are equal,
+        # which a comparison of bytes can't find.
+        if ctx.bulk_memory and not i.mnemonic.startswith('repne'):
+            bulk_cmps(ctx, i, size)
+            return
+
     # read the values
     ctx.emit(  str_  (src, address1))
     ctx.emit(  ldm_  (address1, value1))
@@ -213,6 +287,59 @@ def x86_cmps(ctx, i, size):
         rep_epilogue(ctx, i)
 
 
+def bulk_cmps(ctx, i, size):
+    src = ctx.source
+    dst = ctx.destination
+
+    count, length, lows = bulk_range(ctx, size, [src, dst])
+
+    addresses = ctx.tmp(ctx.word_size * 2)
+    high = ctx.tmp(ctx.word_size * 2)
+    pair = ctx.tmp(ctx.word_size * 2)
+    equal = ctx.tmp(ctx.word_size * 2)
+
+    ctx.emit(  str_  (lows[0], addresses))
+    ctx.emit(  lshl_ (lows[1], imm(ctx.word_size, ctx.word_size * 2), high))
+    ctx.emit(  or_   (addresses, high, pair))
+    ctx.emit(  mcmp_ (pair, length, equal))
+
+    # the comparison stops after the element containing the first byte
+    # that differs, or at the end of the blocks.
+    elements = ctx.tmp(ctx.word_size * 2)
+    next_element = ctx.tmp(ctx.word_size * 2)
+    done = ctx.tmp(8)
+    compared = ctx.tmp(ctx.word_size * 2)
+    processed = ctx.tmp(ctx.word_size * 2)
+    last = ctx.tmp(ctx.word_size * 2)
+
+    ctx.emit(  div_  (equal, imm(size // 8, ctx.word_size * 2), elements))
+    ctx.emit(  add_  (elements, imm(1, ctx.word_size * 2), next_element))
+    ctx.emit(  equ_  (equal, count, done))
+    ctx.emit(  sub_  (next_element, done, compared))
+    ctx.emit(  mul_  (compared, imm(size // 8, ctx.word_size * 2), processed))
+    ctx.emit(  sub_  (processed, imm(size // 8, ctx.word_size * 2), last))
+
+    # the flags are set by the last pair of elements compared
+    address1 = ctx.tmp(ctx.word_size)
+    address2 = ctx.tmp(ctx.word_size)
+    value1 = ctx.tmp(size)
+    value2 = ctx.tmp(size)
+    result = ctx.tmp(size * 2)
+
+    bulk_step(ctx, [src, dst], last, [address1, address2], 'bulk_last')
+
+    ctx.emit(  ldm_  (address1, value1))
+    ctx.emit(  ldm_  (address2, value2))
+    ctx.emit(  sub_  (value1, value2, result))
+    arithmetic._sub_set_flags(ctx, value1, value2, result)
+
+    bulk_step(ctx, [src, dst], processed, [src, dst], 'bulk_step')
+
+    counter = ctx.tmp(ctx.word_size * 2)
+    ctx.emit(  sub_  (ctx.counter, compared, counter))
+    ctx.emit(  and_  (counter, imm(mask(ctx.word_size), ctx.word_size * 2), ctx.counter))
+
+
 def x86_cmpsb(ctx, i):
     x86_cmps(ctx, i, 8)
 
@@ -334,10 +461,44 @@ def x86_movs(ctx, i, size):
       return x86_mov(ctx, i)
 
     value = ctx.tmp(size)
+    bulk = (ctx.bulk_memory and i.mnemonic.startswith('rep') and
+            not i.mnemonic.startswith('repne'))
 
     if i.mnemonic.startswith('rep'):
         rep_prologue(ctx, i)
 
+    if bulk:
+        if size != 8:
+            # copying a byte at a time only gives the same result as
+            # copying an element at a time if no element overlaps its own
+            # destination, so leave those copies to the loop below.
+            distance = ctx.tmp(ctx.word_size * 2)
+            tmp0 = ctx.tmp(ctx.word_size * 2)
+            tmp1 = ctx.tmp(ctx.word_size)
+            tmp2 = ctx.tmp(ctx.word_size)
+            overlap = ctx.tmp(8)
+
+            ctx.emit(  sub_  (ctx.destination, ctx.source, distance))
+            ctx.emit(  add_  (distance, imm(size // 8, ctx.word_size * 2), tmp0))
+            ctx.emit(  and_  (tmp0, imm(mask(ctx.word_size), ctx.word_size * 2), tmp1))
+            ctx.emit(  lshr_ (tmp1, imm((size // 4).bit_length() - 1, 8), tmp2))
+            ctx.emit(  bisz_ (tmp2, overlap))
+            ctx.emit(  jcc_  (overlap, 'element'))
+
+        registers = [ctx.source, ctx.destination]
+        count, length, lows = bulk_range(ctx, size, registers)
+
+        ctx.emit(  mcpy_ (lows[0], length, lows[1]))
+
+        bulk_step(ctx, registers, count, registers, 'bulk_step')
+        ctx.emit(  str_  (imm(0, ctx.word_size), ctx.counter))
+
+        if size == 8:
+            return
+
+        ctx.emit(  jcc_  (imm(1, 8), 'bulk_done'))
+        ctx.emit('element')
+
     ctx.emit(  ldm_  (ctx.source, value))
     ctx.emit(  stm_  (value, ctx.destination))
     ctx.emit(  jcc_  (r('df', 8), 'decrement'))
@@ -354,6 +515,10 @@ def x86_movs(ctx, i, size):
     if i.mnemonic.startswith('rep'):
         rep_epilogue(ctx, i)
 
+    if bulk:
+        ctx.emit('bulk_done')
+        ctx.emit(  nop_  ())
+
 
 def x86_movsb(ctx, i):
     x86_movs(ctx, i, 8)
@@ -486,6 +651,15 @@ def x86_stos(ctx, i, size):
     if i.mnemonic.startswith('rep'):
         rep_prologue(ctx, i)
 
+        if ctx.bulk_memory and not i.mnemonic.startswith('repne'):
+            count, length, lows = bulk_range(ctx, size, [a])
+
+            ctx.emit(  mset_ (value, length, lows[0]))
+
+            bulk_step(ctx, [a], count, [a], 'bulk_step')
+            ctx.emit(  str_  (imm(0, ctx.word_size), ctx.counter))
+            return
+
     ctx.emit(  str_  (a, address))
     ctx.emit(  stm_  (value, address))
     ctx.emit(  jcc_  (r('df', 8), 'decrement'))
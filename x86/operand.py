@@ -25,6 +25,7 @@ operands.
 
 import capstone
 
+import reil.definitions as reil
 from reil.error import *
 from reil.shorthand import *
 from reil.utilities import *
@@ -114,7 +115,160 @@ def _reg_id_from_name(name):
     return register_lookup[name]
 
 
+class RegisterAlias(object):
+    """Description of where an x86 register lives inside one of the native
+    registers of the translation context.
+
+    Attributes:
+        register (reil.RegisterOperand): The native register.
+        offset (int): The bit offset of this register within it.
+        size (int): The size in bits of this register.
+        clear (bool): Writes replace the whole native register.
+        zero_extend (bool): Writes are never sign-extended.
+    """
+
+    __slots__ = ('register', 'offset', 'size', 'clear', 'zero_extend')
+
+
+    def __init__(self, register, offset, size, clear=False, zero_extend=False):
+        self.register = register
+        self.offset = offset
+        self.size = size
+        self.clear = clear
+        self.zero_extend = zero_extend
+
+
+_legacy_registers = [
+    # context attribute, low byte, high byte, low word, low dword
+    ('accumulator', capstone.x86.X86_REG_AL, capstone.x86.X86_REG_AH,
+        capstone.x86.X86_REG_AX, capstone.x86.X86_REG_EAX),
+    ('base', capstone.x86.X86_REG_BL, capstone.x86.X86_REG_BH,
+        capstone.x86.X86_REG_BX, capstone.x86.X86_REG_EBX),
+    ('counter', capstone.x86.X86_REG_CL, capstone.x86.X86_REG_CH,
+        capstone.x86.X86_REG_CX, capstone.x86.X86_REG_ECX),
+    ('data', capstone.x86.X86_REG_DL, capstone.x86.X86_REG_DH,
+        capstone.x86.X86_REG_DX, capstone.x86.X86_REG_EDX),
+    ('source', capstone.x86.X86_REG_SIL, None,
+        capstone.x86.X86_REG_SI, capstone.x86.X86_REG_ESI),
+    ('destination', capstone.x86.X86_REG_DIL, None,
+        capstone.x86.X86_REG_DI, capstone.x86.X86_REG_EDI),
+    ('frame_ptr', capstone.x86.X86_REG_BPL, None,
+        capstone.x86.X86_REG_BP, capstone.x86.X86_REG_EBP),
+    ('stack_ptr', capstone.x86.X86_REG_SPL, None,
+        capstone.x86.X86_REG_SP, capstone.x86.X86_REG_ESP),
+]
+
+_extended_registers = [
+    # native register, low byte, low word, low dword
+    (capstone.x86.X86_REG_R8, capstone.x86.X86_REG_R8B,
+        capstone.x86.X86_REG_R8W, capstone.x86.X86_REG_R8D),
+    (capstone.x86.X86_REG_R9, capstone.x86.X86_REG_R9B,
+        capstone.x86.X86_REG_R9W, capstone.x86.X86_REG_R9D),
+    (capstone.x86.X86_REG_R10, capstone.x86.X86_REG_R10B,
+        capstone.x86.X86_REG_R10W, capstone.x86.X86_REG_R10D),
+    (capstone.x86.X86_REG_R11, capstone.x86.X86_REG_R11B,
+        capstone.x86.X86_REG_R11W, capstone.x86.X86_REG_R11D),
+    (capstone.x86.X86_REG_R12, capstone.x86.X86_REG_R12B,
+        capstone.x86.X86_REG_R12W, capstone.x86.X86_REG_R12D),
+    (capstone.x86.X86_REG_R13, capstone.x86.X86_REG_R13B,
+        capstone.x86.X86_REG_R13W, capstone.x86.X86_REG_R13D),
+    (capstone.x86.X86_REG_R14, capstone.x86.X86_REG_R14B,
+        capstone.x86.X86_REG_R14W, capstone.x86.X86_REG_R14D),
+    (capstone.x86.X86_REG_R15, capstone.x86.X86_REG_R15B,
+        capstone.x86.X86_REG_R15W, capstone.x86.X86_REG_R15D),
+]
+
+_sse_registers = {
+    capstone.x86.X86_REG_XMM0,
+    capstone.x86.X86_REG_XMM1,
+    capstone.x86.X86_REG_XMM2,
+    capstone.x86.X86_REG_XMM3,
+    capstone.x86.X86_REG_XMM4,
+    capstone.x86.X86_REG_XMM5,
+    capstone.x86.X86_REG_XMM6,
+    capstone.x86.X86_REG_XMM7,
+    capstone.x86.X86_REG_XMM8,
+    capstone.x86.X86_REG_XMM9,
+    capstone.x86.X86_REG_XMM10,
+    capstone.x86.X86_REG_XMM11,
+    capstone.x86.X86_REG_XMM12,
+    capstone.x86.X86_REG_XMM13,
+    capstone.x86.X86_REG_XMM14,
+    capstone.x86.X86_REG_XMM15,
+}
+
+
+def register_model(ctx):
+    """Build the map from capstone register id to RegisterAlias for the
+    registers of a translation context. This is done once, when the
+    context is created, so that operand access is a single lookup.
+    """
+
+    model = dict()
+
+    def add(reg_id, register, offset, size, clear=False):
+        # the full native registers take priority over their aliases
+        if reg_id is not None and reg_id not in model:
+            model[reg_id] = RegisterAlias(register, offset, size, clear)
+
+    for reg_id, register in ctx.registers.items():
+        if reg_id in _sse_registers:
+            # NB: We make the default behaviour for setting a smaller value to
+            # an SSE register to zero-extend. Code in SSE implementation will
+            # have to expect this... But it makes implementation of the memory
+            # moves for SSE simpler
+            model[reg_id] = RegisterAlias(register, 0, register.size, True, True)
+        else:
+            model[reg_id] = RegisterAlias(register, 0, register.size)
+
+    # NB: the 32-bit low parts are only reached in x86_64 mode.
+
+    # CF: Intel Manual... 32-bit operands generate a 32-bit result,
+    # zero-extended to a 64-bit result in the destination register.
+
+    for name, low_byte, high_byte, low_word, low_dword in _legacy_registers:
+        register = getattr(ctx, name)
+        add(low_byte, register, 0, 8)
+        add(high_byte, register, 8, 8)
+        add(low_word, register, 0, 16)
+        add(low_dword, register, 0, 32, True)
+
+    for reg_id, low_byte, low_word, low_dword in _extended_registers:
+        if reg_id in ctx.registers:
+            register = ctx.registers[reg_id]
+            add(low_byte, register, 0, 8)
+            add(low_word, register, 0, 16)
+            add(low_dword, register, 0, 32, True)
+
+    return model
+
+
 def _memory_address(ctx, i, opnd):
+    # read-modify-write instructions fetch and then store the same memory
+    # operand, so remember the addresses already computed for this native
+    # instruction rather than emitting the computation a second time.
+    key = (opnd.mem.segment, opnd.mem.base, opnd.mem.index, opnd.mem.scale,
+           opnd.mem.disp)
+
+    address = ctx.memory_addresses.get(key)
+    if address is not None:
+        return address
+
+    address = _compute_memory_address(ctx, i, opnd)
+
+    # an address is only reused if it was computed before any control flow
+    # in the IL, so that it has been computed on every path to the reuse. A
+    # bare register costs nothing to recompute, and may have been written
+    # since.
+    if (not ctx.labels and not ctx.fixups and
+        (isinstance(address, reil.TemporaryOperand) or
+         isinstance(address, reil.ImmediateOperand))):
+        ctx.memory_addresses[key] = address
+
+    return address
+
+
+def _compute_memory_address(ctx, i, opnd):
 
     address = None
 
@@ -207,203 +361,44 @@ def _get_register(ctx, i, reg):
     if reg == capstone.x86.X86_REG_RIP and not ctx.use_rip:
         qword_reg = ctx.tmp(64)
 
-        ctx.emit(  str_  (imm(i.address + i.size, 64), qword_reg))
+        ctx.emit(  str_  (ctx.address_imm(i, i.address + i.size, 64), qword_reg))
 
         return qword_reg
 
-    # full native registers
-    if reg in ctx.registers:
-        return ctx.registers[reg]
-
-    # 8-bit low parts
-    low_bytes = {
-        capstone.x86.X86_REG_AL:ctx.accumulator,
-        capstone.x86.X86_REG_BL:ctx.base,
-        capstone.x86.X86_REG_CL:ctx.counter,
-        capstone.x86.X86_REG_DL:ctx.data,
-        capstone.x86.X86_REG_SIL:ctx.source,
-        capstone.x86.X86_REG_DIL:ctx.destination,
-        capstone.x86.X86_REG_BPL:ctx.frame_ptr,
-        capstone.x86.X86_REG_SPL:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8B:r('r8', 64),
-        capstone.x86.X86_REG_R9B:r('r9', 64),
-        capstone.x86.X86_REG_R10B:r('r10', 64),
-        capstone.x86.X86_REG_R11B:r('r11', 64),
-        capstone.x86.X86_REG_R12B:r('r12', 64),
-        capstone.x86.X86_REG_R13B:r('r13', 64),
-        capstone.x86.X86_REG_R14B:r('r14', 64),
-        capstone.x86.X86_REG_R15B:r('r15', 64),
-    }
-
-    if reg in low_bytes:
-        byte_reg = ctx.tmp(8)
-
-        ctx.emit(  str_  (low_bytes[reg], byte_reg))
+    alias = ctx.register_model.get(reg)
+    if alias is None:
+        raise TranslationError('Unsupported register!')
 
-        return byte_reg
+    full_reg = alias.register
 
-    # 8-bit high parts
-    high_bytes = {
-        capstone.x86.X86_REG_AH:ctx.accumulator,
-        capstone.x86.X86_REG_BH:ctx.base,
-        capstone.x86.X86_REG_CH:ctx.counter,
-        capstone.x86.X86_REG_DH:ctx.data
-    }
+    # full native registers
+    if alias.size == full_reg.size:
+        return full_reg
 
-    if reg in high_bytes:
-
-        full_reg = high_bytes[reg]
-        word_reg = ctx.tmp(16)
-        byte_reg = ctx.tmp(8)
-
-        ctx.emit(  str_  (full_reg, word_reg))
-        ctx.emit(  lshr_ (word_reg, imm(8, 8), byte_reg))
-
-        return byte_reg
-
-    # 16-byte low parts
-    low_words = {
-        capstone.x86.X86_REG_AX:ctx.accumulator,
-        capstone.x86.X86_REG_BX:ctx.base,
-        capstone.x86.X86_REG_CX:ctx.counter,
-        capstone.x86.X86_REG_DX:ctx.data,
-        capstone.x86.X86_REG_SI:ctx.source,
-        capstone.x86.X86_REG_DI:ctx.destination,
-        capstone.x86.X86_REG_BP:ctx.frame_ptr,
-        capstone.x86.X86_REG_SP:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8W:r('r8', 64),
-        capstone.x86.X86_REG_R9W:r('r9', 64),
-        capstone.x86.X86_REG_R10W:r('r10', 64),
-        capstone.x86.X86_REG_R11W:r('r11', 64),
-        capstone.x86.X86_REG_R12W:r('r12', 64),
-        capstone.x86.X86_REG_R13W:r('r13', 64),
-        capstone.x86.X86_REG_R14W:r('r14', 64),
-        capstone.x86.X86_REG_R15W:r('r15', 64),
-    }
+    # high parts
+    if alias.offset != 0:
+        wide_reg = ctx.tmp(alias.offset + alias.size)
+        part_reg = ctx.tmp(alias.size)
 
-    if reg in low_words:
-        word_reg = ctx.tmp(16)
-
-        ctx.emit(  str_  (low_words[reg], word_reg))
-
-        return word_reg
-
-    # 32-byte low parts
-    low_dwords = {
-        capstone.x86.X86_REG_EAX:ctx.accumulator,
-        capstone.x86.X86_REG_EBX:ctx.base,
-        capstone.x86.X86_REG_ECX:ctx.counter,
-        capstone.x86.X86_REG_EDX:ctx.data,
-        capstone.x86.X86_REG_ESI:ctx.source,
-        capstone.x86.X86_REG_EDI:ctx.destination,
-        capstone.x86.X86_REG_EBP:ctx.frame_ptr,
-        capstone.x86.X86_REG_ESP:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8D:r('r8', 64),
-        capstone.x86.X86_REG_R9D:r('r9', 64),
-        capstone.x86.X86_REG_R10D:r('r10', 64),
-        capstone.x86.X86_REG_R11D:r('r11', 64),
-        capstone.x86.X86_REG_R12D:r('r12', 64),
-        capstone.x86.X86_REG_R13D:r('r13', 64),
-        capstone.x86.X86_REG_R14D:r('r14', 64),
-        capstone.x86.X86_REG_R15D:r('r15', 64),
-    }
+        ctx.emit(  str_  (full_reg, wide_reg))
+        ctx.emit(  lshr_ (wide_reg, imm(alias.offset, 8), part_reg))
 
-    if reg in low_dwords:
-        dword_reg = ctx.tmp(32)
+        return part_reg
 
-        ctx.emit(  str_  (low_dwords[reg], dword_reg))
+    # low parts
+    part_reg = ctx.tmp(alias.size)
 
-        return dword_reg
+    ctx.emit(  str_  (full_reg, part_reg))
 
-    raise TranslationError('Unsupported register!')
+    return part_reg
 
 
 def _get_register_size(ctx, i, reg_id):
-    # full native registers
-    if reg_id in ctx.registers:
-        return ctx.registers[reg_id].size
-
-    # 8-bit low parts
-    low_bytes = [
-        capstone.x86.X86_REG_AL,
-        capstone.x86.X86_REG_BL,
-        capstone.x86.X86_REG_CL,
-        capstone.x86.X86_REG_DL,
-        capstone.x86.X86_REG_SIL,
-        capstone.x86.X86_REG_DIL,
-        capstone.x86.X86_REG_BPL,
-        capstone.x86.X86_REG_SPL,
-        capstone.x86.X86_REG_R8B,
-        capstone.x86.X86_REG_R9B,
-        capstone.x86.X86_REG_R10B,
-        capstone.x86.X86_REG_R11B,
-        capstone.x86.X86_REG_R12B,
-        capstone.x86.X86_REG_R13B,
-        capstone.x86.X86_REG_R14B,
-        capstone.x86.X86_REG_R15B,
-    ]
-
-    if reg_id in low_bytes:
-        return 8
-
-    # 8-bit high parts
-    high_bytes = [
-        capstone.x86.X86_REG_AH,
-        capstone.x86.X86_REG_BH,
-        capstone.x86.X86_REG_CH,
-        capstone.x86.X86_REG_DH
-    ]
-
-    if reg_id in high_bytes:
-        return 8
-
-    # 16-byte low parts
-    low_words = {
-        capstone.x86.X86_REG_AX,
-        capstone.x86.X86_REG_BX,
-        capstone.x86.X86_REG_CX,
-        capstone.x86.X86_REG_DX,
-        capstone.x86.X86_REG_SI,
-        capstone.x86.X86_REG_DI,
-        capstone.x86.X86_REG_BP,
-        capstone.x86.X86_REG_SP,
-        capstone.x86.X86_REG_R8W,
-        capstone.x86.X86_REG_R9W,
-        capstone.x86.X86_REG_R10W,
-        capstone.x86.X86_REG_R11W,
-        capstone.x86.X86_REG_R12W,
-        capstone.x86.X86_REG_R13W,
-        capstone.x86.X86_REG_R14W,
-        capstone.x86.X86_REG_R15W,
-    }
-
-    if reg_id in low_words:
-        return 16
-
-    # 32-byte low parts
-    low_dwords = {
-        capstone.x86.X86_REG_EAX,
-        capstone.x86.X86_REG_EBX,
-        capstone.x86.X86_REG_ECX,
-        capstone.x86.X86_REG_EDX,
-        capstone.x86.X86_REG_ESI,
-        capstone.x86.X86_REG_EDI,
-        capstone.x86.X86_REG_EBP,
-        capstone.x86.X86_REG_ESP,
-        capstone.x86.X86_REG_R8D,
-        capstone.x86.X86_REG_R9D,
-        capstone.x86.X86_REG_R10D,
-        capstone.x86.X86_REG_R11D,
-        capstone.x86.X86_REG_R12D,
-        capstone.x86.X86_REG_R13D,
-        capstone.x86.X86_REG_R14D,
-        capstone.x86.X86_REG_R15D,
-    }
-
-    if reg_id in low_dwords:
-        return 32
+    alias = ctx.register_model.get(reg_id)
+    if alias is not None:
+        return alias.size
 
-    if reg_id is capstone.x86.X86_REG_RIP:
+    if reg_id == capstone.x86.X86_REG_RIP:
         return 64
 
     raise TranslationError('Unsupported register!')
@@ -505,89 +500,6 @@ def is_memory(ctx, i, index):
 
 def _set_register(ctx, i, reg_id, value, clear=False, sign_extend=False):
 
-    low_bytes = {
-        capstone.x86.X86_REG_AL:ctx.accumulator,
-        capstone.x86.X86_REG_BL:ctx.base,
-        capstone.x86.X86_REG_CL:ctx.counter,
-        capstone.x86.X86_REG_DL:ctx.data,
-        capstone.x86.X86_REG_SIL:ctx.source,
-        capstone.x86.X86_REG_DIL:ctx.destination,
-        capstone.x86.X86_REG_BPL:ctx.frame_ptr,
-        capstone.x86.X86_REG_SPL:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8B:r('r8', 64),
-        capstone.x86.X86_REG_R9B:r('r9', 64),
-        capstone.x86.X86_REG_R10B:r('r10', 64),
-        capstone.x86.X86_REG_R11B:r('r11', 64),
-        capstone.x86.X86_REG_R12B:r('r12', 64),
-        capstone.x86.X86_REG_R13B:r('r13', 64),
-        capstone.x86.X86_REG_R14B:r('r14', 64),
-        capstone.x86.X86_REG_R15B:r('r15', 64),
-    }
-
-    high_bytes = {
-        capstone.x86.X86_REG_AH:ctx.accumulator,
-        capstone.x86.X86_REG_BH:ctx.base,
-        capstone.x86.X86_REG_CH:ctx.counter,
-        capstone.x86.X86_REG_DH:ctx.data
-    }
-
-    low_words = {
-        capstone.x86.X86_REG_AX:ctx.accumulator,
-        capstone.x86.X86_REG_BX:ctx.base,
-        capstone.x86.X86_REG_CX:ctx.counter,
-        capstone.x86.X86_REG_DX:ctx.data,
-        capstone.x86.X86_REG_SI:ctx.source,
-        capstone.x86.X86_REG_DI:ctx.destination,
-        capstone.x86.X86_REG_BP:ctx.frame_ptr,
-        capstone.x86.X86_REG_SP:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8W:r('r8', 64),
-        capstone.x86.X86_REG_R9W:r('r9', 64),
-        capstone.x86.X86_REG_R10W:r('r10', 64),
-        capstone.x86.X86_REG_R11W:r('r11', 64),
-        capstone.x86.X86_REG_R12W:r('r12', 64),
-        capstone.x86.X86_REG_R13W:r('r13', 64),
-        capstone.x86.X86_REG_R14W:r('r14', 64),
-        capstone.x86.X86_REG_R15W:r('r15', 64),
-    }
-
-    low_dwords = {
-        capstone.x86.X86_REG_EAX:ctx.accumulator,
-        capstone.x86.X86_REG_EBX:ctx.base,
-        capstone.x86.X86_REG_ECX:ctx.counter,
-        capstone.x86.X86_REG_EDX:ctx.data,
-        capstone.x86.X86_REG_ESI:ctx.source,
-        capstone.x86.X86_REG_EDI:ctx.destination,
-        capstone.x86.X86_REG_EBP:ctx.frame_ptr,
-        capstone.x86.X86_REG_ESP:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8D:r('r8', 64),
-        capstone.x86.X86_REG_R9D:r('r9', 64),
-        capstone.x86.X86_REG_R10D:r('r10', 64),
-        capstone.x86.X86_REG_R11D:r('r11', 64),
-        capstone.x86.X86_REG_R12D:r('r12', 64),
-        capstone.x86.X86_REG_R13D:r('r13', 64),
-        capstone.x86.X86_REG_R14D:r('r14', 64),
-        capstone.x86.X86_REG_R15D:r('r15', 64),
-    }
-
-    sse_regs = {
-        capstone.x86.X86_REG_XMM0:r('xmm0', 128),
-        capstone.x86.X86_REG_XMM1:r('xmm1', 128),
-        capstone.x86.X86_REG_XMM2:r('xmm2', 128),
-        capstone.x86.X86_REG_XMM3:r('xmm3', 128),
-        capstone.x86.X86_REG_XMM4:r('xmm4', 128),
-        capstone.x86.X86_REG_XMM5:r('xmm5', 128),
-        capstone.x86.X86_REG_XMM6:r('xmm6', 128),
-        capstone.x86.X86_REG_XMM7:r('xmm7', 128),
-        capstone.x86.X86_REG_XMM8:r('xmm8', 128),
-        capstone.x86.X86_REG_XMM9:r('xmm9', 128),
-        capstone.x86.X86_REG_XMM10:r('xmm10', 128),
-        capstone.x86.X86_REG_XMM11:r('xmm11', 128),
-        capstone.x86.X86_REG_XMM12:r('xmm12', 128),
-        capstone.x86.X86_REG_XMM13:r('xmm13', 128),
-        capstone.x86.X86_REG_XMM14:r('xmm14', 128),
-        capstone.x86.X86_REG_XMM15:r('xmm15', 128),
-    }
-
     def truncate_value(value, size):
 
         if value.size > size:
@@ -597,59 +509,36 @@ def _set_register(ctx, i, reg_id, value, clear=False, sign_extend=False):
 
         return value
 
-    # full native registers
-    if reg_id in ctx.registers:
-        reg = ctx.registers[reg_id]
-        set_mask = imm(mask(reg.size), reg.size)
+    alias = ctx.register_model.get(reg_id)
+    if alias is None:
+        raise TranslationError('Unsupported register!')
 
-    # 8-bit low parts
-    elif reg_id in low_bytes:
-        reg = low_bytes[reg_id]
-        set_mask = imm(~mask(8), reg.size)
-        value = truncate_value(value, 8)
+    reg = alias.register
 
-    # 8-bit high parts
-    elif reg_id in high_bytes:
-        reg = high_bytes[reg_id]
-        value = truncate_value(value, 8)
+    if alias.offset != 0:
+        # high parts
+        value = truncate_value(value, alias.size)
+        part_mask = mask(alias.size) << alias.offset
 
         prev_value = value
         value = ctx.tmp(reg.size)
         tmp0 = ctx.tmp(reg.size)
         tmp1 = ctx.tmp(reg.size)
 
-        ctx.emit(  and_  (reg, imm(mask(reg.size) ^ 0xff00, reg.size), tmp0))
+        ctx.emit(  and_  (reg, imm(mask(reg.size) ^ part_mask, reg.size), tmp0))
         ctx.emit(  str_  (prev_value, tmp1))
-        ctx.emit(  lshl_ (tmp1, imm(8, 8), tmp1))
+        ctx.emit(  lshl_ (tmp1, imm(alias.offset, 8), tmp1))
         ctx.emit(  or_   (tmp0, tmp1, value))
 
-    # 16-bit low parts
-    elif reg_id in low_words:
-        reg = low_words[reg_id]
-        set_mask = imm(~mask(16), reg.size)
-        value = truncate_value(value, 16)
-
-    # 32-bit low parts
-    elif reg_id in low_dwords:
-        # NB: this code is only reached in x86_64 mode.
+    elif alias.size != reg.size:
+        # low parts
+        value = truncate_value(value, alias.size)
 
-        # CF: Intel Manual... 32-bit operands generate a 32-bit result,
-        # zero-extended to a 64-bit result in the destination register.
-
-        reg = low_dwords[reg_id]
-        set_mask = imm(mask(64), reg.size)
-        value = truncate_value(value, 32)
+    if alias.clear:
         clear = True
 
-    else:
-        raise TranslationError('Unsupported register!')
-
-    if reg_id in sse_regs:
-      # NB: We make the default behaviour for setting a smaller value to an SSE
-      # register to zero-extend. Code in SSE implementation will have to expect
-      # this... But it makes implementation of the memory moves for SSE simpler
-      sign_extend = False
-      clear = True
+    if alias.zero_extend:
+        sign_extend = False
 
     if value.size > reg.size:
         value = truncate_value(value, reg.size)
@@ -664,6 +553,11 @@ def _set_register(ctx, i, reg_id, value, clear=False, sign_extend=False):
             else:
                 ctx.emit(  str_  (prev_value, value))
         else:
+            if alias.size == reg.size:
+                set_mask = imm(mask(reg.size), reg.size)
+            else:
+                set_mask = imm(~mask(alias.size), reg.size)
+
             tmp0 = ctx.tmp(reg.size)
 
             ctx.emit(  str_  (prev_value, value))
@@ -711,97 +605,14 @@ def set_register(ctx, i, name, value, clear=False, sign_extend=False):
 
 def _undef_register(ctx, i, reg_id, clear=False, sign_extend=False):
 
-    low_bytes = {
-        capstone.x86.X86_REG_AL:ctx.accumulator,
-        capstone.x86.X86_REG_BL:ctx.base,
-        capstone.x86.X86_REG_CL:ctx.counter,
-        capstone.x86.X86_REG_DL:ctx.data,
-        capstone.x86.X86_REG_SIL:ctx.source,
-        capstone.x86.X86_REG_DIL:ctx.destination,
-        capstone.x86.X86_REG_BPL:ctx.frame_ptr,
-        capstone.x86.X86_REG_SPL:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8B:r('r8', 64),
-        capstone.x86.X86_REG_R9B:r('r9', 64),
-        capstone.x86.X86_REG_R10B:r('r10', 64),
-        capstone.x86.X86_REG_R11B:r('r11', 64),
-        capstone.x86.X86_REG_R12B:r('r12', 64),
-        capstone.x86.X86_REG_R13B:r('r13', 64),
-        capstone.x86.X86_REG_R14B:r('r14', 64),
-        capstone.x86.X86_REG_R15B:r('r15', 64),
-    }
-
-    high_bytes = {
-        capstone.x86.X86_REG_AH:ctx.accumulator,
-        capstone.x86.X86_REG_BH:ctx.base,
-        capstone.x86.X86_REG_CH:ctx.counter,
-        capstone.x86.X86_REG_DH:ctx.data
-    }
-
-    low_words = {
-        capstone.x86.X86_REG_AX:ctx.accumulator,
-        capstone.x86.X86_REG_BX:ctx.base,
-        capstone.x86.X86_REG_CX:ctx.counter,
-        capstone.x86.X86_REG_DX:ctx.data,
-        capstone.x86.X86_REG_SI:ctx.source,
-        capstone.x86.X86_REG_DI:ctx.destination,
-        capstone.x86.X86_REG_BP:ctx.frame_ptr,
-        capstone.x86.X86_REG_SP:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8W:r('r8', 64),
-        capstone.x86.X86_REG_R9W:r('r9', 64),
-        capstone.x86.X86_REG_R10W:r('r10', 64),
-        capstone.x86.X86_REG_R11W:r('r11', 64),
-        capstone.x86.X86_REG_R12W:r('r12', 64),
-        capstone.x86.X86_REG_R13W:r('r13', 64),
-        capstone.x86.X86_REG_R14W:r('r14', 64),
-        capstone.x86.X86_REG_R15W:r('r15', 64),
-    }
-
-    low_dwords = {
-        capstone.x86.X86_REG_EAX:ctx.accumulator,
-        capstone.x86.X86_REG_EBX:ctx.base,
-        capstone.x86.X86_REG_ECX:ctx.counter,
-        capstone.x86.X86_REG_EDX:ctx.data,
-        capstone.x86.X86_REG_ESI:ctx.source,
-        capstone.x86.X86_REG_EDI:ctx.destination,
-        capstone.x86.X86_REG_EBP:ctx.frame_ptr,
-        capstone.x86.X86_REG_ESP:ctx.stack_ptr,
-        capstone.x86.X86_REG_R8D:r('r8', 64),
-        capstone.x86.X86_REG_R9D:r('r9', 64),
-        capstone.x86.X86_REG_R10D:r('r10', 64),
-        capstone.x86.X86_REG_R11D:r('r11', 64),
-        capstone.x86.X86_REG_R12D:r('r12', 64),
-        capstone.x86.X86_REG_R13D:r('r13', 64),
-        capstone.x86.X86_REG_R14D:r('r14', 64),
-        capstone.x86.X86_REG_R15D:r('r15', 64),
-    }
-
     # TODO: this is not really correct, since we always explode the whole
     # register, but we don't really have support for anything else...
 
-    # full native registers
-    if reg_id in ctx.registers:
-        reg = ctx.registers[reg_id]
-
-    # 8-bit low parts
-    elif reg_id in low_bytes:
-        reg = low_bytes[reg_id]
-
-    # 8-bit high parts
-    elif reg_id in high_bytes:
-        reg = high_bytes[reg_id]
-
-    # 16-bit low parts
-    elif reg_id in low_words:
-        reg = low_words[reg_id]
-
-    # 32-bit low parts
-    elif reg_id in low_dwords:
-        reg = low_dwords[reg_id]
-
-    else:
+    alias = ctx.register_model.get(reg_id)
+    if alias is None:
         raise TranslationError('Unsupported register!')
 
-    ctx.emit(  undef_  (reg))
+    ctx.emit(  undef_  (alias.register))
 
 
 def undefine(ctx, i, index):
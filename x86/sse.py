@@ -73,10 +73,27 @@ def pack(ctx, parts):
     return value
 
 
+def vectors(ctx, a, b):
+    # the lane-wise opcodes take both vectors in one operand
+    size = a.size * 2
+
+    tmp0 = ctx.tmp(size)
+    tmp1 = ctx.tmp(size)
+    tmp2 = ctx.tmp(size)
+    value = ctx.tmp(size)
+
+    ctx.emit(  str_  (a, tmp0))
+    ctx.emit(  str_  (b, tmp1))
+    ctx.emit(  lshl_ (tmp1, imm(a.size, 8), tmp2))
+    ctx.emit(  or_   (tmp0, tmp2, value))
+
+    return value
+
+
 def vex_opnds(i):
     if len(i.operands) == 3:
         # additional VEX operand
-        return 2, 1, 0
+        return 1, 2, 0
     else:
         return 0, 1, 0
 
@@ -124,6 +141,61 @@ def x86_movq(ctx, i):
     operand.set(ctx, i, 0, value, clear=True, sign_extend=False)
 
 
+def _x86_padd(ctx, i, part_size):
+    if i.operands[0].size != 16:
+        # only the xmm forms are translated; the mmx and ymm forms are
+        # left as unknown instructions.
+        ctx.emit(  unkn_())
+        return
+
+    a_id, b_id, dst_id = vex_opnds(i)
+
+    a = operand.get(ctx, i, a_id)
+    b = operand.get(ctx, i, b_id)
+
+    if ctx.vector_lanes and a.size == b.size:
+        value = ctx.tmp(a.size)
+        ctx.emit(  vadd_ (vectors(ctx, a, b), imm(part_size, 8), value))
+
+        operand.set(ctx, i, dst_id, value)
+        return
+
+    size = min(a.size, b.size)
+    part_count = size // part_size
+
+    a_parts = unpack(ctx, a, part_size)[:part_count]
+    if a == b:
+        b_parts = a_parts
+    else:
+        b_parts = unpack(ctx, b, part_size)[:part_count]
+
+    parts = []
+    for j in range(0, part_count):
+        tmp = ctx.tmp(part_size)
+        ctx.emit(  add_  (a_parts[j], b_parts[j], tmp))
+        parts.append(tmp)
+
+    value = pack(ctx, parts)
+
+    operand.set(ctx, i, dst_id, value)
+
+
+def x86_paddb(ctx, i):
+    _x86_padd(ctx, i, 8)
+
+
+def x86_paddw(ctx, i):
+    _x86_padd(ctx, i, 16)
+
+
+def x86_paddd(ctx, i):
+    _x86_padd(ctx, i, 32)
+
+
+def x86_paddq(ctx, i):
+    _x86_padd(ctx, i, 64)
+
+
 def x86_palignr(ctx, i):
     a = operand.get(ctx, i, 0)
     b = operand.get(ctx, i, 1)
@@ -187,6 +259,13 @@ def x86_pcmpeq(ctx, i, size):
     a = operand.get(ctx, i, a_id)
     b = operand.get(ctx, i, b_id)
 
+    if ctx.vector_lanes and a.size == b.size:
+        value = ctx.tmp(a.size)
+        ctx.emit(  vequ_ (vectors(ctx, a, b), imm(size, 8), value))
+
+        operand.set(ctx, i, dst_id, value)
+        return
+
     a_parts = unpack(ctx, a, size)
     b_parts = unpack(ctx, b, size)
 
@@ -226,55 +305,36 @@ def x86_pcmpgt(ctx, i, size):
     a = operand.get(ctx, i, a_id)
     b = operand.get(ctx, i, b_id)
 
+    if ctx.vector_lanes and a.size == b.size:
+        value = ctx.tmp(a.size)
+        ctx.emit(  vsgt_ (vectors(ctx, a, b), imm(size, 8), value))
+
+        operand.set(ctx, i, dst_id, value)
+        return
+
     a_parts = unpack(ctx, a, size)
     b_parts = unpack(ctx, b, size)
 
-    a_sign = ctx.tmp(size)
-    a_abs = ctx.tmp(size)
-    b_sign = ctx.tmp(size)
-    b_abs = ctx.tmp(size)
-
+    a_biased = ctx.tmp(size)
+    b_biased = ctx.tmp(size)
     tmp0 = ctx.tmp(size * 2)
-    a_abs_lt_b_abs = ctx.tmp(8)
-    tmp1 = ctx.tmp(size)
-    a_b_same_sign = ctx.tmp(8)
-    a_neg = ctx.tmp(8)
-    b_nonneg = ctx.tmp(8)
-    a_neg_and_b_nonneg = ctx.tmp(8)
     cond = ctx.tmp(8)
 
     dst_parts = []
     for a_part, b_part in zip(a_parts, b_parts):
         dst_part = ctx.tmp(size)
 
-        ctx.emit(  and_  (a_part, imm(sign_bit(size), size), a_sign))
-        ctx.emit(  and_  (a_part, imm(~sign_bit(size), size), a_abs))
-        ctx.emit(  and_  (b_part, imm(sign_bit(size), size), b_sign))
-        ctx.emit(  and_  (b_part, imm(~sign_bit(size), size), b_abs))
-
-        # a < b <==> (|a| < |b| and sign(a) == sign(b)) or (a < 0 and b >= 0)
-
-        # |a| < |b|
-        ctx.emit(  sub_  (a_abs, b_abs, tmp0))
+        # flipping the sign bits maps the signed values onto unsigned
+        # values in the same order, and then a > b <==> b - a < 0
+        ctx.emit(  xor_  (a_part, imm(sign_bit(size), size), a_biased))
+        ctx.emit(  xor_  (b_part, imm(sign_bit(size), size), b_biased))
+        ctx.emit(  sub_  (b_biased, a_biased, tmp0))
         ctx.emit(  and_  (tmp0, imm(sign_bit(size * 2), size * 2), tmp0))
-        ctx.emit(  bisz_ (tmp0, a_abs_lt_b_abs))
-
-        # sign(a) == sign(b)
-        ctx.emit(  xor_  (a_sign, b_sign, tmp1))
-        ctx.emit(  bisz_ (tmp1, a_b_same_sign))
-
-        # a < 0 and b >= 0
-        ctx.emit(  bisnz_(a_sign, a_neg))
-        ctx.emit(  bisz_ (b_sign, b_nonneg))
-        ctx.emit(  and_  (a_neg, b_nonneg, a_neg_and_b_nonneg))
-
-        ctx.emit(  and_  (a_abs_lt_b_abs, a_b_same_sign, cond))
-        ctx.emit(  or_   (cond, a_neg_and_b_nonneg, cond))
+        ctx.emit(  bisnz_(tmp0, cond))
         ctx.emit(  mul_  (cond, imm(mask(size), size), dst_part))
 
         dst_parts.append(dst_part)
 
-
     value = pack(ctx, dst_parts)
 
     operand.set(ctx, i, dst_id, value)
@@ -302,6 +362,13 @@ def x86_pmaxu(ctx, i, size):
     a = operand.get(ctx, i, a_id)
     b = operand.get(ctx, i, b_id)
 
+    if ctx.vector_lanes and a.size == b.size:
+        value = ctx.tmp(a.size)
+        ctx.emit(  vmaxu_(vectors(ctx, a, b), imm(size, 8), value))
+
+        operand.set(ctx, i, dst_id, value)
+        return
+
     a_parts = unpack(ctx, a, size)
     b_parts = unpack(ctx, b, size)
 
@@ -350,6 +417,13 @@ def x86_pminu(ctx, i, size):
     a = operand.get(ctx, i, a_id)
     b = operand.get(ctx, i, b_id)
 
+    if ctx.vector_lanes and a.size == b.size:
+        value = ctx.tmp(a.size)
+        ctx.emit(  vminu_(vectors(ctx, a, b), imm(size, 8), value))
+
+        operand.set(ctx, i, dst_id, value)
+        return
+
     a_parts = unpack(ctx, a, size)
     b_parts = unpack(ctx, b, size)
 
@@ -436,6 +510,24 @@ def x86_pshufd(ctx, i):
     src = operand.get(ctx, i, 1)
     order = operand.get(ctx, i, 2)
 
+    if ctx.vector_lanes:
+        # the order is always an immediate, so the vector of lane indices
+        # is known here.
+        indices = 0
+        for j in range(0, 4):
+            indices |= ((order.value >> (j * 2)) & 0b11) << (j * 32)
+
+        tmp0 = ctx.tmp(256)
+        tmp1 = ctx.tmp(256)
+        value = ctx.tmp(128)
+
+        ctx.emit(  str_  (src, tmp0))
+        ctx.emit(  or_   (tmp0, imm(indices << 128, 256), tmp1))
+        ctx.emit(  vshuf_(tmp1, imm(32, 8), value))
+
+        operand.set(ctx, i, 0, value)
+        return
+
     value = imm(0, 128)
 
     for j in range(0, 4):
@@ -497,6 +589,13 @@ def _x86_psub(ctx, i, part_size):
     a = operand.get(ctx, i, a_id)
     b = operand.get(ctx, i, b_id)
 
+    if ctx.vector_lanes and a.size == b.size:
+        value = ctx.tmp(a.size)
+        ctx.emit(  vsub_ (vectors(ctx, a, b), imm(part_size, 8), value))
+
+        operand.set(ctx, i, dst_id, value)
+        return
+
     size = min(a.size, b.size)
     part_count = size // part_size
 
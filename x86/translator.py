@@ -25,8 +25,10 @@ the streaming-simd extensions
 
 
 import capstone
+import functools
 
 import reil.native as native
+from reil.context import TranslationContext
 from reil.shorthand import *
 from reil.utilities import *
 
@@ -34,9 +36,11 @@ import reil.x86.ascii as ascii
 import reil.x86.arithmetic as arithmetic
 import reil.x86.bitwise as bitwise
 import reil.x86.control_flow as control_flow
+import reil.x86.flags as flags
 import reil.x86.logic as logic
 import reil.x86.memory as memory
 import reil.x86.misc as misc
+import reil.x86.operand as operand
 import reil.x86.sse as sse
 import reil.x86.unsupported as unsupported
 
@@ -354,6 +358,10 @@ opcode_handlers = {
     capstone.x86.X86_INS_NOP:               misc.x86_nop,
     capstone.x86.X86_INS_NOT:               logic.x86_not,
     capstone.x86.X86_INS_OR:                logic.x86_or,
+    capstone.x86.X86_INS_PADDB:             sse.x86_paddb,
+    capstone.x86.X86_INS_PADDD:             sse.x86_paddd,
+    capstone.x86.X86_INS_PADDQ:             sse.x86_paddq,
+    capstone.x86.X86_INS_PADDW:             sse.x86_paddw,
     capstone.x86.X86_INS_PALIGNR:           sse.x86_palignr,
     capstone.x86.X86_INS_PAND:              sse.x86_pand,
     capstone.x86.X86_INS_PANDN:             sse.x86_pandn,
@@ -373,6 +381,7 @@ opcode_handlers = {
     capstone.x86.X86_INS_PMINUW:            sse.x86_pminuw,
     capstone.x86.X86_INS_PMOVMSKB:          sse.x86_pmovmskb,
     capstone.x86.X86_INS_POP:               memory.x86_pop,
+    capstone.x86.X86_INS_POPCNT:            bitwise.x86_popcnt,
     capstone.x86.X86_INS_POR:               sse.x86_por,
     capstone.x86.X86_INS_PSHUFD:            sse.x86_pshufd,
     capstone.x86.X86_INS_PSLLDQ:            sse.x86_pslldq,
@@ -426,6 +435,11 @@ opcode_handlers = {
     capstone.x86.X86_INS_SYSENTER:          misc.x86_sysenter,
     capstone.x86.X86_INS_SYSCALL:           misc.x86_syscall,
     capstone.x86.X86_INS_TEST:              logic.x86_test,
+    capstone.x86.X86_INS_TZCNT:             bitwise.x86_tzcnt,
+    capstone.x86.X86_INS_VPADDB:            sse.x86_paddb,
+    capstone.x86.X86_INS_VPADDD:            sse.x86_paddd,
+    capstone.x86.X86_INS_VPADDQ:            sse.x86_paddq,
+    capstone.x86.X86_INS_VPADDW:            sse.x86_paddw,
     capstone.x86.X86_INS_VPAND:             sse.x86_pand,
     capstone.x86.X86_INS_VPANDN:            sse.x86_pandn,
     capstone.x86.X86_INS_VPCMPEQB:          sse.x86_pcmpeqb,
@@ -459,55 +473,6 @@ opcode_handlers = {
 }
 
 
-def process_labels(ris):
-    labels = dict()
-    i = 0
-
-    # we are modifying ris, hence the nasty loop
-    while i < len(ris):
-        ri = ris[i]
-        if isinstance(ri, str):
-            # this is a label, remove
-            labels[ri] = i
-            ris = ris[:i] + ris[i+1:]
-        else:
-            i += 1
-
-    for ri in ris:
-        if isinstance(ri.output, str):
-            # this is a label, replace with offset
-            ri.output = off(labels[ri.output])
-
-    return ris
-
-
-class TranslationContext(object):
-
-    def __init__(self):
-        self.temporary_index = 0
-        self.reil_instructions = []
-
-
-    def tmp(self, size):
-        output = t(self.temporary_index, size)
-        self.temporary_index += 1
-        return output
-
-
-    def emit(self, instruction):
-        self.reil_instructions.append(instruction)
-
-
-    def finalise(self):
-        ris = self.reil_instructions
-
-        # reset the context ready for the next instruction
-        self.temporary_index = 0
-        self.reil_instructions = []
-
-        return process_labels(ris)
-
-
 def print_instruction(i):
     print('{:x}: {}  {}'.format(i.address, i.mnemonic, i.op_str))
 
@@ -521,11 +486,24 @@ def unknown_opcode(ctx, i):
 
 
 def _translate(ctx, i):
-    if i.id in opcode_handlers:
+    handler = opcode_handlers.get(i.id, unknown_opcode)
+
+    try:
         #print_instruction(i)
-        opcode_handlers[i.id](ctx, i)
-    else:
-        unknown_opcode(ctx, i)
+        ctx.flags_handled = False
+        handler(ctx, i)
+
+        if (ctx.lazy_flags and not ctx.flags_handled and
+                flags.uses_flags(ctx.reil_instructions)):
+            # this handler uses the flag registers directly, so they have
+            # to be brought up to date first.
+            ctx.reset()
+            flags.materialise(ctx)
+            handler(ctx, i)
+    except Exception:
+        # contexts are reused, so never leave a partial translation behind
+        ctx.reset()
+        raise
 
     return ctx.finalise()
 
@@ -542,11 +520,29 @@ def ends_basic_block(i):
     return False
 
 
+_block_ends = dict()
+
+
+def _branch_target(i):
+    # ret has an immediate operand, but it isn't a target
+    if (i.id != capstone.x86.X86_INS_RET and len(i.operands) == 1 and
+        i.operands[0].type == capstone.x86.X86_OP_IMM):
+        return i.operands[0].imm
+
+    return None
+
+
 class X86TranslationContext(TranslationContext):
 
     def __init__(self):
         TranslationContext.__init__(self)
 
+        self.lazy_flags = False
+        self.flags_handled = False
+        self.bulk_memory = False
+        self.bit_counting = False
+        self.vector_lanes = False
+
         self.registers = {
             capstone.x86.X86_REG_EAX:   r('eax', 32),
             capstone.x86.X86_REG_EBX:   r('ebx', 32),
@@ -585,6 +581,8 @@ class X86TranslationContext(TranslationContext):
         self.stack_ptr = self.registers[capstone.x86.X86_REG_ESP]
         self.disassembler = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
         self.disassembler.detail = True
+        self.scanner = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+        self.register_model = operand.register_model(self)
 
 
 class X86_64TranslationContext(TranslationContext):
@@ -592,6 +590,12 @@ class X86_64TranslationContext(TranslationContext):
     def __init__(self, use_rip=False):
         TranslationContext.__init__(self)
 
+        self.lazy_flags = False
+        self.flags_handled = False
+        self.bulk_memory = False
+        self.bit_counting = False
+        self.vector_lanes = False
+
         self.registers = {
             capstone.x86.X86_REG_RAX:   r('rax', 64),
             capstone.x86.X86_REG_RBX:   r('rbx', 64),
@@ -643,39 +647,79 @@ class X86_64TranslationContext(TranslationContext):
         self.stack_ptr = self.registers[capstone.x86.X86_REG_RSP]
         self.disassembler = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_64)
         self.disassembler.detail = True
+        self.scanner = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_64)
         self.use_rip = use_rip
+        self.register_model = operand.register_model(self)
 
-_x86_ctx = X86TranslationContext()
-_x86_64_ctx = X86_64TranslationContext()
-_x86_64_rip_ctx = X86_64TranslationContext(use_rip=True)
-
-
-def translate(code_bytes, base_address, x86_64=False, use_rip=False, threadsafe=True):
-    done = False
 
+def _new_context(x86_64, use_rip):
     if x86_64:
-        if threadsafe:
-            ctx = X86_64TranslationContext(use_rip)
-        else:
-            if use_rip:
-                ctx = _x86_64_ctx
-            else:
-                ctx = _x86_64_rip_ctx
+        return X86_64TranslationContext(use_rip)
     else:
-        if threadsafe:
-            ctx = X86TranslationContext()
-        else:
-            ctx = _x86_ctx
+        return X86TranslationContext()
+
+
+_contexts = ContextPool(_new_context)
+
+
+def _context(x86_64, use_rip):
+    # use_rip only affects the 64-bit context
+    return _contexts.get(bool(x86_64), bool(x86_64 and use_rip))
+
+
+def _mode_context(x86_64, use_rip, relocatable, modes):
+    ctx = _context(x86_64, use_rip)
+    ctx.relocatable = relocatable
+    (ctx.lazy_flags, ctx.bulk_memory, ctx.bit_counting,
+     ctx.vector_lanes) = modes
+
+    return ctx
+
+
+def translate(code_bytes, base_address, x86_64=False, use_rip=False,
+              threadsafe=True, cache=None, relocatable=False, lazy=False,
+              lazy_flags=False, bulk_memory=False, bit_counting=False,
+              vector_lanes=False):
+    # threadsafe is accepted for compatibility only; contexts now come from
+    # a per-thread pool, so translation is always safe across threads.
+    modes = (lazy_flags, bulk_memory, bit_counting, vector_lanes)
+
+    if cache is not None:
+        # the cache holds translated IL, so there is nothing to defer
+        if lazy:
+            raise ValueError('A cache can\'t be used with lazy=True')
+
+        return cache.translate(
+            'x86', (x86_64, use_rip) + modes, code_bytes, base_address,
+            lambda relocatable: translate(
+                code_bytes, base_address, x86_64, use_rip,
+                relocatable=relocatable, lazy_flags=lazy_flags,
+                bulk_memory=bulk_memory, bit_counting=bit_counting,
+                vector_lanes=vector_lanes))
+
+    context = functools.partial(
+        _mode_context, x86_64, use_rip, relocatable, modes)
+
+    if lazy:
+        return translate_block_lazy(
+            context, _translate, ends_basic_block, code_bytes, base_address)
+
+    return translate_block(
+        context, _translate, ends_basic_block, code_bytes, base_address)
+
 
-    for i in ctx.disassembler.disasm(code_bytes, base_address):
+def translate_range(code_bytes, base_address, x86_64=False, use_rip=False,
+                    relocatable=False, lazy_flags=False, bulk_memory=False,
+                    bit_counting=False, vector_lanes=False):
+    context = functools.partial(
+        _mode_context, x86_64, use_rip, relocatable,
+        (lazy_flags, bulk_memory, bit_counting, vector_lanes))
 
-        if done:
-            raise StopIteration()
+    return translate_blocks(
+        context, _translate, ends_basic_block, code_bytes, base_address, 1)
 
-        mnemonic = '{} {}'.format(i.mnemonic, i.op_str)
-        yield native.Instruction(
-            i.address, mnemonic, _translate(ctx, i),
-            ends_basic_block(i), i.size)
 
-        if ends_basic_block(i):
-            done = True
+def scan(code_bytes, base_address, x86_64=False):
+    return scan_range(
+        _context(x86_64, False), code_bytes, base_address, 1,
+        ends_basic_block, _branch_target, _block_ends)
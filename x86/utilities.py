@@ -25,9 +25,23 @@ from reil.shorthand import *
 from reil.utilities import *
 
 
-def set_pf(ctx, result):
+def set_pf(ctx, result, output=None):
     """compute parity flag (parity of lsb)"""
 
+    if output is None:
+        output = r('pf', 8)
+
+    if ctx.bit_counting:
+        tmp0 = ctx.tmp(8)
+        tmp1 = ctx.tmp(8)
+        tmp2 = ctx.tmp(8)
+
+        ctx.emit(  str_  (result, tmp0))
+        ctx.emit(  popcnt_(tmp0, tmp1))
+        ctx.emit(  and_  (tmp1, imm(1, 8), tmp2))
+        ctx.emit(  bisz_ (tmp2, output))
+        return
+
     tmp0 = ctx.tmp(8)
     tmp1 = ctx.tmp(8)
     tmp2 = ctx.tmp(16)
@@ -39,7 +53,7 @@ def set_pf(ctx, result):
     ctx.emit(  xor_  (tmp0, tmp1, tmp0))
     ctx.emit(  and_  (tmp0, imm(0xf, 8), tmp1))
     ctx.emit(  lshr_ (imm(0x9669, 16), tmp1, tmp2))
-    ctx.emit(  and_  (tmp2, imm(1, 8), r('pf', 8)))
+    ctx.emit(  and_  (tmp2, imm(1, 8), output))
 
 
 def set_sf(ctx, result):